@@ -3,7 +3,6 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import customtkinter as ctk
-import pandas as pd
 import os
 import threading
 import numpy as np
@@ -16,6 +15,10 @@ from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from tabulate import tabulate
 
 from simulation.controller import SimulationController
+from simulation.result_writer import ChunkedCSVWriter
+from gui.blitting import BlitOverlay
+from gui.level_of_detail import LevelOfDetail
+from gui.table_view import TimeRowIndex, VirtualTable, int_column, float_column, blank_column
 from utils.data_manager import find_available_models, load_microgrid_data
 
 modern_luxury_style = {
@@ -44,6 +47,9 @@ class App(ctk.CTk):
         self.iter_hover_point = None; self.iter_annotation = None
         self.ls_hover_line_power = None; self.ls_hover_line_freq = None
         self.ls_hover_point = None; self.ls_annotation = None
+        self.plot_times = None; self.plot_time_num = None; self.hover_values = {}
+        self.canvas_events = {}; self.overlays = {}; self.lod_views = {}
+        self.row_index = None; self.shed_row_index = None
         
         self.create_widgets()
 
@@ -82,6 +88,7 @@ class App(ctk.CTk):
         self.create_loadshedding_view()
         self.create_percentage_shedding_view()
         self.create_adaptive_shedding_view()
+        self.virtual_tables = {str(tree): VirtualTable(tree) for tree in (self.cont_tree, self.iter_tree, self.ls_tree, self.ps_tree, self.as_tree)}
         self.show_content_view("placeholder")
 
     def create_continuous_view(self):
@@ -242,17 +249,19 @@ class App(ctk.CTk):
         if results is None:
             self.show_content_view("log"); self.log_textbox.delete("1.0", "end"); self.log_textbox.insert("1.0", output)
             return
-        if use_case_name == "Initial Load Flow":
+        if use_case_name in ("Initial Load Flow", "Continuous Load Flow (Multi-Pattern)", "MPG Disconnection Sweep",
+                             "MPG Disconnection (Monte Carlo)", "Shedding Scheme Comparison",
+                             "Shedding Parametric Sweep"):
             self.show_content_view("log"); self.log_textbox.delete("1.0", "end"); self.log_textbox.insert("1.0", output)
         elif use_case_name == "Continuous Load Flow":
             self.show_content_view("continuous"); self.setup_interactive_plot(results)
-        elif use_case_name == "MPG Disconnection (Iterative Dispatch)":
+        elif use_case_name in ("MPG Disconnection (Iterative Dispatch)", "MPG Disconnection (Quasi-Dynamic)"):
             self.show_content_view("iterative_dispatch"); self.setup_iterative_dispatch_view(results)
         elif use_case_name == "MPG Disconnection (Primary Freq.)":
             self.show_content_view("iterative_dispatch"); self.setup_primary_freq_view(results)
         elif use_case_name == "Load Shedding (Normal)":
             self.show_content_view("load_shedding"); self.setup_loadshedding_plot(results)
-        elif use_case_name == "Load Shedding (Percentage)": 
+        elif use_case_name in ("Load Shedding (Percentage)", "Load Shedding (Optimal LP)"):
             self.show_content_view("percentage_shedding"); self.setup_percentage_shedding_plot(results)
         elif use_case_name == "Load Shedding (Adaptive)": 
             self.show_content_view("adaptive_shedding"); self.setup_adaptive_shedding_plot(results)
@@ -261,7 +270,7 @@ class App(ctk.CTk):
 
     def setup_interactive_plot(self, results):
         self.interactive_plot_data = results; self.plotted_lines.clear(); self.summary_labels.clear(); self.hover_points.clear()
-        self.cont_ax.clear()
+        self.cont_ax.clear(); cont_lod, = self.level_of_detail('cont', self.cont_ax)
         for widget in self.summary_panel.winfo_children():
             if not isinstance(widget, ctk.CTkLabel) or "CURRENT DATA" not in widget.cget("text"): widget.destroy()
         summary_data = results['summary_data']; pivoted_gens = summary_data['pivoted_gens_mw']
@@ -271,7 +280,7 @@ class App(ctk.CTk):
         for name, checkbox_info in self.summary_labels.items():
             line_data = summary_data['total_load_mw'] if name == "Total Load" else pivoted_gens[int(name.split(' ')[1])]
             linestyle = '-' if name == "Total Load" else '--'; linewidth = 2.5 if name == "Total Load" else 1.5
-            line, = self.cont_ax.plot(line_data.index, line_data, label=name, color=checkbox_info['color'], linestyle=linestyle, linewidth=linewidth, zorder=10)
+            line = cont_lod.plot(line_data.index, line_data, label=name, color=checkbox_info['color'], linestyle=linestyle, linewidth=linewidth, zorder=10)
             self.plotted_lines[name] = line; checkbox_info['checkbox'].configure(command=lambda n=name: self.toggle_line_visibility(n))
         self.cont_ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
         self.cont_ax.set_title('Power Generation & Load Profile (24h)'); self.cont_ax.set_xlabel('Time'); self.cont_ax.set_ylabel('Power (MW)')
@@ -281,7 +290,12 @@ class App(ctk.CTk):
             point, = self.cont_ax.plot([], [], 'o', markersize=8, markeredgecolor='white', zorder=30, visible=False)
             self.hover_points.append(point)
         self.annotation = self.cont_ax.annotate("", xy=(0,0), xytext=(20,-40), textcoords="offset points", bbox=dict(boxstyle="round,pad=0.5", fc="#282C34", ec="#61AFEF", lw=1, alpha=0.9), arrowprops=dict(arrowstyle="->", connectionstyle="arc3,rad=-0.1", color='white'), visible=False, zorder=40, fontname="Arial", fontsize=10)
-        self.cont_canvas.mpl_connect('motion_notify_event', self.on_hover); self.cont_canvas.mpl_connect('button_press_event', self.on_click)
+        self.set_plot_time_axis(summary_data)
+        self.index_result_tables(results)
+        self.hover_values = {name: self.series_at_plot_times(summary_data['total_load_mw'] if name == "Total Load" else pivoted_gens[int(name.split(' ')[1])])
+                             for name in self.plotted_lines}
+        self.bind_canvas('cont', self.cont_canvas, {'motion_notify_event': self.on_hover, 'button_press_event': self.on_click},
+                         [self.hover_line, *self.hover_points, self.annotation])
         last_time = summary_data['total_load_mw'].index[-1]
         self.selected_line = self.cont_ax.axvline(last_time, color='#98C379', linestyle='-', linewidth=2, zorder=25)
         self.update_summary_panel(last_time); self.update_interactive_table(last_time, self.cont_tree, self.cont_table_title_var)
@@ -291,20 +305,21 @@ class App(ctk.CTk):
         # ฟังก์ชันนี้เหมือนกับ setup_percentage_shedding_plot เกือบ 100%
         self.interactive_plot_data = results
         self.as_ax_power.clear(); self.as_ax_freq.clear()
+        power_lod, freq_lod = self.level_of_detail('as', self.as_ax_power, self.as_ax_freq)
         if hasattr(self, 'pinned_annotation_as') and self.pinned_annotation_as:
             self.pinned_annotation_as.set_visible(False)
         
         summary = results['summary_data']
-        self.as_ax_power.plot(summary['total_load_mw_before'].index, summary['total_load_mw_before'], label='Total Load (Before)', color="#61AFEF", linestyle=':')
-        self.as_ax_power.plot(summary['total_load_mw_after'].index, summary['total_load_mw_after'], label='Total Load (After)', color="#C678DD")
+        power_lod.plot(summary['total_load_mw_before'].index, summary['total_load_mw_before'], label='Total Load (Before)', color="#61AFEF", linestyle=':')
+        power_lod.plot(summary['total_load_mw_after'].index, summary['total_load_mw_after'], label='Total Load (After)', color="#C678DD")
         self.as_ax_power.axvline(summary['disconnection_time'], color='red', linestyle='--', label='MPG Disconnect')
         pmax_start_time = summary['disconnection_time']; pmax_end_time = summary['total_load_mw_before'].index[-1]
         self.as_ax_power.plot([pmax_start_time, pmax_end_time], [summary['microgrid_pmax'], summary['microgrid_pmax']], color='orange', linestyle=':', label='Microgrid Pmax')
         self.as_ax_power.set_title("Power Profile (Adaptive Load Shedding)"); self.as_ax_power.set_ylabel("Power (MW)"); self.as_ax_power.legend()
         self.as_ax_power.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
         
-        self.as_ax_freq.plot(summary['frequency_series_before'].index, summary['frequency_series_before']['freq_before'], label='Frequency (Before)', color="#E06C75", linestyle=':')
-        self.as_ax_freq.plot(summary['frequency_series_after'].index, summary['frequency_series_after']['freq_after'], label='Frequency (After)', color="cyan")
+        freq_lod.plot(summary['frequency_series_before'].index, summary['frequency_series_before']['freq_before'], label='Frequency (Before)', color="#E06C75", linestyle=':')
+        freq_lod.plot(summary['frequency_series_after'].index, summary['frequency_series_after']['freq_after'], label='Frequency (After)', color="cyan")
         self.as_ax_freq.axhline(summary['freq_threshold'], color='yellow', linestyle='--', label=f'Threshold ({summary["freq_threshold"]:.2f} Hz)')
         self.as_ax_freq.set_title("Frequency Profile (Adaptive Load Shedding)"); self.as_ax_freq.set_ylabel("Frequency (Hz)"); self.as_ax_freq.set_xlabel("Time"); self.as_ax_freq.legend()
         self.as_ax_freq.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
@@ -316,7 +331,9 @@ class App(ctk.CTk):
         self.as_selected_line_freq = self.as_ax_freq.axvline(last_time, color='#98C379', linestyle='-', linewidth=2, zorder=25)
         
         self.pinned_annotation_as = None
-        self.as_canvas.mpl_connect('button_press_event', self.on_click_adaptive_shedding)
+        self.set_plot_time_axis(summary)
+        self.index_result_tables(results)
+        self.bind_canvas('as', self.as_canvas, {'button_press_event': self.on_click_adaptive_shedding})
         
         self.update_adaptive_shedding_table(last_time) # <--- เรียกฟังก์ชันใหม่
         self.as_canvas.draw()
@@ -324,15 +341,16 @@ class App(ctk.CTk):
     def setup_iterative_dispatch_view(self, results):
         self.interactive_plot_data = results
         self.iter_ax_power.clear(); self.iter_ax_freq.clear()
+        power_lod, freq_lod = self.level_of_detail('iter', self.iter_ax_power, self.iter_ax_freq)
         if hasattr(self, 'pinned_annotation') and self.pinned_annotation: self.pinned_annotation.set_visible(False)
         summary = results['summary_data']
-        self.iter_ax_power.plot(summary['total_load_mw'].index, summary['total_load_mw'], label='Total Load', color="#61AFEF")
+        power_lod.plot(summary['total_load_mw'].index, summary['total_load_mw'], label='Total Load', color="#61AFEF")
         self.iter_ax_power.axvline(summary['disconnection_time'], color='red', linestyle='--', label='MPG Disconnect')
         pmax_start_time = summary['disconnection_time']; pmax_end_time = summary['total_load_mw'].index[-1]
         self.iter_ax_power.plot([pmax_start_time, pmax_end_time], [summary['microgrid_pmax'], summary['microgrid_pmax']], color='orange', linestyle=':', label='Microgrid Pmax')
         self.iter_ax_power.set_title("Power Profile"); self.iter_ax_power.set_ylabel("Power (MW)"); self.iter_ax_power.legend()
         self.iter_ax_power.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
-        self.iter_ax_freq.plot(summary['frequency_series'].index, summary['frequency_series']['frequency'], label='System Frequency', color='cyan')
+        freq_lod.plot(summary['frequency_series'].index, summary['frequency_series']['frequency'], label='System Frequency', color='cyan')
         self.iter_ax_freq.set_title("Frequency Profile"); self.iter_ax_freq.set_ylabel("Frequency (Hz)"); self.iter_ax_freq.set_xlabel("Time")
         self.iter_ax_freq.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
         self.iter_fig.tight_layout()
@@ -347,13 +365,17 @@ class App(ctk.CTk):
                                             bbox=dict(boxstyle="round,pad=0.5", fc="#282C34", ec="#61AFEF", lw=1, alpha=0.9),
                                             arrowprops=dict(arrowstyle="->", connectionstyle="arc3,rad=0.1", color='white'),
                                             visible=False, zorder=40, fontname="Arial", fontsize=10)
-        self.iter_canvas.mpl_connect('motion_notify_event', self.on_hover_iterative)
-        self.iter_canvas.mpl_connect('button_press_event', self.on_click_iterative)
+        self.set_plot_time_axis(summary)
+        self.index_result_tables(results)
+        self.hover_values = {'load': self.series_at_plot_times(summary['total_load_mw'])}
+        self.bind_canvas('iter', self.iter_canvas, {'motion_notify_event': self.on_hover_iterative, 'button_press_event': self.on_click_iterative},
+                         [self.iter_hover_line_power, self.iter_hover_line_freq, self.iter_hover_point, self.iter_annotation])
         self.update_explanation_panel(last_time)
         self.update_interactive_table(last_time, self.iter_tree, self.iter_table_title_var)
         self.iter_canvas.draw()
 
     def setup_primary_freq_view(self, results):
+        self.bind_canvas('iter', self.iter_canvas, {})
         self.iter_ax_power.clear(); self.iter_ax_freq.clear()
         self.iter_ax_power.set_visible(False); self.iter_ax_freq.set_visible(True)
         self.iter_fig.subplots_adjust(top=0.9, bottom=0.15, left=0.1, right=0.95)
@@ -363,23 +385,29 @@ class App(ctk.CTk):
         self.iter_ax_freq.axhline(y=50.0, color='white', linestyle='--', label='Nominal Freq. (50 Hz)')
         nadir = freq_df['frequency_hz'].min()
         self.iter_ax_freq.axhline(y=nadir, color='yellow', linestyle=':', label=f'Nadir ({nadir:.3f} Hz)')
+        if results.get("ufls_events") is not None:
+            shed_events = results["ufls_events"][results["ufls_events"]['event'] == 'ufls_shed']
+            for k, (_, event) in enumerate(shed_events.iterrows()):
+                self.iter_ax_freq.axvline(x=event['time_s'], color='#C678DD', linestyle='--', alpha=0.7,
+                                          label='UFLS Shed' if k == 0 else None)
         self.iter_ax_freq.legend()
         self.iter_canvas.draw()
 
     def setup_loadshedding_plot(self, results):
         self.interactive_plot_data = results
         self.ls_ax_power.clear(); self.ls_ax_freq.clear()
+        power_lod, freq_lod = self.level_of_detail('ls', self.ls_ax_power, self.ls_ax_freq)
         if hasattr(self, 'pinned_annotation_ls') and self.pinned_annotation_ls: self.pinned_annotation_ls.set_visible(False)
         summary = results['summary_data']
-        self.ls_ax_power.plot(summary['total_load_mw_before'].index, summary['total_load_mw_before'], label='Total Load (Before)', color="#61AFEF", linestyle=':')
-        self.ls_ax_power.plot(summary['total_load_mw_after'].index, summary['total_load_mw_after'], label='Total Load (After)', color="#C678DD")
+        power_lod.plot(summary['total_load_mw_before'].index, summary['total_load_mw_before'], label='Total Load (Before)', color="#61AFEF", linestyle=':')
+        power_lod.plot(summary['total_load_mw_after'].index, summary['total_load_mw_after'], label='Total Load (After)', color="#C678DD")
         self.ls_ax_power.axvline(summary['disconnection_time'], color='red', linestyle='--', label='MPG Disconnect')
         pmax_start_time = summary['disconnection_time']; pmax_end_time = summary['total_load_mw_before'].index[-1]
         self.ls_ax_power.plot([pmax_start_time, pmax_end_time], [summary['microgrid_pmax'], summary['microgrid_pmax']], color='orange', linestyle=':', label='Microgrid Pmax')
         self.ls_ax_power.set_title("Power Profile (with Load Shedding)"); self.ls_ax_power.set_ylabel("Power (MW)"); self.ls_ax_power.legend()
         self.ls_ax_power.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
-        self.ls_ax_freq.plot(summary['frequency_series_before'].index, summary['frequency_series_before']['freq_before'], label='Frequency (Before)', color="#E06C75", linestyle=':')
-        self.ls_ax_freq.plot(summary['frequency_series_after'].index, summary['frequency_series_after']['freq_after'], label='Frequency (After)', color="cyan")
+        freq_lod.plot(summary['frequency_series_before'].index, summary['frequency_series_before']['freq_before'], label='Frequency (Before)', color="#E06C75", linestyle=':')
+        freq_lod.plot(summary['frequency_series_after'].index, summary['frequency_series_after']['freq_after'], label='Frequency (After)', color="cyan")
         self.ls_ax_freq.axhline(summary['freq_threshold'], color='yellow', linestyle='--', label=f'Threshold ({summary["freq_threshold"]:.2f} Hz)')
         self.ls_ax_freq.set_title("Frequency Profile (with Load Shedding)"); self.ls_ax_freq.set_ylabel("Frequency (Hz)"); self.ls_ax_freq.set_xlabel("Time"); self.ls_ax_freq.legend()
         self.ls_ax_freq.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
@@ -398,30 +426,34 @@ class App(ctk.CTk):
                                             visible=False, zorder=40, fontname="Arial", fontsize=10)
         self.pinned_annotation_ls = None
         
-        self.ls_canvas.mpl_connect('motion_notify_event', self.on_hover_loadshedding)
-        self.ls_canvas.mpl_connect('button_press_event', self.on_click_loadshedding)
+        self.set_plot_time_axis(summary)
+        self.index_result_tables(results)
+        self.hover_values = {'load_after': self.series_at_plot_times(summary['total_load_mw_after'])}
+        self.bind_canvas('ls', self.ls_canvas, {'motion_notify_event': self.on_hover_loadshedding, 'button_press_event': self.on_click_loadshedding},
+                         [self.ls_hover_line_power, self.ls_hover_line_freq, self.ls_hover_point, self.ls_annotation])
         self.update_loadshedding_table(last_time)
         self.ls_canvas.draw()
 
     def setup_percentage_shedding_plot(self, results):
         self.interactive_plot_data = results
         self.ps_ax_power.clear(); self.ps_ax_freq.clear()
+        power_lod, freq_lod = self.level_of_detail('ps', self.ps_ax_power, self.ps_ax_freq)
         if hasattr(self, 'pinned_annotation_ps') and self.pinned_annotation_ps:
             self.pinned_annotation_ps.set_visible(False)
         
         summary = results['summary_data']
         
         # กราฟเหมือนกับ Load Shedding (Normal)
-        self.ps_ax_power.plot(summary['total_load_mw_before'].index, summary['total_load_mw_before'], label='Total Load (Before)', color="#61AFEF", linestyle=':')
-        self.ps_ax_power.plot(summary['total_load_mw_after'].index, summary['total_load_mw_after'], label='Total Load (After)', color="#C678DD")
+        power_lod.plot(summary['total_load_mw_before'].index, summary['total_load_mw_before'], label='Total Load (Before)', color="#61AFEF", linestyle=':')
+        power_lod.plot(summary['total_load_mw_after'].index, summary['total_load_mw_after'], label='Total Load (After)', color="#C678DD")
         self.ps_ax_power.axvline(summary['disconnection_time'], color='red', linestyle='--', label='MPG Disconnect')
         pmax_start_time = summary['disconnection_time']; pmax_end_time = summary['total_load_mw_before'].index[-1]
         self.ps_ax_power.plot([pmax_start_time, pmax_end_time], [summary['microgrid_pmax'], summary['microgrid_pmax']], color='orange', linestyle=':', label='Microgrid Pmax')
         self.ps_ax_power.set_title("Power Profile (Percentage Load Shedding)"); self.ps_ax_power.set_ylabel("Power (MW)"); self.ps_ax_power.legend()
         self.ps_ax_power.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
         
-        self.ps_ax_freq.plot(summary['frequency_series_before'].index, summary['frequency_series_before']['freq_before'], label='Frequency (Before)', color="#E06C75", linestyle=':')
-        self.ps_ax_freq.plot(summary['frequency_series_after'].index, summary['frequency_series_after']['freq_after'], label='Frequency (After)', color="cyan")
+        freq_lod.plot(summary['frequency_series_before'].index, summary['frequency_series_before']['freq_before'], label='Frequency (Before)', color="#E06C75", linestyle=':')
+        freq_lod.plot(summary['frequency_series_after'].index, summary['frequency_series_after']['freq_after'], label='Frequency (After)', color="cyan")
         self.ps_ax_freq.axhline(summary['freq_threshold'], color='yellow', linestyle='--', label=f'Threshold ({summary["freq_threshold"]:.2f} Hz)')
         self.ps_ax_freq.set_title("Frequency Profile (Percentage Load Shedding)"); self.ps_ax_freq.set_ylabel("Frequency (Hz)"); self.ps_ax_freq.set_xlabel("Time"); self.ps_ax_freq.legend()
         self.ps_ax_freq.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
@@ -434,7 +466,9 @@ class App(ctk.CTk):
         
         # (Hover and Pinned logic is identical to load_shedding_normal_case)
         self.pinned_annotation_ps = None
-        self.ps_canvas.mpl_connect('button_press_event', self.on_click_percentage_shedding)
+        self.set_plot_time_axis(summary)
+        self.index_result_tables(results)
+        self.bind_canvas('ps', self.ps_canvas, {'button_press_event': self.on_click_percentage_shedding})
         
         self.update_percentage_shedding_table(last_time) # <--- เรียกฟังก์ชันใหม่
         self.ps_canvas.draw()
@@ -464,27 +498,25 @@ class App(ctk.CTk):
     def on_hover(self, event):
         is_visible = self.hover_line and self.hover_line.get_visible()
         if event.inaxes is self.cont_ax:
-            nearest_time = self.find_nearest_time(event.xdata, "summary_data")
-            if nearest_time is None: return
-            self.hover_line.set_xdata([nearest_time])
-            tooltip_text = f"Time: {nearest_time.strftime('%H:%M')}\n"; all_lines_with_names = list(self.plotted_lines.items())
-            for i, (name, line) in enumerate(all_lines_with_names):
-                point = self.hover_points[i]
+            idx = self.nearest_time_index(event.xdata)
+            if idx is None: return
+            nearest_time = self.plot_times[idx]; x_val = self.plot_time_num[idx]
+            self.hover_line.set_xdata([x_val])
+            tooltip_text = f"Time: {nearest_time.strftime('%H:%M')}\n"
+            for point, (name, line) in zip(self.hover_points, self.plotted_lines.items()):
                 if line.get_visible():
-                    y_val = np.interp(plt.matplotlib.dates.date2num(nearest_time), plt.matplotlib.dates.date2num(line.get_xdata()), line.get_ydata())
-                    point.set_data([nearest_time], [y_val]); point.set_color(line.get_color()); point.set_visible(True)
-                    if name == "Total Load": self.annotation.xy = (nearest_time, y_val)
+                    y_val = self.hover_values[name][idx]
+                    point.set_data([x_val], [y_val]); point.set_color(line.get_color()); point.set_visible(True)
+                    if name == "Total Load": self.annotation.xy = (x_val, y_val)
                     tooltip_text += f"{name}: {y_val:.2f} MW\n"
                 else: point.set_visible(False)
             self.annotation.set_text(tooltip_text.strip())
-            if not is_visible:
-                self.hover_line.set_visible(True); self.annotation.set_visible(True)
-                self.cont_canvas.draw_idle()
-        else:
-            if is_visible:
-                self.hover_line.set_visible(False); self.annotation.set_visible(False)
-                for point in self.hover_points: point.set_visible(False)
-                self.cont_canvas.draw_idle()
+            self.hover_line.set_visible(True); self.annotation.set_visible(True)
+            self.overlays['cont'].update()
+        elif is_visible:
+            self.hover_line.set_visible(False); self.annotation.set_visible(False)
+            for point in self.hover_points: point.set_visible(False)
+            self.overlays['cont'].update()
 
     def on_click(self, event):
         if event.inaxes is self.cont_ax and event.button == 1:
@@ -494,26 +526,27 @@ class App(ctk.CTk):
     def on_hover_iterative(self, event):
         visible = False
         if event.inaxes is self.iter_ax_power or event.inaxes is self.iter_ax_freq:
-            nearest_time = self.find_nearest_time(event.xdata, "summary_data")
-            if nearest_time:
+            idx = self.nearest_time_index(event.xdata)
+            if idx is not None:
                 visible = True
-                self.iter_hover_line_power.set_xdata([nearest_time])
-                self.iter_hover_line_freq.set_xdata([nearest_time])
-                load_val = self.interactive_plot_data['summary_data']['total_load_mw'].get(nearest_time, 0)
-                self.iter_hover_point.set_data([nearest_time], [load_val])
+                nearest_time = self.plot_times[idx]; x_val = self.plot_time_num[idx]
+                self.iter_hover_line_power.set_xdata([x_val])
+                self.iter_hover_line_freq.set_xdata([x_val])
+                load_val = self.hover_values['load'][idx]
+                self.iter_hover_point.set_data([x_val], [load_val])
                 y_range = self.iter_ax_power.get_ylim()
                 y_pos_norm = (load_val - y_range[0]) / (y_range[1] - y_range[0])
                 offset = (20, 20) if y_pos_norm < 0.8 else (20, -60)
                 self.iter_annotation.set_position(offset)
-                self.iter_annotation.xy = (nearest_time, load_val)
+                self.iter_annotation.xy = (x_val, load_val)
                 self.iter_annotation.set_text(f"Time: {nearest_time.strftime('%H:%M')}")
         
-        if hasattr(self, 'iter_hover_line_power') and self.iter_hover_line_power and self.iter_hover_line_power.get_visible() != visible:
+        if visible or self.iter_hover_line_power.get_visible():
             self.iter_hover_line_power.set_visible(visible)
             self.iter_hover_line_freq.set_visible(visible)
             self.iter_hover_point.set_visible(visible)
             self.iter_annotation.set_visible(visible)
-            self.iter_canvas.draw_idle()
+            self.overlays['iter'].update()
 
     def on_click_iterative(self, event):
         ax = event.inaxes
@@ -571,43 +604,35 @@ class App(ctk.CTk):
         if not self.interactive_plot_data: return
         time_str = selected_time.strftime('%H:%M')
         self.as_table_title_var.set(f"ตารางบันทึกการตัดโหลด (Adaptive) ณ เวลา {time_str}")
-        df = self.interactive_plot_data['shed_loads_df']
-        
-        self.clear_table(self.as_tree)
-        if df.empty or 'datetime' not in df.columns:
-            return
-            
-        df_at_time = df[df['datetime'] == selected_time]
-        for i, (_, row) in enumerate(df_at_time.iterrows()):
-            mva = np.sqrt(row['MW_Shed']**2 + row['MVAR_Shed']**2)
-            # --- ส่วนที่แก้ไข: สร้าง String สำหรับ Priority ---
-            priority_str = f"{row['Priority_Before']:.1f} → {row['Priority_After']:.1f}"
-            values = [i+1, int(row['BusID']), priority_str, f"{row['Shed_Percent']:.1f}%", f"{row['MW_Shed']:.4f}", f"{mva:.4f}"]
-            self.as_tree.insert("", "end", values=values)
+        # Priority ก่อน → หลังการตัดโหลด
+        priority_str = lambda page: [f"{before:.1f} → {after:.1f}" for before, after in zip(page['Priority_Before'], page['Priority_After'])]
+        self.show_shed_table(self.as_tree, selected_time, [int_column('Order'), int_column('BusID'), priority_str,
+                                                          float_column('Shed_Percent', '{:.1f}%'), float_column('MW_Shed'), float_column('MVA')])
 
     def on_hover_loadshedding(self, event):
         visible = False
         if event.inaxes is self.ls_ax_power or event.inaxes is self.ls_ax_freq:
-            nearest_time = self.find_nearest_time(event.xdata, "summary_data")
-            if nearest_time:
+            idx = self.nearest_time_index(event.xdata)
+            if idx is not None:
                 visible = True
-                self.ls_hover_line_power.set_xdata([nearest_time])
-                self.ls_hover_line_freq.set_xdata([nearest_time])
-                load_after = self.interactive_plot_data['summary_data']['total_load_mw_after'].get(nearest_time, 0)
-                self.ls_hover_point.set_data([nearest_time], [load_after])
+                nearest_time = self.plot_times[idx]; x_val = self.plot_time_num[idx]
+                self.ls_hover_line_power.set_xdata([x_val])
+                self.ls_hover_line_freq.set_xdata([x_val])
+                load_after = self.hover_values['load_after'][idx]
+                self.ls_hover_point.set_data([x_val], [load_after])
                 y_range = self.ls_ax_power.get_ylim()
                 y_pos_norm = (load_after - y_range[0]) / (y_range[1] - y_range[0])
                 offset = (20, 20) if y_pos_norm < 0.8 else (20, -60)
                 self.ls_annotation.set_position(offset)
-                self.ls_annotation.xy = (nearest_time, load_after)
+                self.ls_annotation.xy = (x_val, load_after)
                 self.ls_annotation.set_text(f"Time: {nearest_time.strftime('%H:%M')}")
         
-        if hasattr(self, 'ls_hover_line_power') and self.ls_hover_line_power and self.ls_hover_line_power.get_visible() != visible:
+        if visible or self.ls_hover_line_power.get_visible():
             self.ls_hover_line_power.set_visible(visible)
             self.ls_hover_line_freq.set_visible(visible)
             self.ls_hover_point.set_visible(visible)
             self.ls_annotation.set_visible(visible)
-            self.ls_canvas.draw_idle()
+            self.overlays['ls'].update()
 
     def on_click_loadshedding(self, event):
         ax = event.inaxes
@@ -663,70 +688,89 @@ class App(ctk.CTk):
                                             visible=True, zorder=40, fontname="Arial", fontsize=10)
                 self.ps_canvas.draw_idle()
 
-    def find_nearest_time(self, event_x, data_key):
-        if not self.interactive_plot_data or event_x is None: return None
-        summary_dict = self.interactive_plot_data.get(data_key, {})
-        time_series = None
-        if 'total_load_mw' in summary_dict:
-            time_series = summary_dict['total_load_mw'].index
-        elif 'total_load_mw_before' in summary_dict:
-            time_series = summary_dict['total_load_mw_before'].index
-        else:
-            return None
-        time_as_float = plt.matplotlib.dates.date2num(time_series); idx = np.abs(time_as_float - event_x).argmin()
-        return time_series[idx]
+    def bind_canvas(self, key, canvas, handlers, overlay_artists=None):
+        """ต่อ event ของ canvas กับผลชุดใหม่ (ตัด event และ overlay ของผลชุดก่อนออก ไม่ให้ handler ซ้อนกันทุกครั้งที่รัน)"""
+        for cid in self.canvas_events.pop(key, []): canvas.mpl_disconnect(cid)
+        if key in self.overlays: self.overlays.pop(key).disconnect()
+        self.canvas_events[key] = [canvas.mpl_connect(name, handler) for name, handler in handlers.items()]
+        if overlay_artists: self.overlays[key] = BlitOverlay(canvas, overlay_artists)
+
+    def level_of_detail(self, key, *axes):
+        """LevelOfDetail ของแต่ละ axes ใน canvas (เก็บไว้ให้ callback xlim_changed ยังอยู่จนกว่าจะวาดผลชุดใหม่)"""
+        self.lod_views[key] = tuple(LevelOfDetail(ax) for ax in axes)
+        return self.lod_views[key]
+
+    def set_plot_time_axis(self, summary_dict):
+        """แกนเวลาของผลที่แสดง (DatetimeIndex และค่าตัวเลขของ matplotlib) คำนวณครั้งเดียวต่อการรัน"""
+        if 'total_load_mw' in summary_dict: self.plot_times = summary_dict['total_load_mw'].index
+        elif 'total_load_mw_before' in summary_dict: self.plot_times = summary_dict['total_load_mw_before'].index
+        else: self.plot_times = None; self.plot_time_num = None; return
+        self.plot_time_num = mdates.date2num(self.plot_times)
+
+    def index_result_tables(self, results):
+        """index เวลา → ช่วงแถวของ full_df และ shed_loads_df สร้างครั้งเดียวต่อการรัน (result_store อ่านราย step ได้อยู่แล้ว)"""
+        full_df = results.get('full_df')
+        self.row_index = TimeRowIndex(full_df) if 'result_store' not in results and full_df is not None else None
+        shed_df = results.get('shed_loads_df')
+        self.shed_row_index = (TimeRowIndex(shed_df) if shed_df is not None and not shed_df.empty and 'datetime' in shed_df.columns
+                               else None)
+
+    def series_at_plot_times(self, series):
+        """ค่าของ series ที่แต่ละเวลาบนแกนเวลา (เวลาที่ไม่มีข้อมูล = 0) สำหรับอ่านตาม index ตอน hover"""
+        return series.reindex(self.plot_times, fill_value=0).to_numpy(dtype=float)
+
+    def nearest_time_index(self, event_x):
+        """ตำแหน่งบนแกนเวลาที่ใกล้ event_x ที่สุด (binary search บนแกนที่เรียงแล้ว)"""
+        if not self.interactive_plot_data or event_x is None or self.plot_time_num is None: return None
+        times = self.plot_time_num
+        idx = int(np.searchsorted(times, event_x))
+        if idx >= len(times): return len(times) - 1
+        if idx > 0 and event_x - times[idx - 1] <= times[idx] - event_x: idx -= 1
+        return idx
+
+    def find_nearest_time(self, event_x, data_key="summary_data"):
+        idx = self.nearest_time_index(event_x)
+        return None if idx is None else self.plot_times[idx]
 
     def update_interactive_table(self, selected_time, tree_widget, title_var):
         if not self.interactive_plot_data: return
         time_str = selected_time.strftime('%H:%M')
-        base_title = f"ตารางแสดงผลการรัน loadflow ณ เวลา {time_str}"; df = self.interactive_plot_data['full_df']; df_at_time = df[df['datetime'] == selected_time]
+        base_title = f"ตารางแสดงผลการรัน loadflow ณ เวลา {time_str}"
+        if 'result_store' in self.interactive_plot_data:
+            df_at_time = self.interactive_plot_data['result_store'].frame_at(selected_time)
+        else:
+            df_at_time = self.row_index.rows_at(selected_time)
         warning_msg = ""
         if 'Warning' in df_at_time.columns and not df_at_time['Warning'].empty:
             first_warning = df_at_time['Warning'].iloc[0]
             if first_warning: warning_msg = f" ({first_warning})"
         title_var.set(base_title + warning_msg)
-        self.clear_table(tree_widget)
-        for _, row in df_at_time.iterrows():
-            cols = list(tree_widget["columns"])
-            values = []
-            for col in cols:
-                if col in row:
-                    if col in ['BusID', 'Type']: values.append(f"{int(row[col])}")
-                    else: values.append(f"{row[col]:.4f}")
-                else: values.append("")
-            tree_widget.insert("", "end", values=values)
+        formatters = [(int_column(col) if col in ['BusID', 'Type'] else float_column(col)) if col in df_at_time.columns else blank_column
+                      for col in tree_widget["columns"]]
+        self.virtual_tables[str(tree_widget)].show(df_at_time, formatters)
 
     def update_loadshedding_table(self, selected_time):
         if not self.interactive_plot_data: return
         time_str = selected_time.strftime('%H:%M')
         self.ls_table_title_var.set(f"ตารางบันทึกการตัดโหลด (Load Shedding Log) ณ เวลา {time_str}")
-        df = self.interactive_plot_data['shed_loads_df']
-        
-        self.clear_table(self.ls_tree)
-        if df.empty or 'datetime' not in df.columns:
-            return
-            
-        df_at_time = df[df['datetime'] == selected_time]
-        for i, (_, row) in enumerate(df_at_time.iterrows()):
-            mva = np.sqrt(row['MW_Shed']**2 + row['MVAR_Shed']**2)
-            values = [i+1, int(row['BusID']), int(row['Priority']), f"{row['MW_Shed']:.4f}", f"{mva:.4f}"]
-            self.ls_tree.insert("", "end", values=values)
+        self.show_shed_table(self.ls_tree, selected_time, [int_column('Order'), int_column('BusID'), int_column('Priority'),
+                                                          float_column('MW_Shed'), float_column('MVA')])
 
     def update_percentage_shedding_table(self, selected_time):
         if not self.interactive_plot_data: return
         time_str = selected_time.strftime('%H:%M')
         self.ps_table_title_var.set(f"ตารางบันทึกการตัดโหลด (Percentage) ณ เวลา {time_str}")
-        df = self.interactive_plot_data['shed_loads_df']
-        
-        self.clear_table(self.ps_tree)
-        if df.empty or 'datetime' not in df.columns:
-            return
-            
-        df_at_time = df[df['datetime'] == selected_time]
-        for i, (_, row) in enumerate(df_at_time.iterrows()):
-            mva = np.sqrt(row['MW_Shed']**2 + row['MVAR_Shed']**2)
-            values = [i+1, int(row['BusID']), int(row['Priority']), f"{row['Shed_Percent']:.1f}%", f"{row['MW_Shed']:.4f}", f"{mva:.4f}"]
-            self.ps_tree.insert("", "end", values=values)
+        self.show_shed_table(self.ps_tree, selected_time, [int_column('Order'), int_column('BusID'), int_column('Priority'),
+                                                          float_column('Shed_Percent', '{:.1f}%'), float_column('MW_Shed'), float_column('MVA')])
+
+    def show_shed_table(self, tree_widget, selected_time, formatters):
+        """ตารางบันทึกการตัดโหลด ณ เวลาเดียวจาก shed_row_index (Order = ลำดับในเวลานั้น, MVA จาก MW/MVAR ที่ตัด)"""
+        table = self.virtual_tables[str(tree_widget)]
+        if self.shed_row_index is None: table.clear(); return
+        df_at_time = self.shed_row_index.rows_at(selected_time)
+        df_at_time = df_at_time.assign(Order=np.arange(1, len(df_at_time) + 1),
+                                       MVA=np.sqrt(df_at_time['MW_Shed']**2 + df_at_time['MVAR_Shed']**2))
+        table.show(df_at_time, formatters)
 
     def update_explanation_panel(self, selected_time):
         explanation_text = self._generate_frequency_explanation(selected_time)
@@ -774,8 +818,6 @@ class App(ctk.CTk):
         text += f"   - (ค่าที่แสดงบนกราฟ: {final_freq:.4f} Hz)\n"
         return text
 
-    def clear_table(self, tree_widget):
-        for i in tree_widget.get_children(): tree_widget.delete(i)
     def save_results_to_file(self):
         if self.last_results_data is None: return
         filename = self.filename_entry.get()
@@ -783,16 +825,33 @@ class App(ctk.CTk):
         if not filename.lower().endswith('.csv'): filename += '.csv'
         filepath = os.path.join(self.RESULTS_PATH, filename)
         try:
-            if isinstance(self.last_results_data, dict) and 'full_df' in self.last_results_data:
+            if isinstance(self.last_results_data, dict) and 'result_store' in self.last_results_data:
+                # เขียนทีละ chunk จาก result store โดยไม่สร้าง DataFrame ของทั้ง time series
+                with ChunkedCSVWriter(filepath) as writer:
+                    self.last_results_data['result_store'].write_to(writer)
+                if 'shed_loads_df' in self.last_results_data:
+                    shed_log_path = os.path.splitext(filepath)[0] + '_shed_log.csv'
+                    self.last_results_data['shed_loads_df'].to_csv(shed_log_path, index=False)
+            elif isinstance(self.last_results_data, dict) and 'patterns' in self.last_results_data:
+                with ChunkedCSVWriter(filepath) as writer:
+                    for name, r in self.last_results_data['patterns'].items():
+                        r['result_store'].write_to(writer, pattern=name)
+            elif isinstance(self.last_results_data, dict) and 'sweep_summary' in self.last_results_data:
+                self.last_results_data['sweep_summary'].to_csv(filepath)
+                for name, heatmap in self.last_results_data['heatmaps'].items():
+                    heatmap.to_csv(os.path.splitext(filepath)[0] + f'_{name}.csv')
+            elif isinstance(self.last_results_data, dict) and 'monte_carlo_samples' in self.last_results_data:
+                self.last_results_data['monte_carlo_samples'].to_csv(filepath)
+                self.last_results_data['statistics'].to_csv(os.path.splitext(filepath)[0] + '_statistics.csv')
+            elif isinstance(self.last_results_data, dict) and 'comparison' in self.last_results_data:
+                self.last_results_data['comparison'].to_csv(filepath)
+                self.last_results_data['load_energy_shed'].to_csv(os.path.splitext(filepath)[0] + '_load_energy_shed.csv')
+            elif isinstance(self.last_results_data, dict) and 'parametric_results' in self.last_results_data:
+                self.last_results_data['parametric_results'].to_csv(filepath)
+            elif isinstance(self.last_results_data, dict) and 'dynamic_freq_df' in self.last_results_data:
+                self.last_results_data['dynamic_freq_df'].to_csv(filepath, index=False)
+            elif isinstance(self.last_results_data, dict) and 'full_df' in self.last_results_data:
                 self.last_results_data['full_df'].to_csv(filepath, index=False)
-            elif 'shed_loads_df' in self.last_results_data:
-                # Save multiple dataframes to different sheets in an Excel file
-                if not filename.lower().endswith('.xlsx'):
-                    filename = os.path.splitext(filename)[0] + '.xlsx'
-                filepath = os.path.join(self.RESULTS_PATH, filename)
-                with pd.ExcelWriter(filepath) as writer:
-                    self.last_results_data['full_df'].to_csv(writer, sheet_name='Loadflow_Results', index=False)
-                    self.last_results_data['shed_loads_df'].to_csv(writer, sheet_name='Loadshed_Log', index=False)
             else: raise TypeError("Result data is not in a saveable format.")
             
             self.save_button.configure(text="Saved!", fg_color="green")
@@ -0,0 +1,38 @@
+# microgrid_project/gui/blitting.py
+
+
+class BlitOverlay:
+    """
+    วาด artist ที่เปลี่ยนตามเมาส์ (เส้น hover, จุด, annotation) ด้วย blitting
+    ภาพพื้นหลังของ figure (ไม่รวม artist เหล่านี้) ถูกเก็บทุกครั้งที่ canvas วาดเต็ม (draw_event)
+    การ update แต่ละครั้งคืนพื้นหลังแล้ววาดเฉพาะ artist ที่มองเห็น โดยไม่วาด figure ใหม่ทั้งรูป
+    """
+    def __init__(self, canvas, artists):
+        self.canvas = canvas
+        self.artists = list(artists)
+        self.background = None
+        for artist in self.artists: artist.set_animated(True)   # ไม่ถูกวาดใน full draw จึงไม่ติดอยู่ในพื้นหลัง
+        self._draw_cid = canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        figure = self.canvas.figure
+        for artist in self.artists:
+            if artist.get_visible(): figure.draw_artist(artist)
+
+    def update(self):
+        """วาด artist ตามสถานะปัจจุบันทับพื้นหลังที่เก็บไว้ (ยังไม่มีพื้นหลัง = ขอ full draw ครั้งเดียว)"""
+        if self.background is None:
+            self.canvas.draw_idle(); return
+        self.canvas.restore_region(self.background)
+        self._draw_artists()
+        self.canvas.blit(self.canvas.figure.bbox)
+
+    def disconnect(self):
+        """เลิกใช้ overlay นี้ (เช่นก่อนล้าง axes เพื่อวาดผลชุดใหม่)"""
+        self.canvas.mpl_disconnect(self._draw_cid)
+        for artist in self.artists: artist.set_animated(False)
+        self.background = None
@@ -0,0 +1,65 @@
+# microgrid_project/gui/level_of_detail.py
+
+import numpy as np
+import matplotlib.dates as mdates
+
+# จำนวนช่วง (bin) ขั้นต่ำต่อเส้น เมื่อ axes ยังไม่มีขนาดจริง (ก่อนวาดครั้งแรก)
+MIN_LOD_BINS = 200
+
+def minmax_decimate(x: np.ndarray, y: np.ndarray, x_min: float, x_max: float, n_bins: int) -> np.ndarray:
+    """
+    index ของจุดที่ต้องวาดเมื่อแสดงช่วง [x_min, x_max] กว้าง n_bins pixel (x เรียงจากน้อยไปมาก)
+    แบ่งจุดในช่วงเป็น n_bins กลุ่มแล้วเก็บจุดต่ำสุดและสูงสุดของแต่ละกลุ่ม (min/max ต่อ pixel)
+    ยอดและจุดต่ำสุด (เช่น frequency nadir) จึงยังอยู่ครบ พร้อมจุดหนึ่งจุดนอกช่วงแต่ละด้านให้เส้นลากถึงขอบ
+    ไม่เกิน 2 * n_bins + 2 จุด (ช่วงที่มีจุดน้อยกว่านั้นคืนทุกจุด)
+    """
+    start = max(int(np.searchsorted(x, x_min, side='left')) - 1, 0)
+    stop = min(int(np.searchsorted(x, x_max, side='right')) + 1, len(x))
+    count = stop - start
+    if count <= 2 * n_bins + 2: return np.arange(start, stop)
+
+    width = -(-count // n_bins)   # จำนวนจุดต่อกลุ่ม (ปัดขึ้น)
+    values = np.asarray(y[start:stop], dtype=float)
+    padded = np.full(width * n_bins, np.nan); padded[:count] = values
+    padded = padded.reshape(n_bins, width)
+    missing = np.isnan(padded)
+    offsets = np.arange(n_bins) * width + start
+    lows = np.where(missing, np.inf, padded).argmin(axis=1) + offsets
+    highs = np.where(missing, -np.inf, padded).argmax(axis=1) + offsets
+    keep = np.concatenate([lows, highs, [start, stop - 1]])
+    return np.unique(keep[keep < stop])
+
+
+class LevelOfDetail:
+    """
+    เส้น time series ของ axes หนึ่งอันที่วาดแบบลดจุด (minmax_decimate) ตามช่วงแกน x ที่มองเห็น
+    ข้อมูลเต็มถูกเก็บไว้ที่นี่ เมื่อ zoom / pan (xlim_changed) ทุกเส้นถูกสุ่มจุดใหม่จากช่วงที่เห็น
+    จำนวนจุดที่ส่งให้ matplotlib จึงขึ้นกับความกว้างของ axes ไม่ใช่ความยาวของ time series
+    """
+    def __init__(self, ax):
+        self.ax = ax
+        self.lines = []   # (Line2D, x ตัวเลข, y)
+        self._cid = ax.callbacks.connect('xlim_changed', self._on_xlim_changed)
+
+    def plot(self, x, y, **kwargs):
+        """เหมือน ax.plot(x, y) ของ Series / DatetimeIndex แต่วาดเฉพาะจุดที่เลือกจากทั้งช่วงข้อมูล"""
+        x_num = np.asarray(mdates.date2num(x), dtype=float)
+        y = np.asarray(y, dtype=float)
+        idx = minmax_decimate(x_num, y, x_num[0], x_num[-1], self._bins()) if len(x_num) else np.arange(0)
+        line, = self.ax.plot(x[idx], y[idx], **kwargs)   # ค่าเวลาจริง ให้แกน x ใช้ date converter
+        self.lines.append((line, x_num, y))
+        return line
+
+    def _bins(self):
+        return max(int(self.ax.bbox.width), MIN_LOD_BINS)
+
+    def _on_xlim_changed(self, ax):
+        x_min, x_max = sorted(ax.get_xlim())
+        n_bins = self._bins()
+        for line, x_num, y in self.lines:
+            if not len(x_num): continue
+            idx = minmax_decimate(x_num, y, x_min, x_max, n_bins)
+            line.set_data(x_num[idx], y[idx])
+
+    def disconnect(self):
+        self.ax.callbacks.disconnect(self._cid)
@@ -0,0 +1,76 @@
+# microgrid_project/gui/table_view.py
+
+import numpy as np
+import pandas as pd
+
+# จำนวนแถวที่แทรกลง Treeview ต่อครั้ง
+TABLE_PAGE_ROWS = 100
+
+class TimeRowIndex:
+    """
+    index จากเวลาไปยังช่วงแถวของ DataFrame แบบ long (คอลัมน์ datetime) สร้างครั้งเดียวต่อการรัน
+    แถวถูกเรียงตามเวลาแบบ stable (ลำดับภายในเวลาเดียวกันคงเดิม) แถวของแต่ละเวลาจึงเป็นช่วงต่อเนื่อง
+    rows_at หาเวลาด้วย binary search แล้ว slice แทนการเทียบ datetime ทุกแถวของตาราง
+    """
+    def __init__(self, frame: pd.DataFrame, time_column: str = 'datetime'):
+        values = frame[time_column].to_numpy(dtype='datetime64[ns]')
+        order = np.argsort(values, kind='stable')
+        self.frame = frame.iloc[order]
+        self.times, self.starts = np.unique(values[order], return_index=True)
+        self.stops = np.append(self.starts[1:], len(order))
+
+    def rows_at(self, selected_time) -> pd.DataFrame:
+        """แถวทั้งหมดของเวลา selected_time (DataFrame ว่างถ้าไม่มี)"""
+        key = pd.Timestamp(selected_time).to_datetime64()
+        pos = int(np.searchsorted(self.times, key))
+        if pos == len(self.times) or self.times[pos] != key: return self.frame.iloc[0:0]
+        return self.frame.iloc[self.starts[pos]:self.stops[pos]]
+
+
+class VirtualTable:
+    """
+    แสดง DataFrame ใน ttk.Treeview แบบ lazy: แทรกทีละหน้า (page_rows แถว) และแทรกหน้าถัดไปเมื่อเลื่อนถึงท้ายตาราง
+    formatters คือฟังก์ชันหนึ่งตัวต่อคอลัมน์ของ Treeview รับ DataFrame ของหน้านั้นแล้วคืนข้อความของทุกแถว
+    การจัดรูปแบบจึงทำแบบ vectorized ทีละหน้า และเฉพาะหน้าที่ถูกแสดงจริง
+    """
+    def __init__(self, tree, page_rows: int = TABLE_PAGE_ROWS):
+        self.tree = tree
+        self.page_rows = page_rows
+        self.frame = None; self.formatters = (); self.shown = 0
+        tree.configure(yscrollcommand=self._on_scroll)
+
+    def show(self, frame: pd.DataFrame, formatters):
+        self.clear()
+        self.frame = frame; self.formatters = list(formatters)
+        self._insert_page()
+
+    def clear(self):
+        self.tree.delete(*self.tree.get_children())
+        self.frame = None; self.shown = 0
+
+    def _insert_page(self):
+        if self.frame is None: return
+        stop = min(self.shown + self.page_rows, len(self.frame))
+        if stop <= self.shown: return
+        page = self.frame.iloc[self.shown:stop]
+        columns = [list(formatter(page)) for formatter in self.formatters]
+        for values in zip(*columns): self.tree.insert("", "end", values=values)
+        self.shown = stop
+
+    def _on_scroll(self, first, last):
+        # แถวสุดท้ายที่แทรกแล้วอยู่ในมุมมอง: แทรกหน้าถัดไปหลังจัดการ event ปัจจุบันเสร็จ
+        if self.frame is not None and self.shown < len(self.frame) and float(last) >= 1.0:
+            self.tree.after_idle(self._insert_page)
+
+
+def int_column(column: str):
+    """formatter ของคอลัมน์จำนวนเต็ม (BusID, Type, Priority)"""
+    return lambda page: page[column].to_numpy(dtype=float).astype(int).astype(str).tolist()
+
+def float_column(column: str, fmt: str = '{:.4f}'):
+    """formatter ของคอลัมน์ทศนิยมตาม fmt"""
+    return lambda page: page[column].map(fmt.format)
+
+def blank_column(page: pd.DataFrame):
+    """formatter ของคอลัมน์ที่ตารางไม่มีข้อมูล"""
+    return [""] * len(page)
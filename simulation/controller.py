@@ -5,9 +5,16 @@ from utils.data_manager import load_microgrid_data
 from simulation.usecases import initial_loadflow_case
 from simulation.usecases import continuous_loadflow_case
 from simulation.usecases import iterative_dispatch_case 
+from simulation.usecases import mpg_disconnection_case
 from simulation.usecases import load_shedding_normal_case
 from simulation.usecases import load_shedding_percentage_case
+from simulation.usecases import load_shedding_optimal_case
 from simulation.usecases import load_shedding_adaptive_case
+from simulation.usecases import disconnection_sweep_case
+from simulation.usecases import monte_carlo_case
+from simulation.usecases import shedding_comparison_case
+from simulation.usecases import parametric_sweep_case
+from simulation.usecases import quasi_dynamic_case
 
 class SimulationController:
     def __init__(self, data_path: str, results_path: str):
@@ -19,10 +26,18 @@ class SimulationController:
         self.use_case_map = {
             "Initial Load Flow": initial_loadflow_case.run,
             "Continuous Load Flow": continuous_loadflow_case.run,
+            "Continuous Load Flow (Multi-Pattern)": continuous_loadflow_case.run_multi_pattern,
             "MPG Disconnection (Iterative Dispatch)": iterative_dispatch_case.run,
+            "MPG Disconnection (Primary Freq.)": mpg_disconnection_case.run,
+            "MPG Disconnection (Quasi-Dynamic)": quasi_dynamic_case.run,
             "Load Shedding (Normal)": load_shedding_normal_case.run,
             "Load Shedding (Percentage)": load_shedding_percentage_case.run,
+            "Load Shedding (Optimal LP)": load_shedding_optimal_case.run,
             "Load Shedding (Adaptive)": load_shedding_adaptive_case.run,
+            "MPG Disconnection Sweep": disconnection_sweep_case.run,
+            "MPG Disconnection (Monte Carlo)": monte_carlo_case.run,
+            "Shedding Scheme Comparison": shedding_comparison_case.run,
+            "Shedding Parametric Sweep": parametric_sweep_case.run,
         }
 
     def run_use_case(self, use_case_name: str, system_data: dict) -> tuple:
@@ -0,0 +1,137 @@
+# simulation/cosimulation.py
+
+import numpy as np
+import pandas as pd
+from .dispatch import islanded_dispatch, islanded_frequency
+from .islanding import grid_import_series
+from .frequency_response import aggregate_parameters, event_driven_response, DEFAULT_GOVERNOR_T
+from .usecases.mpg_disconnection_case import ufls_stages
+
+# ค่าเริ่มต้นของ co-simulation ใน system_config.csv
+# CosimWindow = ความยาวหน้าต่าง dynamic ต่อ event (s), CosimLoadStepMW = โหลดรวมที่เปลี่ยนระหว่าง step ที่นับเป็น event (MW)
+DEFAULT_WINDOW_S = 10.0
+DEFAULT_LOAD_STEP_MW = 5.0
+# CosimRedispatchT = ค่าคงตัวเวลา (s) ที่ setpoint ของ DG เข้าหา islanded dispatch หลังตัด MPG
+DEFAULT_REDISPATCH_T = 2.0
+# ระยะห่างของจุดที่เก็บจากหน้าต่าง dynamic (s)
+WINDOW_SAMPLE_DT = 0.01
+
+def cosimulation_options(system_data: dict) -> dict:
+    """ตัวเลือกของ co-simulation จาก system_data['cosimulation'] (dict) หรือ system_config.csv"""
+    options = system_data.get('cosimulation') or {}
+    config = system_data.get('config', {}) or {}
+    return {
+        'window_s': float(options.get('window_s', config.get('CosimWindow', DEFAULT_WINDOW_S))),
+        'load_step_mw': float(options.get('load_step_mw', config.get('CosimLoadStepMW', DEFAULT_LOAD_STEP_MW))),
+        'governor_t': float(options.get('governor_t', config.get('GovernorTimeConstant', DEFAULT_GOVERNOR_T))),
+        'redispatch_t': float(options.get('redispatch_t', config.get('CosimRedispatchT', DEFAULT_REDISPATCH_T))),
+        'rocof_limit': options.get('rocof_limit', config.get('RocofLimit')),
+    }
+
+
+def event_steps(study: dict, disconnection_step: int, load_step_mw: float) -> np.ndarray:
+    """
+    step ที่อาจต้องจำลอง dynamic: step ที่ตัด MPG และ step ในโหมด islanding ที่โหลดรวม (ก่อน shedding)
+    เปลี่ยนจาก step ก่อนหน้าอย่างน้อย load_step_mw (ช่วงต่อกริดความถี่ถูกกริดตรึงไว้ จึงไม่มี event)
+    """
+    num_steps = study['num_steps']
+    if disconnection_step >= num_steps: return np.empty(0, dtype=int)
+    demand = study['pd_base'].sum(axis=1)
+    load_steps = np.flatnonzero(np.abs(np.diff(demand)) >= load_step_mw) + 1
+    return np.union1d([disconnection_step], load_steps[load_steps > disconnection_step])
+
+
+def grid_import_mw(study: dict, step: int) -> float:
+    """กำลังที่นำเข้าจาก MPG ที่ step (Pg ของ slack จาก Load Flow ต่อกริดด้วย Pg เริ่มต้นของ generator)"""
+    pg_initial = study['generators']['Pg_MW'].to_numpy(dtype=float)
+    grid_import = grid_import_series(study, pg_initial[None, :], study['pd_base'][step:step + 1],
+                                     study['qd_base'][step:step + 1])[0]
+    if np.isnan(grid_import):
+        raise RuntimeError(f"Grid-connected load flow before disconnection failed to converge at step {step}.")
+    return float(grid_import)
+
+
+def run_cosimulation(study: dict, disconnection_step: int, options: dict) -> dict:
+    """
+    Quasi-dynamic co-simulation: time-series ของ islanded dispatch / Load Flow ที่ step ทั่วไป
+    และ event_driven_response เฉพาะหน้าต่างรอบ event (event_steps) โดย droop รวมตาม R_sys ของ topology
+    - step ที่ตัด MPG: จำลองเสมอ กำลังที่นำเข้าจากกริดที่ step ก่อนตัด (grid_import_mw) หายไปทันที
+      เริ่มจาก governor ของจุดทำงานต่อกริด แล้ว setpoint ของ DG เข้าหา islanded dispatch (redispatch_t)
+    - step ที่โหลดเปลี่ยนขณะ islanding: เริ่มจากความถี่คงตัวและ governor ที่สมดุลกับ imbalance ของ step ก่อนหน้า
+      ไปยัง imbalance ใหม่ (ข้ามถ้า imbalance ไม่เปลี่ยน เพราะ DG รับการเปลี่ยนโหลดได้หมด)
+    ความถี่ปลายหน้าต่างจึงลู่เข้าค่าคงตัวของ islanded dispatch
+    UFLS (UFLSStages, % ของโหลดขณะตัด MPG) ตัดโหลดที่ Status = 1 ทุกตัวตามสัดส่วนระหว่างหน้าต่าง
+    แล้วส่งโหลดที่เหลือกลับให้ step นั้นและ step ถัดไปทั้งหมด (relay ที่ทำงานแล้วไม่ทำงานซ้ำ)
+    คืนค่า pd_loads, qd_loads, dg_pg, gen_total, imbalance, frequency ราย step, events (หนึ่งแถวต่อหน้าต่าง)
+    และ windows (trajectory ของทุกหน้าต่าง)
+    """
+    num_steps = study['num_steps']; base_freq = study['base_freq']; base_mva = study['base_mva']
+    topology = study['topology']; time_index = study['time_index']
+    pd_base = study['pd_base']; qd_base = study['qd_base']
+    sheddable = (study['loads']['Status'] == 1).to_numpy()
+    H_eq, _ = aggregate_parameters(topology.online_dg, base_mva)
+    R_eq = topology.R_sys_hz_mw * base_mva / base_freq if topology.R_sys_hz_mw > 0 else np.inf
+    gain = 1.0 / R_eq
+
+    is_islanding = np.arange(num_steps) >= disconnection_step
+    steps = event_steps(study, disconnection_step, options['load_step_mw'])
+    armed = (ufls_stages(study['config'], pd_base[disconnection_step].sum())
+             if disconnection_step < num_steps else [])
+    kept = np.ones(num_steps)   # สัดส่วนของโหลดที่ตัดได้ที่ยังต่ออยู่
+    rows = []; windows = []
+
+    def demand(k):
+        return pd_base[k] @ np.where(sheddable, kept[k], 1.0)
+
+    for k in steps:
+        imbalance_after = float(islanded_frequency(demand(k), topology.microgrid_pmax, topology.R_sys_hz_mw,
+                                                   base_freq)[0])
+        if k == disconnection_step:
+            # กำลังจากกริดหายไปทั้งหมด DG ถูก redispatch ด้วยกำลังสำรอง จนเหลือเฉพาะส่วนที่เกิน Pmax (imbalance_after)
+            disturbance = max(0.0, grid_import_mw(study, max(k - 1, 0)))
+            initial_state = (0.0, 0.0); setpoint = max(0.0, disturbance - imbalance_after)
+        else:
+            # จุดทำงานก่อน event: ความถี่คงตัวของ step ก่อนหน้า
+            imbalance_before = float(islanded_frequency(demand(k - 1), topology.microgrid_pmax,
+                                                        topology.R_sys_hz_mw, base_freq)[0])
+            if imbalance_after == imbalance_before: continue   # DG รับการเปลี่ยนโหลดได้หมด ความถี่ไม่เปลี่ยน
+            d_omega = -R_eq * imbalance_before / base_mva if np.isfinite(R_eq) else 0.0
+            disturbance = imbalance_after; initial_state = (d_omega, -gain * d_omega); setpoint = 0.0
+        response = event_driven_response(
+            disturbance, H_eq, R_eq, base_mva, base_freq, governor_t=options['governor_t'], stages=armed,
+            rocof_limit_hz_s=None if options['rocof_limit'] is None else float(options['rocof_limit']),
+            duration_s=options['window_s'], sample_dt=WINDOW_SAMPLE_DT, initial_state=initial_state,
+            setpoint_mw=setpoint, setpoint_t=options['redispatch_t']
+        )
+        tripped = set(response['events'].loc[response['events']['event'] == 'ufls_shed', 'stage_hz'])
+        armed = [stage for stage in armed if stage.freq_hz not in tripped]
+        sheddable_mw = pd_base[k, sheddable].sum() * kept[k]
+        if response['shed_mw'] > 0 and sheddable_mw > 0:
+            kept[k:] *= max(0.0, 1.0 - response['shed_mw'] / sheddable_mw)
+
+        rows.append({
+            'step': k, 'datetime': time_index[k], 'event': 'disconnection' if k == disconnection_step else 'load_step',
+            'load_before_mw': demand(k - 1) if k > 0 else demand(k), 'disturbance_mw': disturbance,
+            'imbalance_mw': imbalance_after, 'nadir_hz': response['nadir_hz'], 'time_to_nadir_s': response['time_to_nadir_s'],
+            'window_end_hz': response['frequency_hz'][-1], 'ufls_shed_mw': response['shed_mw'],
+            'ufls_stages': len(tripped), 'nfev': response['nfev'],
+        })
+        windows.append(pd.DataFrame({'step': k, 'time_s': response['time_s'], 'frequency_hz': response['frequency_hz']}))
+
+    # --- ส่งโหลดหลัง UFLS กลับให้ time-series: dispatch และความถี่คงตัวของทุก step ---
+    scale = np.where(sheddable[None, :], kept[:, None], 1.0)
+    pd_loads = pd_base * scale; qd_loads = qd_base * scale
+    dg_pg, gen_total, imbalance, frequency = islanded_dispatch(
+        pd_loads.sum(axis=1), topology.dg_pmin, topology.dg_pmax, topology.dg_participation,
+        topology.microgrid_pmax, topology.R_sys_hz_mw, base_freq
+    )
+    imbalance = np.where(is_islanding, imbalance, 0.0); frequency = np.where(is_islanding, frequency, base_freq)
+    events = pd.DataFrame(rows, columns=['step', 'datetime', 'event', 'load_before_mw', 'disturbance_mw', 'imbalance_mw',
+                                         'nadir_hz', 'time_to_nadir_s', 'window_end_hz', 'ufls_shed_mw', 'ufls_stages',
+                                         'nfev'])
+    return {
+        'pd_loads': pd_loads, 'qd_loads': qd_loads, 'dg_pg': dg_pg, 'gen_total': gen_total,
+        'imbalance': imbalance, 'frequency': frequency, 'is_islanding': is_islanding, 'events': events,
+        'windows': pd.concat(windows, ignore_index=True) if windows else
+                   pd.DataFrame(columns=['step', 'time_s', 'frequency_hz']),
+    }
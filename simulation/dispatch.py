@@ -0,0 +1,103 @@
+# simulation/dispatch.py
+
+import numpy as np
+import pandas as pd
+
+def participation_factor_dispatch(target_mw, pg_start: np.ndarray, pmin: np.ndarray, pmax: np.ndarray,
+                                  participation: np.ndarray, tolerance: float = 1e-9) -> np.ndarray:
+    """
+    กระจายกำลังผลิตตาม Participation Factor แบบ array (รับ demand ทั้ง time series ได้ในครั้งเดียว)
+    - target_mw: กำลังผลิตรวมที่ต้องการของกลุ่มเครื่องที่ร่วมกระจาย (scalar หรือ (T,))
+    - pg_start: จุดเริ่มต้นของแต่ละเครื่อง (G,) หรือ (T, G)
+    เมื่อเครื่องใดชน Pmin/Pmax จะถูกตรึงไว้ แล้วนำ MW ที่เหลือไปกระจายให้เครื่องที่ยังว่าง
+    ซ้ำจนครบหรือทุกเครื่องชนขีดจำกัด (ไม่ทิ้ง MW ไปเฉยๆ)
+    คืนค่า (T, G) หรือ (G,) ถ้า target_mw เป็น scalar
+    """
+    scalar_input = np.ndim(target_mw) == 0
+    target = np.atleast_1d(np.asarray(target_mw, dtype=float))
+    num_units = len(pmin)
+    pg = np.broadcast_to(np.asarray(pg_start, dtype=float), (len(target), num_units)).copy()
+    pmin = np.asarray(pmin, dtype=float); pmax = np.asarray(pmax, dtype=float)
+
+    weights = np.asarray(participation, dtype=float)
+    if weights.sum() <= 0:
+        weights = np.ones(num_units)
+    free = np.ones_like(pg, dtype=bool)
+
+    for _ in range(num_units + 1):
+        residual = target - pg.sum(axis=1)
+        free_weights = weights * free
+        weight_sum = free_weights.sum(axis=1)
+        movable = (np.abs(residual) > tolerance) & (weight_sum > 0)
+        if not movable.any():
+            break
+        pg[movable] += residual[movable, None] * free_weights[movable] / weight_sum[movable, None]
+        clipped = np.clip(pg, pmin, pmax)
+        free &= (clipped == pg)
+        pg = clipped
+
+    pg = np.clip(pg, pmin, pmax)
+    return pg[0] if scalar_input else pg
+
+
+def grid_connected_dispatch(total_demand_mw, gen_data: pd.DataFrame, slack_bus_id) -> np.ndarray:
+    """
+    Dispatch ขณะเชื่อมต่อกริด: เครื่องที่ไม่อยู่บน slack bus รับ mismatch ตาม Participation Factor
+    ส่วนที่เหลือให้ slack bus รับภาระผ่าน Load Flow
+    คืนค่า Pg_MW ของทุกเครื่องใน gen_data (T, G) หรือ (G,) ถ้า demand เป็น scalar
+    """
+    scalar_input = np.ndim(total_demand_mw) == 0
+    demand = np.atleast_1d(np.asarray(total_demand_mw, dtype=float))
+    pg_initial = gen_data['Pg_MW'].to_numpy(dtype=float)
+    pg = np.tile(pg_initial, (len(demand), 1))
+
+    active_mask = (gen_data['Status'] == 1).to_numpy()
+    participating_mask = active_mask & (gen_data['BusID'] != slack_bus_id).to_numpy()
+    participation = gen_data['ParticipationFactor'].to_numpy(dtype=float)
+    if participating_mask.any() and participation[participating_mask].sum() > 1e-6:
+        pmin = gen_data['Pmin_MW'].to_numpy(dtype=float); pmax = gen_data['Pmax_MW'].to_numpy(dtype=float)
+        fixed_mw = pg_initial[active_mask & ~participating_mask].sum()
+        pg[:, participating_mask] = participation_factor_dispatch(
+            demand - fixed_mw, pg_initial[participating_mask],
+            pmin[participating_mask], pmax[participating_mask], participation[participating_mask]
+        )
+        pg[:, active_mask] = np.clip(pg[:, active_mask], pmin[active_mask], pmax[active_mask])
+    return pg[0] if scalar_input else pg
+
+
+def islanded_frequency(total_demand_mw, microgrid_pmax: float, R_sys_hz_mw: float, base_freq: float) -> tuple:
+    """
+    กำลังที่ขาด (MW) และความถี่ขณะ islanding ตาม droop ของ demand รูปใดก็ได้
+    ความถี่ลดลงแบบเชิงเส้นตาม demand ส่วนที่เกิน Pmax รวมของไมโครกริด (Δf = -R_sys * ΔP)
+    """
+    demand = np.asarray(total_demand_mw, dtype=float)
+    over_capacity = demand > microgrid_pmax
+    imbalance = np.where(over_capacity, demand - microgrid_pmax, 0.0)
+    return imbalance, np.where(over_capacity, base_freq - R_sys_hz_mw * imbalance, base_freq)
+
+
+def islanded_dispatch(total_demand_mw, pmin: np.ndarray, pmax: np.ndarray, participation: np.ndarray,
+                      microgrid_pmax: float, R_sys_hz_mw: float, base_freq: float) -> tuple:
+    """
+    Dispatch ของ DG ขณะ islanding (แทน _run_dispatch_logic เดิมของแต่ละ use case)
+    - demand เกิน Pmax รวม: ทุกเครื่องจ่าย Pmax และความถี่ตกตาม droop (Δf = -R_sys * ΔP)
+    - ไม่เกิน: กระจายตาม Participation Factor พร้อม redistribution เมื่อชนขีดจำกัด
+    คืนค่า (pg, total_pg, imbalance, frequency) เป็น array ตามรูปของ demand
+    """
+    scalar_input = np.ndim(total_demand_mw) == 0
+    demand = np.atleast_1d(np.asarray(total_demand_mw, dtype=float))
+    pmax = np.asarray(pmax, dtype=float)
+
+    over_capacity = demand > microgrid_pmax
+    imbalance, frequency = islanded_frequency(demand, microgrid_pmax, R_sys_hz_mw, base_freq)
+
+    pg = np.tile(pmax, (len(demand), 1))
+    if (~over_capacity).any() and len(pmax) > 0:
+        pg[~over_capacity] = participation_factor_dispatch(
+            demand[~over_capacity], np.zeros(len(pmax)), pmin, pmax, participation
+        )
+    total_pg = pg.sum(axis=1)
+
+    if scalar_input:
+        return pg[0], total_pg[0], imbalance[0], frequency[0]
+    return pg, total_pg, imbalance, frequency
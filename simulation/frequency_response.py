@@ -1,50 +1,492 @@
 # microgrid_project/simulation/dynamics/frequency_response.py
 
+import functools
 import numpy as np
 import pandas as pd
+from scipy.integrate import solve_ivp
+from scipy.linalg import expm
+from scipy.signal import lfilter
+from .ybus_builder import dc_susceptance
 
-def simulate_frequency_dynamics(online_generators: pd.DataFrame, power_imbalance_mw: float, 
-                                base_mva: float, base_freq: float = 50.0, 
-                                sim_duration_s: float = 10.0, dt: float = 0.01) -> pd.DataFrame:
+# วิธี discretize ของ integrate_frequency_response
+# 'exact' = zero-order hold (ตรงกับ closed form เมื่อ imbalance คงที่), 'euler' = forward Euler แบบเดิม
+INTEGRATION_METHODS = ('exact', 'euler')
+
+def aggregate_parameters(online_generators: pd.DataFrame, base_mva: float) -> tuple:
     """
-    จำลองการตอบสนองความถี่เบื้องต้น (Primary Frequency Response)
-    โดยใช้ Aggregate Swing Equation และ Droop Control
+    พารามิเตอร์รวมของระบบ (H_eq [s] บนฐาน base_mva, R_eq [pu])
+    R_eq = 1 / sum(1/R_i) และเป็น inf เมื่อไม่มี droop
     """
-    
-    # 1. คำนวณพารามิเตอร์รวมของระบบ (System Aggregate Parameters)
     # ค่าแรงเฉื่อยรวม (Equivalent Inertia)
     H_eq = (online_generators['Inertia_H'] * online_generators['Pmax_MW']).sum() / base_mva
-    
     # ค่า Droop รวม (Equivalent Droop)
-    # R_eq = 1 / sum(1/R_i)
     inv_R_sum = (1 / online_generators['Droop_R']).sum()
     R_eq = 1 / inv_R_sum if inv_R_sum > 0 else np.inf
+    return H_eq, R_eq
 
-    # Power imbalance in per-unit
-    delta_P_L_pu = power_imbalance_mw / base_mva
-    
-    # 2. เริ่มการจำลองแบบวนซ้ำ (Euler Integration)
+
+def aggregate_frequency_response(time_s, power_imbalance_pu, H_eq: float, R_eq: float,
+                                 base_freq: float = 50.0) -> np.ndarray:
+    """
+    ความถี่ (Hz) แบบ closed form ของ Aggregate Swing Equation เมื่อ imbalance คงที่
+        2H dΔω/dt = -Δω/R - ΔP_L   ->   Δω(t) = -ΔP_L·R·(1 - exp(-t / (2HR)))
+    (ไม่มี droop: Δω(t) = -ΔP_L·t / 2H) power_imbalance_pu รูปใดก็ได้ ผลมีแกนเวลาต่อท้าย (..., T)
+    """
+    t = np.asarray(time_s, dtype=float)
+    imbalance = np.asarray(power_imbalance_pu, dtype=float)[..., None]
+    if np.isinf(R_eq):
+        d_omega = -imbalance * t / (2 * H_eq)
+    else:
+        d_omega = imbalance * R_eq * np.expm1(-t / (2 * H_eq * R_eq))
+    return (1.0 + d_omega) * base_freq
+
+
+def integrate_frequency_response(dt: float, power_imbalance_pu, H_eq: float, R_eq: float,
+                                 base_freq: float = 50.0, method: str = 'exact') -> np.ndarray:
+    """
+    ความถี่ (Hz) ที่เวลา 0, dt, ..., T·dt ของ Aggregate Swing Equation เมื่อ imbalance เปลี่ยนตามเวลา
+    power_imbalance_pu (..., T) คือ ΔP_L ของแต่ละช่วง dt (คงที่ภายในช่วง) ผลมีรูป (..., T + 1)
+    สมการเชิงเส้นอันดับหนึ่ง: Δω[k+1] = a·Δω[k] + b·ΔP_L[k] จึงแก้ทั้ง array ด้วย lfilter ครั้งเดียว
+    """
+    if method not in INTEGRATION_METHODS:
+        raise ValueError(f"Unknown integration method '{method}' (expected one of {INTEGRATION_METHODS}).")
+    imbalance = np.asarray(power_imbalance_pu, dtype=float)
+    if method == 'euler':
+        a = 1.0 - dt / (2 * H_eq * R_eq); b = -dt / (2 * H_eq)
+    elif np.isinf(R_eq):
+        a = 1.0; b = -dt / (2 * H_eq)
+    else:
+        a = np.exp(-dt / (2 * H_eq * R_eq)); b = -(1.0 - a) * R_eq
+    d_omega = lfilter([b], [1.0, -a], imbalance, axis=-1)
+    d_omega = np.concatenate([np.zeros(imbalance.shape[:-1] + (1,)), d_omega], axis=-1)
+    return (1.0 + d_omega) * base_freq
+
+
+def simulate_frequency_dynamics(online_generators: pd.DataFrame, power_imbalance_mw: float,
+                                base_mva: float, base_freq: float = 50.0,
+                                sim_duration_s: float = 10.0, dt: float = 0.01,
+                                method: str = 'euler') -> pd.DataFrame:
+    """
+    จำลองการตอบสนองความถี่เบื้องต้น (Primary Frequency Response)
+    โดยใช้ Aggregate Swing Equation และ Droop Control
+    แถวของเวลา t เก็บความถี่หลังก้าว dt จาก t (ตามผลเดิม) method = 'exact' ใช้ผลเฉลยแม่นตรง
+    """
+    H_eq, R_eq = aggregate_parameters(online_generators, base_mva)
     timesteps = np.arange(0, sim_duration_s, dt)
-    omega_pu = 1.0  # ความเร็วเชิงมุมเริ่มต้น (p.u.)
-    
-    results = []
-    
-    for t in timesteps:
-        # ณ เวลา t=0, Governor ยังไม่ทำงาน, delta_P_m = 0
-        # หลังจากนั้น, Governor จะปรับกำลังกลตาม droop
-        if t == 0:
-            delta_P_m_pu = 0.0
+    # Power imbalance in per-unit
+    imbalance = np.full(len(timesteps), power_imbalance_mw / base_mva)
+    frequency_hz = integrate_frequency_response(dt, imbalance, H_eq, R_eq, base_freq, method=method)[1:]
+    return pd.DataFrame({'time_s': timesteps, 'frequency_hz': frequency_hz})
+
+
+# ค่าเริ่มต้นของ model หลายเครื่อง เมื่อ generator_data ไม่มีคอลัมน์ Governor_T (s) / Xd_pu (pu บนฐานเครื่อง)
+DEFAULT_GOVERNOR_T = 0.5
+DEFAULT_XD_PU = 0.2
+# วิธีแก้ระบบเชิงเส้นของ MultiMachineModel.response
+# 'modal' = ผลเฉลยแม่นตรงผ่าน eigen decomposition (ทุกเวลาในการคูณ matrix ครั้งเดียว)
+# 'expm' = ก้าวด้วย matrix exponential ของ dt (zero-order hold) ใช้เมื่อ A ไม่ diagonalizable
+RESPONSE_METHODS = ('modal', 'expm')
+# condition number ของ eigenvector ที่ยังใช้ 'modal' ได้
+MAX_MODAL_CONDITION = 1e8
+# จำนวนกรณีที่ก้าวพร้อมกันต่อ block ใน batch_frequency_response (ให้ array อยู่ใน cache)
+BATCH_BLOCK = 4096
+
+class MultiMachineModel:
+    """
+    Model ความถี่หลายเครื่อง (classical model) ที่ linearize รอบจุดทำงาน: ต่อเครื่อง i
+        M_i dΔω_i/dt = ΔPm_i - ΔPe_i            M_i = 2·H_i·Pmax_i / base_mva
+        dδ_i/dt      = 2π·f_base·Δω_i
+        Tg_i dΔPm_i/dt = -ΔPm_i - G_i·Δω_i      G_i = (Pmax_i / base_mva) / R_i (droop บนฐานเครื่อง)
+    ΔPe = K·δ - F·ΔP_L: K, F จาก Kron reduction ของ DC network (บัสทั้งหมด + ขั้วภายในของเครื่องผ่าน Xd)
+    ΔP_L (MW ต่อบัส) คือกำลังที่ขาด (โหลดเพิ่ม/กำลังผลิตที่หายไป) state = [Δω, δ, ΔPm] เป็นระบบเชิงเส้น dx/dt = A·x + B·ΔP_L
+    generators: เครื่องที่ร่วมตอบสนอง (Pmax > 0 และ Inertia_H > 0) ค่า pu บนฐาน base_mva
+    """
+    def __init__(self, bus_data: pd.DataFrame, line_data: pd.DataFrame, generators: pd.DataFrame,
+                 base_mva: float, base_freq: float = 50.0, governor_t: float = DEFAULT_GOVERNOR_T,
+                 xd_pu: float = DEFAULT_XD_PU):
+        generators = generators[(generators['Pmax_MW'] > 0) & (generators['Inertia_H'] > 0)]
+        if generators.empty: raise ValueError("No generator with inertia to build the multi-machine model.")
+        self.generators = generators
+        self.base_mva = base_mva; self.base_freq = base_freq
+        pmax = generators['Pmax_MW'].to_numpy(dtype=float)
+        self.M = 2 * generators['Inertia_H'].to_numpy(dtype=float) * pmax / base_mva
+        droop_r = generators['Droop_R'].to_numpy(dtype=float)
+        self.G = np.divide(pmax / base_mva, droop_r, out=np.zeros_like(pmax), where=droop_r > 0)
+        self.Tg = (generators['Governor_T'].fillna(governor_t).to_numpy(dtype=float) if 'Governor_T' in generators
+                   else np.full(len(generators), float(governor_t)))
+        xd = (generators['Xd_pu'].fillna(xd_pu).to_numpy(dtype=float) if 'Xd_pu' in generators
+              else np.full(len(generators), float(xd_pu)))
+
+        # Kron reduction: ขั้วภายใน (n) ต่อกับบัส (N) ผ่าน susceptance ของ Xd บนฐานระบบ
+        b_bus, _ = dc_susceptance(bus_data, line_data)
+        n = len(generators); terminal = generators['BusID'].to_numpy(dtype=int) - 1
+        y_internal = pmax / (base_mva * xd)
+        b_bb = b_bus.copy()
+        np.add.at(b_bb, (terminal, terminal), y_internal)
+        b_ib = np.zeros((n, len(b_bus))); b_ib[np.arange(n), terminal] = -y_internal
+        b_bb_inv_bi = np.linalg.solve(b_bb, b_ib.T)
+        self.K = np.diag(y_internal) - b_ib @ b_bb_inv_bi
+        self.F = b_bb_inv_bi.T   # = B_ib·B_bb⁻¹ (n, N) คอลัมน์รวมเป็น -1
+
+        omega_s = 2 * np.pi * base_freq
+        m_inv = 1.0 / self.M; eye = np.eye(n); zero = np.zeros((n, n))
+        self.A = np.block([
+            [zero, -m_inv[:, None] * self.K, np.diag(m_inv)],
+            [omega_s * eye, zero, zero],
+            [-np.diag(self.G / self.Tg), zero, -np.diag(1.0 / self.Tg)],
+        ])
+        # ΔP_L (pu ต่อบัส) -> dΔω/dt
+        self.B = np.vstack([m_inv[:, None] * self.F, np.zeros((2 * n, len(b_bus)))])
+        self._modes = None
+
+    @property
+    def num_machines(self) -> int:
+        return len(self.M)
+
+    def _modal(self) -> tuple:
+        """eigenvalue และ eigenvector ของ A (คำนวณครั้งแรกที่ใช้) หรือ None ถ้า eigenvector ใกล้ singular"""
+        if self._modes is None:
+            eigenvalues, vectors = np.linalg.eig(self.A)
+            self._modes = ((eigenvalues, vectors, np.linalg.inv(vectors))
+                           if np.linalg.cond(vectors) < MAX_MODAL_CONDITION else False)
+        return self._modes or None
+
+    def response(self, time_s, disturbance_mw, per_machine: bool = False, method: str = 'modal') -> dict:
+        """
+        การตอบสนองต่อ step ของกำลังที่ขาดที่ t = 0 จากสภาวะสมดุล
+        disturbance_mw (batch, N) MW ต่อบัส (หรือ (N,) หนึ่งเหตุการณ์) time_s (T,) ต้องเริ่มที่ 0 และห่างเท่ากันสำหรับ 'expm'
+        คืนค่า coi_frequency_hz (batch, T) ความถี่ของจุดศูนย์กลางความเฉื่อย
+        และ machine_frequency_hz (batch, n, T) ถ้า per_machine
+        """
+        if method not in RESPONSE_METHODS:
+            raise ValueError(f"Unknown response method '{method}' (expected one of {RESPONSE_METHODS}).")
+        t = np.asarray(time_s, dtype=float)
+        disturbance = np.atleast_2d(np.asarray(disturbance_mw, dtype=float)) / self.base_mva
+        forcing = disturbance @ self.B.T   # (batch, 3n)
+        n = self.num_machines
+        coi = self.M / self.M.sum()
+        outputs = np.vstack([coi, np.eye(n)]) if per_machine else coi[None, :]   # (outputs, n) ของ Δω
+
+        modes = self._modal() if method == 'modal' else None
+        if modes is not None:
+            eigenvalues, vectors, vectors_inv = modes
+            # x(t) = V·φ(Λ, t)·V⁻¹·B·u, φ(λ, t) = (e^{λt} - 1) / λ (= t เมื่อ λ = 0)
+            small = np.abs(eigenvalues) < 1e-12
+            safe = np.where(small, 1.0, eigenvalues)
+            phi = np.where(small[:, None], t[None, :], np.expm1(np.outer(eigenvalues, t)) / safe[:, None])
+            weights = outputs @ vectors[:n]   # (outputs, modes)
+            coefficients = forcing @ vectors_inv.T   # (batch, modes)
+            d_omega = np.einsum('om,bm,mt->bot', weights, coefficients, phi, optimize=True).real
         else:
-            # การตอบสนองของ Droop: dPm = -1/R * dOmega
-            delta_P_m_pu = (-1 / R_eq) * (omega_pu - 1.0)
-
-        # Aggregate Swing Equation: d(omega)/dt = (1 / 2H) * (dPm - dPe)
-        d_omega_dt = (1 / (2 * H_eq)) * (delta_P_m_pu - delta_P_L_pu)
-        
-        # Update state for next step
-        omega_pu += d_omega_dt * dt
-        frequency_hz = omega_pu * base_freq
-        
-        results.append({'time_s': t, 'frequency_hz': frequency_hz})
-        
-    return pd.DataFrame(results)
\ No newline at end of file
+            d_omega = self._expm_response(t, forcing, outputs)
+        frequency = (1.0 + d_omega) * self.base_freq
+        result = {'time_s': t, 'coi_frequency_hz': frequency[:, 0]}
+        if per_machine: result['machine_frequency_hz'] = frequency[:, 1:]
+        return result
+
+    def _expm_response(self, t: np.ndarray, forcing: np.ndarray, outputs: np.ndarray) -> np.ndarray:
+        """ก้าวแบบ zero-order hold: x[k+1] = Φ·x[k] + Γ·B·u โดย [Φ Γ] จาก expm ของ [[A, I], [0, 0]]·dt"""
+        size = len(self.A)
+        dt = t[1] - t[0] if len(t) > 1 else 0.0
+        augmented = np.zeros((2 * size, 2 * size))
+        augmented[:size, :size] = self.A; augmented[:size, size:] = np.eye(size)
+        transition = expm(augmented * dt)
+        phi_t = transition[:size, :size].T; step = forcing @ transition[:size, size:].T
+        n = self.num_machines
+        d_omega = np.zeros((len(forcing), len(outputs), len(t)))
+        state = np.zeros_like(forcing)
+        for k in range(1, len(t)):
+            state = state @ phi_t + step
+            d_omega[:, :, k] = state[:, :n] @ outputs.T
+        return d_omega
+
+
+def batch_frequency_response(power_imbalance_pu, H_eq, R_eq, governor_t=DEFAULT_GOVERNOR_T,
+                             base_freq: float = 50.0, duration_s: float = 20.0, dt: float = 0.01,
+                             trajectories: bool = False) -> dict:
+    """
+    การตอบสนองความถี่ของหลายกรณีพร้อมกันตามแกน batch: Aggregate Swing Equation + governor lag อันดับหนึ่ง
+        2H dΔω/dt = ΔPm - ΔP_L,   Tg dΔPm/dt = -ΔPm - Δω/R
+    power_imbalance_pu, H_eq, R_eq (R = inf คือไม่มี droop), governor_t broadcast เป็นรูปเดียวกัน (batch)
+    แต่ละกรณี discretize แบบ zero-order hold ด้วย expm ของ matrix 3x3 แล้วก้าวทุกกรณีพร้อมกัน
+    คืนค่า (รูปเดียวกับ batch):
+        nadir_hz, time_to_nadir_s  ความถี่ต่ำสุดในช่วง duration_s (ประมาณระหว่างจุดด้วย parabola)
+        rocof_hz_s                 df/dt ที่ t = 0+ (= -ΔP_L·f_base / 2H)
+        settling_hz                ความถี่คงตัวตาม droop (NaN ถ้าไม่มี droop)
+        nadir_reached              False ถ้าความถี่ยังลดลงอยู่ที่ปลายช่วง
+    และ frequency_hz (batch..., T) ถ้า trajectories
+    """
+    imbalance, H, R, Tg = np.broadcast_arrays(*(np.asarray(value, dtype=float) for value in
+                                                 (power_imbalance_pu, H_eq, R_eq, governor_t)))
+    shape = imbalance.shape
+    imbalance, H, R, Tg = (value.ravel() for value in (imbalance, H, R, Tg))
+    gain = np.divide(1.0, R, out=np.zeros_like(R), where=np.isfinite(R) & (R > 0))
+
+    # [[A, b], [0, 0]]·dt ของ state (Δω, ΔPm) และ input คงที่
+    augmented = np.zeros((len(H), 3, 3))
+    augmented[:, 0, 1] = 1.0 / (2 * H); augmented[:, 0, 2] = -imbalance / (2 * H)
+    augmented[:, 1, 0] = -gain / Tg; augmented[:, 1, 1] = -1.0 / Tg
+    transition = expm(augmented * dt)
+
+    num_steps = int(round(duration_s / dt)) + 1
+    scans = [_scan_nadir(transition[block], num_steps, trajectories)
+             for block in (slice(start, start + BATCH_BLOCK) for start in range(0, len(H), BATCH_BLOCK))]
+    minimum, k_min, before, after = (np.concatenate([scan[i] for scan in scans]) if scans else np.zeros(0)
+                                     for i in range(4))
+    k_min = k_min.astype(int)
+    frequency = np.concatenate([scan[4] for scan in scans] or [np.zeros((0, num_steps))]) if trajectories else None
+
+    # ปรับจุดต่ำสุดด้วย parabola ผ่าน 3 จุดรอบ k_min (เฉพาะที่มีจุดทั้งสองข้าง)
+    reached = (k_min > 0) & (k_min < num_steps - 1)
+    curvature = np.where(reached, before - 2 * minimum + after, 1.0)
+    offset = np.where(reached & (curvature > 0), 0.5 * (before - after) / curvature, 0.0)
+    nadir = minimum - 0.25 * (before - after) * offset
+    with np.errstate(divide='ignore', invalid='ignore'):
+        settling = np.where(gain > 0, 1.0 - imbalance / gain, np.nan)
+
+    result = {
+        'nadir_hz': ((1.0 + nadir) * base_freq).reshape(shape),
+        'time_to_nadir_s': ((k_min + offset) * dt).reshape(shape),
+        'rocof_hz_s': (-imbalance / (2 * H) * base_freq).reshape(shape),
+        'settling_hz': (settling * base_freq).reshape(shape),
+        'nadir_reached': reached.reshape(shape),
+    }
+    if trajectories: result['frequency_hz'] = ((1.0 + frequency) * base_freq).reshape(shape + (num_steps,))
+    return result
+
+
+def _scan_nadir(transition: np.ndarray, num_steps: int, trajectories: bool) -> tuple:
+    """ก้าว Δω ของหนึ่ง block (transition (b, 3, 3)) แล้วคืนค่า (Δω ต่ำสุด, step ของจุดต่ำสุด, ค่าก่อน, ค่าหลัง, trajectory)"""
+    (p00, p01, g0), (p10, p11, g1) = transition[:, 0].T, transition[:, 1].T
+    size = len(transition)
+    omega = np.zeros(size); pm = np.zeros(size)
+    minimum = np.zeros(size); k_min = np.zeros(size)
+    before = np.zeros(size); after = np.zeros(size)
+    frequency = np.zeros((size, num_steps)) if trajectories else None
+    for k in range(1, num_steps):
+        previous = omega
+        omega, pm = p00 * omega + p01 * pm + g0, p10 * previous + p11 * pm + g1
+        # ค่าหลังจุดต่ำสุดเดิม แล้วจึงอัปเดตจุดต่ำสุดใหม่
+        np.copyto(after, omega, where=k_min == k - 1)
+        lower = omega < minimum
+        np.copyto(before, previous, where=lower); np.copyto(k_min, k, where=lower)
+        np.minimum(minimum, omega, out=minimum)
+        if trajectories: frequency[:, k] = omega
+    return minimum, k_min, before, after, frequency
+
+
+def frequency_response_grid(imbalance_mw, inertia_h, droop_r, base_mva: float, governor_t=DEFAULT_GOVERNOR_T,
+                            base_freq: float = 50.0, duration_s: float = 20.0, dt: float = 0.01) -> pd.DataFrame:
+    """
+    nadir / RoCoF / ความถี่คงตัว / เวลาถึง nadir ของทุกคู่ (imbalance MW, H_eq s, R_eq pu, Tg s)
+    บนฐาน base_mva หนึ่งแถวต่อกรณี (ผลคูณคาร์ทีเซียนของค่าที่ให้) แก้พร้อมกันด้วย batch_frequency_response
+    """
+    grid = np.meshgrid(*(np.atleast_1d(np.asarray(value, dtype=float))
+                         for value in (imbalance_mw, inertia_h, droop_r, governor_t)), indexing='ij')
+    imbalance, H, R, Tg = (value.ravel() for value in grid)
+    response = batch_frequency_response(imbalance / base_mva, H, R, Tg, base_freq, duration_s, dt)
+    return pd.DataFrame({'imbalance_mw': imbalance, 'inertia_h': H, 'droop_r': R, 'governor_t': Tg, **response})
+
+
+# ขนาดของ NadirTable: จำนวนจุดของแกน imbalance (0..Pmax รวม) และแกน inertia รวม (เครื่องเล็กสุด..ทุกเครื่อง)
+NADIR_TABLE_IMBALANCE_POINTS = 33
+NADIR_TABLE_INERTIA_POINTS = 17
+# จำนวน NadirTable (ตามชุดเครื่องกำเนิด) ที่เก็บไว้ก่อนทิ้งตารางที่ใช้ล่าสุดนานที่สุด
+NADIR_TABLE_CACHE = 32
+
+class NadirTable:
+    """
+    ตาราง nadir และ RoCoF ของ batch_frequency_response บน grid imbalance (MW) x inertia รวม H_eq (s)
+    ที่ droop R_eq (pu) และ governor lag Tg ของชุดเครื่องหนึ่งชุด จำลองครั้งเดียวตอนสร้าง
+    แล้วเปิดตารางแบบ bilinear (แกนระยะห่างเท่ากัน จึงเป็น O(1) ต่อค่าโดยไม่ต้องจำลองใหม่)
+    แกน inertia ห่างเท่ากันตาม 1/H (RoCoF แปรตาม 1/H ตรงตัว)
+    inertia นอกช่วงใช้ค่าที่ขอบ, imbalance เกินช่วงต่อเส้นตรงจากช่วงสุดท้าย (model เชิงเส้น: nadir แปรตาม imbalance)
+    """
+    def __init__(self, max_imbalance_mw: float, inertia_range: tuple, R_eq: float, governor_t: float,
+                 base_mva: float, base_freq: float = 50.0, duration_s: float = 20.0, dt: float = 0.01):
+        self.base_freq = base_freq
+        self.imbalance_mw = np.linspace(0.0, max_imbalance_mw, NADIR_TABLE_IMBALANCE_POINTS)
+        self.inverse_h = np.linspace(1.0 / inertia_range[1], 1.0 / inertia_range[0], NADIR_TABLE_INERTIA_POINTS)
+        self.inertia_h = 1.0 / self.inverse_h
+        response = batch_frequency_response(self.imbalance_mw[:, None] / base_mva, self.inertia_h[None, :],
+                                            R_eq, governor_t, base_freq, duration_s, dt)
+        self.nadir = response['nadir_hz']; self.rocof = response['rocof_hz_s']
+
+    def nadir_hz(self, imbalance_mw, inertia_h=None) -> np.ndarray:
+        """nadir (Hz) ของ imbalance (MW) รูปใดก็ได้ ที่ inertia_h (ค่าเริ่มต้น = ทุกเครื่อง online)"""
+        return self._lookup(self.nadir, imbalance_mw, inertia_h)
+
+    def rocof_hz_s(self, imbalance_mw, inertia_h=None) -> np.ndarray:
+        """RoCoF (Hz/s) ที่ t = 0+ ของ imbalance (MW) ที่ inertia_h"""
+        return self._lookup(self.rocof, imbalance_mw, inertia_h)
+
+    def max_imbalance_mw(self, freq_threshold: float, inertia_h=None) -> float:
+        """imbalance (MW) มากที่สุดที่ nadir ไม่ต่ำกว่า freq_threshold (nadir ลดลงตาม imbalance)"""
+        nadir = self._lookup(self.nadir, self.imbalance_mw, inertia_h)
+        if nadir[0] < freq_threshold: return 0.0
+        below = np.flatnonzero(nadir < freq_threshold)
+        # ไม่ถึง threshold ภายในตาราง: ต่อเส้นตรงจากช่วงสุดท้าย
+        k = below[0] if below.size else len(nadir) - 1
+        slope = (nadir[k] - nadir[k - 1]) / (self.imbalance_mw[k] - self.imbalance_mw[k - 1])
+        if slope >= 0: return np.inf
+        return self.imbalance_mw[k - 1] + (freq_threshold - nadir[k - 1]) / slope
+
+    def _lookup(self, table: np.ndarray, imbalance_mw, inertia_h) -> np.ndarray:
+        """bilinear interpolation บน table (imbalance, inertia)"""
+        inverse_h = self.inverse_h[0] if inertia_h is None else 1.0 / np.asarray(inertia_h, dtype=float)
+        i, wi = _grid_position(self.imbalance_mw, imbalance_mw, clip=False)
+        h, wh = _grid_position(self.inverse_h, inverse_h, clip=True)
+        low = table[i, h] + (table[i, h + 1] - table[i, h]) * wh
+        high = table[i + 1, h] + (table[i + 1, h + 1] - table[i + 1, h]) * wh
+        return low + (high - low) * wi
+
+
+def _grid_position(axis: np.ndarray, value, clip: bool) -> tuple:
+    """ตำแหน่งช่วง (index, น้ำหนัก) ของ value บนแกนที่ระยะห่างเท่ากัน (clip = False ต่อเส้นตรงจากช่วงขอบ)"""
+    span = axis[-1] - axis[0]
+    scaled = (np.asarray(value, dtype=float) - axis[0]) / span * (len(axis) - 1) if span > 0 else np.zeros(np.shape(value))
+    if clip: scaled = np.clip(scaled, 0.0, len(axis) - 1)
+    index = np.clip(np.floor(scaled).astype(int), 0, len(axis) - 2)
+    return index, scaled - index
+
+
+def nadir_table(online_generators: pd.DataFrame, R_sys_hz_mw: float, base_mva: float, base_freq: float = 50.0,
+                governor_t: float = DEFAULT_GOVERNOR_T) -> NadirTable:
+    """
+    NadirTable ของชุดเครื่องที่ online (สร้างครั้งเดียวต่อชุดเครื่องแล้วเก็บไว้ใน cache)
+    droop รวมตาม R_sys_hz_mw (ความถี่คงตัวจึงตรงกับ islanded_frequency), H_eq จาก aggregate_parameters,
+    Tg = ค่าเฉลี่ยถ่วง Pmax ของ Governor_T (ไม่มีคอลัมน์ใช้ governor_t)
+    แกน inertia ครอบคลุม H ของเครื่องเล็กสุดเครื่องเดียวถึงทุกเครื่อง online
+    """
+    generators = online_generators[(online_generators['Pmax_MW'] > 0) & (online_generators['Inertia_H'] > 0)]
+    if generators.empty: raise ValueError("No generator with inertia to build the nadir table.")
+    pmax = generators['Pmax_MW'].to_numpy(dtype=float)
+    unit_h = generators['Inertia_H'].to_numpy(dtype=float) * pmax / base_mva
+    Tg = (generators['Governor_T'].fillna(governor_t).to_numpy(dtype=float) if 'Governor_T' in generators
+          else np.full(len(generators), float(governor_t)))
+    R_eq = R_sys_hz_mw * base_mva / base_freq if R_sys_hz_mw > 0 else np.inf
+    return _cached_nadir_table(float(pmax.sum()), float(unit_h.min()), float(unit_h.sum()), float(R_eq),
+                               float(Tg @ pmax / pmax.sum()), float(base_mva), float(base_freq))
+
+
+@functools.lru_cache(maxsize=NADIR_TABLE_CACHE)
+def _cached_nadir_table(max_imbalance_mw, min_h, total_h, R_eq, governor_t, base_mva, base_freq) -> NadirTable:
+    return NadirTable(max_imbalance_mw, (min_h, total_h), R_eq, governor_t, base_mva, base_freq)
+
+
+class UFLSStage:
+    """ขั้นของ UFLS: ความถี่ต่ำกว่า freq_hz แล้วตัดโหลด shed_mw หลังหน่วงเวลา delay_s (relay + breaker) ครั้งเดียว"""
+    def __init__(self, freq_hz: float, shed_mw: float, delay_s: float = 0.0):
+        self.freq_hz = float(freq_hz); self.shed_mw = float(shed_mw); self.delay_s = float(delay_s)
+
+
+def event_driven_response(power_imbalance_mw: float, H_eq: float, R_eq: float, base_mva: float,
+                          base_freq: float = 50.0, governor_t: float = DEFAULT_GOVERNOR_T, stages=(),
+                          rocof_limit_hz_s: float = None, duration_s: float = 10.0, sample_dt: float = None,
+                          initial_state=None, setpoint_mw: float = 0.0, setpoint_t: float = 0.0,
+                          rtol: float = 1e-6, atol: float = 1e-9) -> dict:
+    """
+    จำลอง Aggregate Swing Equation + governor lag (model เดียวกับ batch_frequency_response) ด้วย solve_ivp แบบก้าวปรับได้
+    และตรวจจับเหตุการณ์ระหว่างก้าว (ไม่ต้องก้าวคงที่ทีละ dt):
+        ufls_pickup  ความถี่ลดผ่าน freq_hz ของ stage (UFLSStage) -> ตัดโหลดที่เวลา + delay_s
+        ufls_shed    ตัดโหลดของ stage: imbalance ลดลง shed_mw แล้วจำลองต่อจาก state เดิม
+        nadir        dΔω/dt เปลี่ยนจากลบเป็นบวกที่ความถี่ต่ำกว่าทุกจุดก่อนหน้า
+        rocof_limit / rocof_recovered  |df/dt| เกิน / กลับต่ำกว่า rocof_limit_hz_s
+    initial_state = (Δω, ΔPm) pu ที่ t = 0 (ค่าเริ่มต้น 0 คือเริ่มจากความถี่ปกติ)
+    setpoint_mw = กำลังสำรองที่ setpoint ของ governor เพิ่มได้ (เช่น redispatch ของ DG หลัง islanding): setpoint เข้าหา
+    imbalance ปัจจุบัน (หลัง UFLS) แต่ไม่เกิน setpoint_mw แบบ first-order ด้วยค่าคงตัวเวลา setpoint_t (0 = ทันที)
+    ความถี่คงตัวจึงเป็น f0 - R_eq * max(0, imbalance - setpoint_mw) (ค่าเริ่มต้น 0 = droop อย่างเดียว)
+    คืนค่า time_s, frequency_hz (จุดของ solver หรือทุก sample_dt จาก dense output), events (DataFrame),
+    nadir_hz, time_to_nadir_s, shed_mw รวม และ nfev จำนวนครั้งที่ประเมินสมการ
+    """
+    two_h = 2.0 * H_eq
+    gain = 1.0 / R_eq if np.isfinite(R_eq) and R_eq > 0 else 0.0
+    stages = sorted(stages, key=lambda stage: -stage.freq_hz)
+    imbalance = power_imbalance_mw / base_mva
+    setpoint = setpoint_mw / base_mva
+    pending = []        # (เวลาตัด, stage) ที่ pickup แล้ว
+    armed = list(stages)
+    events = []; times = []; states = []; solutions = []
+    nfev = 0; t = 0.0
+    y = np.zeros(2) if initial_state is None else np.asarray(initial_state, dtype=float); lowest = y[0]
+
+    def rocof(state, load):
+        return (state[1] - load) / two_h * base_freq
+
+    def record(kind, time_s, state, stage=None, shed=0.0):
+        events.append({'time_s': time_s, 'event': kind, 'frequency_hz': (1.0 + state[0]) * base_freq,
+                       'rocof_hz_s': rocof(state, imbalance), 'stage_hz': stage.freq_hz if stage else np.nan,
+                       'shed_mw': shed, 'imbalance_mw': imbalance * base_mva})
+
+    exceeded = False
+    while t < duration_s:
+        if rocof_limit_hz_s is not None and (abs(rocof(y, imbalance)) > rocof_limit_hz_s) != exceeded:
+            exceeded = not exceeded
+            record('rocof_limit' if exceeded else 'rocof_recovered', t, y)
+        load = imbalance
+        t_stop = min([duration_s] + [time for time, _ in pending])
+
+        target = min(max(load, 0.0), setpoint)
+        def rhs(time_s, state):
+            reference = target * -np.expm1(-time_s / setpoint_t) if setpoint_t > 0 else target
+            return [(state[1] - load) / two_h, (reference - state[1] - gain * state[0]) / governor_t]
+        crossings = []
+        for stage in armed:
+            crossing = lambda _, state, stage=stage: (1.0 + state[0]) * base_freq - stage.freq_hz
+            crossing.terminal = True; crossing.direction = -1
+            crossings.append(crossing)
+        nadir = lambda _, state: state[1] - load
+        nadir.direction = 1
+        monitors = [nadir]
+        if rocof_limit_hz_s is not None:
+            limit = lambda _, state: abs(state[1] - load) / two_h * base_freq - rocof_limit_hz_s
+            monitors.append(limit)
+
+        solution = solve_ivp(rhs, (t, t_stop), y, method='RK45', events=crossings + monitors, rtol=rtol, atol=atol,
+                             dense_output=sample_dt is not None)
+        nfev += solution.nfev
+        times.append(solution.t); states.append(solution.y); solutions.append(solution)
+        # nadir: จุดต่ำสุดเฉพาะที่ต่ำกว่าทุกจุดก่อนหน้า (ไม่นับการแกว่งรอบความถี่คงตัว)
+        for time_s, state in zip(solution.t_events[len(crossings)], solution.y_events[len(crossings)]):
+            if state[0] <= min(lowest, solution.y[0, solution.t <= time_s].min()):
+                record('nadir', time_s, state); lowest = state[0]
+        lowest = min(lowest, solution.y[0].min())
+        if rocof_limit_hz_s is not None:
+            for time_s, state in zip(solution.t_events[-1], solution.y_events[-1]):
+                exceeded = not exceeded
+                record('rocof_limit' if exceeded else 'rocof_recovered', time_s, state)
+        t = solution.t[-1]; y = solution.y[:, -1]
+
+        # pickup ของ stage ที่ความถี่ลดผ่าน (solver หยุดที่ event แรก)
+        for stage, hits in zip(list(armed), solution.t_events[:len(crossings)]):
+            if len(hits):
+                armed.remove(stage); pending.append((t + stage.delay_s, stage))
+                record('ufls_pickup', t, y, stage)
+        # ตัดโหลดของ stage ที่ครบเวลาหน่วง แล้วจำลองต่อด้วย imbalance ใหม่
+        for time_s, stage in [item for item in pending if item[0] <= t]:
+            pending.remove((time_s, stage))
+            imbalance -= stage.shed_mw / base_mva
+            record('ufls_shed', t, y, stage, stage.shed_mw)
+        if solution.status == -1: raise RuntimeError(f"Event-driven integration failed: {solution.message}")
+
+    time_s = np.concatenate(times); d_omega = np.concatenate(states, axis=1)[0]
+    if sample_dt is not None:
+        time_s = np.arange(0.0, duration_s + 0.5 * sample_dt, sample_dt)
+        d_omega = np.empty(len(time_s))
+        for solution in solutions:
+            inside = (time_s >= solution.t[0]) & (time_s <= solution.t[-1])
+            if not inside.any(): continue   # ช่วงสั้นกว่า sample_dt (ระหว่าง event ที่ติดกัน) ไม่มีจุดให้เก็บ
+            d_omega[inside] = solution.sol(time_s[inside])[0]
+    events = pd.DataFrame(events, columns=['time_s', 'event', 'frequency_hz', 'rocof_hz_s', 'stage_hz', 'shed_mw',
+                                           'imbalance_mw'])
+    events = events.sort_values('time_s', kind='stable', ignore_index=True)
+    frequency_hz = (1.0 + d_omega) * base_freq
+    # nadir จาก event (ตำแหน่งแม่นตรง) หรือจุดต่ำสุดของผลถ้าความถี่ยังลดลงที่ปลายช่วง
+    nadir_rows = events[events['event'] == 'nadir']
+    candidate_t = np.concatenate([nadir_rows['time_s'].to_numpy(), time_s])
+    candidate_f = np.concatenate([nadir_rows['frequency_hz'].to_numpy(), frequency_hz])
+    lowest = np.argmin(candidate_f)
+    return {
+        'time_s': time_s, 'frequency_hz': frequency_hz, 'events': events, 'nadir_hz': candidate_f[lowest],
+        'time_to_nadir_s': candidate_t[lowest], 'shed_mw': events['shed_mw'].sum(), 'nfev': nfev,
+    }
@@ -0,0 +1,274 @@
+# simulation/islanding.py
+
+import numpy as np
+import pandas as pd
+from .newtonrapson_loadflow import run_newton_raphson_batch, bus_incidence
+from .ybus_builder import build_ybus
+from .dispatch import islanded_dispatch
+from .time_axis import TimeAxis
+
+# จำนวน step ที่แก้ Load Flow พร้อมกันต่อ block
+BLOCK_STEPS = 2048
+# ความถี่ที่เริ่มตัดโหลด (Hz) ค่าเริ่มต้นของ FrequencyThreshold ใน system_config.csv
+FREQ_THRESHOLD = 49.7
+# คอลัมน์ผลราย step ของ use case load shedding
+STEP_RESULT_COLUMNS = ('pd_loads', 'qd_loads', 'load_before', 'load_after', 'freq_before', 'freq_after',
+                       'gen_total', 'dg_pg', 'mw_shed')
+
+def islanding_bus_types(bus_data: pd.DataFrame, mpg_bus_id, new_slack_bus_id) -> np.ndarray:
+    """ชนิดบัสขณะ islanding: บัส MPG กลายเป็น PQ และ DG ที่ใหญ่ที่สุดเป็น slack แทน"""
+    bus_ids = bus_data['BusID'].values
+    bus_types = bus_data['Type'].to_numpy().copy()
+    bus_types[bus_ids == mpg_bus_id] = 3
+    bus_types[bus_ids == new_slack_bus_id] = 1
+    return bus_types
+
+
+class IslandingTopology:
+    """
+    สถานะของระบบก่อนและหลังตัด MPG ที่คำนวณไว้ครั้งเดียว (แทนการ copy และแก้ DataFrame ทุก step)
+    - ชนิดบัสของทั้งสองโหมดและตำแหน่ง slack
+    - mask ของ MPG / DG ที่ online และ array Pmin, Pmax, Participation ของ DG
+    - Pmax รวมของไมโครกริดและ droop รวมของระบบ R_sys (Hz/MW)
+    """
+
+    def __init__(self, bus_data: pd.DataFrame, gen_data: pd.DataFrame, base_freq: float = 50.0):
+        self.bus_ids = bus_data['BusID'].values
+        self.mpg_bus_id = bus_data[bus_data['Type'] == 1]['BusID'].iloc[0]
+
+        microgrid_gens = gen_data[gen_data['BusID'] != self.mpg_bus_id]
+        if microgrid_gens.empty: raise ValueError("No microgrid generators found.")
+        self.new_slack_bus_id = microgrid_gens.loc[microgrid_gens['Pmax_MW'].idxmax()]['BusID']
+
+        self.grid_bus_types = bus_data['Type'].to_numpy()
+        self.island_bus_types = islanding_bus_types(bus_data, self.mpg_bus_id, self.new_slack_bus_id)
+
+        self.mpg_gen_mask = (gen_data['BusID'] == self.mpg_bus_id).to_numpy()
+        self.active_dg_mask = (~self.mpg_gen_mask) & (gen_data['Status'] == 1).to_numpy()
+        self.online_dg = gen_data[self.active_dg_mask]
+        self.dg_pmin = self.online_dg['Pmin_MW'].to_numpy(dtype=float)
+        self.dg_pmax = self.online_dg['Pmax_MW'].to_numpy(dtype=float)
+        self.dg_participation = self.online_dg['ParticipationFactor'].to_numpy(dtype=float)
+        self.microgrid_pmax = self.online_dg['Pmax_MW'].sum()
+        self.R_sys_hz_mw = system_droop_hz_mw(self.online_dg, base_freq)
+
+    def bus_types(self, islanded: bool) -> np.ndarray:
+        return self.island_bus_types if islanded else self.grid_bus_types
+
+    def islanded_pg(self, pg_initial: np.ndarray, dg_pg: np.ndarray) -> np.ndarray:
+        """Pg ของทุก generator ขณะ islanding (MPG = 0, DG ตาม dispatch) รับ dg_pg เป็น (G,) หรือ (T, G)"""
+        dg_pg = np.asarray(dg_pg, dtype=float)
+        pg = np.broadcast_to(np.asarray(pg_initial, dtype=float), dg_pg.shape[:-1] + (len(pg_initial),)).copy()
+        pg[..., self.active_dg_mask] = dg_pg
+        pg[..., self.mpg_gen_mask] = 0.0
+        return pg
+
+
+def system_droop_hz_mw(online_dg: pd.DataFrame, base_freq: float) -> float:
+    """droop รวมของ DG ที่ online (Hz/MW) = 1 / Σ(Pmax / (R·f_base)) ของเครื่องที่ Pmax > 0"""
+    pmax = online_dg['Pmax_MW'].to_numpy(dtype=float)
+    droop_r = online_dg['Droop_R'].to_numpy(dtype=float)
+    valid = pmax > 0
+    if not valid.any(): return 0
+    inv_r_sum_hz_mw = (1 / ((droop_r[valid] * base_freq) / pmax[valid])).sum()
+    return 1 / inv_r_sum_hz_mw if inv_r_sum_hz_mw > 0 else 0
+
+
+def solve_islanding_series(result_store, time_axis, bus_data: pd.DataFrame, y_bus: np.ndarray,
+                           gen_data: pd.DataFrame, load_data: pd.DataFrame,
+                           pg_gens: np.ndarray, pd_loads: np.ndarray, qd_loads: np.ndarray,
+                           frequency_hz: np.ndarray, is_islanding: np.ndarray, topology: IslandingTopology,
+                           base_mva: float = 100.0, clamp_slack: bool = False, cache=None) -> np.ndarray:
+    """
+    แก้ Load Flow ของทั้ง time series ทีละ block แล้วบันทึกลง result_store
+    - pg_gens (steps, generators), pd_loads/qd_loads (steps, loads): กำลังของแต่ละ step หลัง dispatch/shedding
+    - step ก่อนและหลัง islanding ใช้ชนิดบัสต่างกัน (จาก topology) จึงแยกแก้ตามโหมดภายในแต่ละ block
+    - clamp_slack: จำกัด Pg ของ slack bus ไม่เกิน Pmax ของ generator ที่บัสนั้น
+    - cache: SolutionCache (ถ้ามี) ใช้ร่วมกันทั้งสองโหมดได้เพราะ key รวมชนิดบัสไว้แล้ว
+    ถ้ามี step ใดไม่ลู่เข้าจะหยุดทันที (RuntimeError) โดยผลของ block ก่อนหน้าถูกบันทึกไว้แล้ว
+    คืนค่า Pg_final รวมของแต่ละ step (steps,)
+    """
+    bus_ids = bus_data['BusID'].values
+    load_incidence = bus_incidence(load_data['BusID'].values, bus_ids)
+    gen_incidence = bus_incidence(gen_data['BusID'].values, bus_ids)
+    qg_bus = gen_data['Qg_MVAR'].to_numpy(dtype=float) @ gen_incidence
+
+    num_steps = len(pg_gens)
+    total_pg = np.full(num_steps, np.nan)
+    block_steps = result_store.writer.chunk_steps if result_store.writer is not None else BLOCK_STEPS
+    for start in range(0, num_steps, block_steps):
+        block = np.arange(start, min(start + block_steps, num_steps))
+        for islanded in (False, True):
+            bus_types = topology.bus_types(islanded)
+            steps = block[is_islanding[block] == islanded]
+            if steps.size == 0: continue
+            solution = run_newton_raphson_batch(
+                bus_data, y_bus, pg_gens[steps] @ gen_incidence, qg_bus,
+                pd_loads[steps] @ load_incidence, qd_loads[steps] @ load_incidence,
+                base_mva, bus_types=bus_types, cache=cache
+            )
+            if not solution['converged'].all():
+                i = steps[np.argmin(solution['converged'])]
+                raise RuntimeError(f"NR Converge Failed at step {i} ({time_axis.label(i)})")
+
+            if clamp_slack:
+                slack_pos = np.flatnonzero(bus_types == 1)[0]
+                gen_at_slack = gen_data[gen_data['BusID'] == bus_ids[slack_pos]]
+                if not gen_at_slack.empty:
+                    pg_final = solution['Pg_final_MW']
+                    pg_final[:, slack_pos] = np.minimum(pg_final[:, slack_pos], gen_at_slack['Pmax_MW'].iloc[0])
+            total_pg[steps] = solution['Pg_final_MW'].sum(axis=1)
+            result_store.record_block(steps[0], frequency_hz[steps], bus_types=bus_types,
+                                      **{col: solution[col] for col in result_store.RESULT_COLUMNS})
+    return total_pg
+
+
+def prepare_islanding_study(system_data: dict) -> dict:
+    """
+    ข้อมูลที่ use case MPG disconnection ใช้ร่วมกันและไม่ขึ้นกับเวลาที่ตัด MPG
+    (แกนเวลา, Y-bus, topology ทั้งสองโหมด, load ของทุก step และ islanded dispatch ก่อน shedding)
+    """
+    config = system_data.get('config', {})
+    time_axis = TimeAxis.from_system_data(system_data)
+    load_profile = time_axis.profile(system_data['load_profile'], 'pattern_1')
+    base_freq = config.get('BaseFrequency', 50.0)
+    buses = system_data['buses']; initial_gens = system_data['generators']; initial_loads = system_data['loads']
+    topology = IslandingTopology(buses, initial_gens, base_freq)
+
+    study = {
+        'config': config, 'time_axis': time_axis, 'num_steps': time_axis.num_steps,
+        'time_index': time_axis.index, 'base_mva': config.get('BaseMVA', 100.0), 'base_freq': base_freq,
+        'freq_threshold': float(config.get('FrequencyThreshold', FREQ_THRESHOLD)),
+        'buses': buses, 'generators': initial_gens, 'loads': initial_loads, 'lines': system_data['lines'],
+        'ybus': build_ybus(buses, system_data['lines']), 'topology': topology,
+    }
+    study.update(_load_schedules(study, load_profile))
+    return study
+
+
+def scale_study_loads(study: dict, multiplier) -> dict:
+    """สำเนาของ study ที่คูณ load ของทุก step ด้วย multiplier (scalar หรือ (T,)) พร้อม islanded dispatch ใหม่"""
+    scaled = dict(study)
+    scaled.update(_load_schedules(study, study['load_profile'] * np.asarray(multiplier, dtype=float)))
+    return scaled
+
+
+def set_generator_droop(study: dict, droop_r: np.ndarray) -> dict:
+    """
+    สำเนาของ study ที่ใช้ Droop_R (pu) ของเครื่องกำเนิดตาม droop_r (เรียงตาม generator_data)
+    พร้อม topology (droop รวม) และ islanded dispatch ใหม่ ส่วน Y-bus และ load ใช้ร่วมกับ study เดิม
+    """
+    retuned = dict(study)
+    generators = study['generators'].copy()
+    generators['Droop_R'] = np.asarray(droop_r, dtype=float)
+    retuned['generators'] = generators
+    retuned['topology'] = IslandingTopology(study['buses'], generators, study['base_freq'])
+    retuned.update(_load_schedules(retuned, study['load_profile']))
+    return retuned
+
+
+def _load_schedules(study: dict, load_profile: np.ndarray) -> dict:
+    """load ของทุก step และ islanded dispatch ก่อน shedding ตาม load_profile (T,)"""
+    loads = study['loads']; topology = study['topology']
+    pd_base = load_profile[:, None] * loads['Pd_MW'].to_numpy(dtype=float)
+    qd_base = load_profile[:, None] * loads['Qd_MVAR'].to_numpy(dtype=float)
+    dg_pg_schedule, total_pg_schedule, imbalance_schedule, freq_schedule = islanded_dispatch(
+        pd_base.sum(axis=1), topology.dg_pmin, topology.dg_pmax, topology.dg_participation,
+        topology.microgrid_pmax, topology.R_sys_hz_mw, study['base_freq']
+    )
+    return {
+        'load_profile': load_profile, 'pd_base': pd_base, 'qd_base': qd_base,
+        'dg_pg_schedule': dg_pg_schedule, 'total_pg_schedule': total_pg_schedule,
+        'imbalance_schedule': imbalance_schedule, 'freq_schedule': freq_schedule,
+    }
+
+
+def islanded_step_results(study: dict, steps: np.ndarray) -> dict:
+    """ผลราย step เริ่มต้น (ก่อน shedding) ของ step ที่ระบุ ตาม islanded dispatch"""
+    steps = np.asarray(steps, dtype=int)
+    pd_loads = study['pd_base'][steps].copy()
+    load_before = pd_loads.sum(axis=1)
+    return {
+        'steps': steps, 'pd_loads': pd_loads, 'qd_loads': study['qd_base'][steps].copy(),
+        'load_before': load_before, 'load_after': load_before.copy(),
+        'freq_before': study['freq_schedule'][steps].copy(), 'freq_after': study['freq_schedule'][steps].copy(),
+        'gen_total': study['total_pg_schedule'][steps].copy(), 'dg_pg': study['dg_pg_schedule'][steps].copy(),
+        'mw_shed': np.zeros(len(steps)), 'shed_log': [],
+    }
+
+
+def merge_step_results(target: dict, part: dict):
+    """แทนค่าของ step ใน part ลงใน target (ผลของทั้ง time series)"""
+    positions = np.searchsorted(target['steps'], part['steps'])
+    for col in STEP_RESULT_COLUMNS:
+        target[col][positions] = part[col]
+    target['shed_log'].extend(part['shed_log'])
+
+
+def min_voltage_series(study: dict, pg_gens: np.ndarray, pd_loads: np.ndarray, qd_loads: np.ndarray,
+                       islanded: bool) -> np.ndarray:
+    """แรงดันต่ำสุดของแต่ละแถว (steps,) จาก Load Flow ของโหมดที่ระบุ (NaN ถ้าไม่ลู่เข้า)"""
+    if len(pg_gens) == 0: return np.empty(0)
+    buses = study['buses']; gens = study['generators']; loads = study['loads']
+    bus_ids = buses['BusID'].values
+    gen_incidence = bus_incidence(gens['BusID'].values, bus_ids)
+    load_incidence = bus_incidence(loads['BusID'].values, bus_ids)
+    solution = run_newton_raphson_batch(
+        buses, study['ybus'], pg_gens @ gen_incidence, gens['Qg_MVAR'].to_numpy(dtype=float) @ gen_incidence,
+        pd_loads @ load_incidence, qd_loads @ load_incidence, study['base_mva'],
+        bus_types=study['topology'].bus_types(islanded)
+    )
+    return np.where(solution['converged'], solution['V_final_pu'].min(axis=1), np.nan)
+
+
+def grid_import_series(study: dict, pg_gens: np.ndarray, pd_loads: np.ndarray, qd_loads: np.ndarray) -> np.ndarray:
+    """กำลังที่นำเข้าจาก MPG ของแต่ละแถว (steps,) = Pg ของ slack จาก Load Flow แบบต่อกริด (NaN ถ้าไม่ลู่เข้า)"""
+    if len(pg_gens) == 0: return np.empty(0)
+    buses = study['buses']; gens = study['generators']; loads = study['loads']
+    bus_ids = buses['BusID'].values
+    gen_incidence = bus_incidence(gens['BusID'].values, bus_ids)
+    load_incidence = bus_incidence(loads['BusID'].values, bus_ids)
+    bus_types = study['topology'].bus_types(False)
+    solution = run_newton_raphson_batch(
+        buses, study['ybus'], pg_gens @ gen_incidence, gens['Qg_MVAR'].to_numpy(dtype=float) @ gen_incidence,
+        pd_loads @ load_incidence, qd_loads @ load_incidence, study['base_mva'], bus_types=bus_types
+    )
+    slack_pg = solution['Pg_final_MW'][:, np.flatnonzero(bus_types == 1)[0]]
+    return np.where(solution['converged'], slack_pg, np.nan)
+
+
+def shedding_metrics(study: dict, result: dict, with_voltage: bool = True) -> tuple:
+    """
+    ค่าสรุปของผลหลัง shedding (ผลของ shed_islanded) และ MWh ที่ตัดรายโหลด (L,)
+    with_voltage = False ข้าม Load Flow ของช่วง islanding (min_voltage_pu เป็น NaN)
+    """
+    loads = study['loads']; steps = result['steps']; step_hours = study['time_axis'].step_hours
+    # MW ที่ตัดรายโหลดของทุก step = โหลดก่อนตัด - โหลดหลังตัด
+    demand_mwh = study['pd_base'][steps].sum(axis=0) * step_hours
+    shed_mwh = (study['pd_base'][steps] - result['pd_loads']).sum(axis=0) * step_hours
+    shed_share = np.divide(shed_mwh, demand_mwh, out=np.zeros_like(shed_mwh), where=demand_mwh > 0)
+    sheddable = (loads['Status'] == 1).to_numpy() & (demand_mwh > 0)
+    # Jain's fairness index ของสัดส่วนพลังงานที่ถูกตัดของโหลดที่ตัดได้ (1 = ทุกโหลดรับภาระเท่ากัน)
+    share = shed_share[sheddable]
+    jain = share.sum() ** 2 / (len(share) * (share ** 2).sum()) if share.size and share.any() else np.nan
+
+    min_voltage = np.nan
+    if with_voltage:
+        pg_gens = study['topology'].islanded_pg(study['generators']['Pg_MW'].to_numpy(dtype=float), result['dg_pg'])
+        island_vmin = min_voltage_series(study, pg_gens, result['pd_loads'], result['qd_loads'], islanded=True)
+        min_voltage = np.fmin.reduce(island_vmin, initial=np.inf)
+    metrics = {
+        'total_mw_shed': result['mw_shed'].sum(),
+        'unserved_energy_mwh': result['mw_shed'].sum() * step_hours,
+        'peak_mw_shed': result['mw_shed'].max(initial=0.0),
+        'priority_weighted_mwh': shed_mwh @ loads['Priority'].to_numpy(dtype=float),
+        'min_freq_before_hz': np.fmin.reduce(result['freq_before'], initial=study['base_freq']),
+        'min_freq_after_hz': np.fmin.reduce(result['freq_after'], initial=study['base_freq']),
+        'shed_steps': int(np.count_nonzero(result['mw_shed'] > 0)),
+        'shed_events': len(result['shed_log']),
+        'loads_affected': int(np.count_nonzero(shed_mwh > 1e-9)),
+        'max_load_shed_pct': shed_share.max(initial=0.0) * 100,
+        'jain_fairness': jain,
+        'min_voltage_pu': min_voltage,
+    }
+    return metrics, shed_mwh
@@ -0,0 +1,149 @@
+# simulation/monte_carlo.py
+
+import numpy as np
+import pandas as pd
+from .islanding import scale_study_loads, min_voltage_series, grid_import_series
+from .frequency_response import nadir_table, DEFAULT_GOVERNOR_T
+from .parallel import chunk_bounds, map_chunks
+from .usecases.shedding_schemes import shedding_scheme
+
+# การกระจายของ load multiplier (ค่าเฉลี่ย 1, spread = ส่วนเบี่ยงเบนมาตรฐาน หรือครึ่งความกว้างของ uniform)
+LOAD_DISTRIBUTIONS = ('normal', 'uniform', 'lognormal')
+# จำนวน sample ต่อ chunk เริ่มต้น (แต่ละ chunk มี random stream ของตัวเอง)
+DEFAULT_CHUNK_SAMPLES = 64
+# ผลราย sample
+SAMPLE_COLUMNS = ('disconnection_step', 'load_multiplier_mean', 'grid_import_mw', 'freq_nadir_hz',
+                  'min_freq_before_hz', 'min_freq_after_hz', 'peak_mw_shed', 'unserved_energy_mwh', 'shed_steps',
+                  'min_voltage_pu')
+
+def monte_carlo_options(system_data: dict, time_axis) -> dict:
+    """
+    ตัวเลือก Monte Carlo จาก system_data['monte_carlo'] (dict) หรือ system_config.csv
+        MonteCarloSamples           จำนวน sample (1000)
+        RandomSeed                  seed ของ numpy (ไม่ตั้ง = สุ่ม entropy ใหม่ ซึ่งจะรายงานไว้ให้รันซ้ำได้)
+        MonteCarloScheme            วิธี shedding (normal/percentage/adaptive/optimal)
+        MonteCarloLoadDistribution  การกระจายของ load multiplier (normal/uniform/lognormal)
+        MonteCarloLoadSpread        ความกว้างของการกระจาย (0.05)
+        MonteCarloLoadPerStep       0 = multiplier เดียวทั้ง time series, 1 = สุ่มแยกทุก step
+        MonteCarloChunkSamples      จำนวน sample ต่อ chunk (64)
+        GovernorTimeConstant        governor lag (s) ของ nadir เมื่อเครื่องไม่มีคอลัมน์ Governor_T (0.5)
+    เวลาตัด MPG: Disconnecting_Time = 99 สุ่มแบบ uniform ใน random_step_range ของแกนเวลา
+    ค่าอื่นใช้ step คงที่ตาม TimeAxis.disconnection_step
+    """
+    options = system_data.get('monte_carlo') or {}
+    config = system_data.get('config', {}) or {}
+
+    def option(key, config_key, default):
+        return options.get(key, config.get(config_key, default))
+
+    distribution = str(option('load_distribution', 'MonteCarloLoadDistribution', 'normal')).lower()
+    if distribution not in LOAD_DISTRIBUTIONS:
+        raise ValueError(f"Unknown load distribution '{distribution}' (expected one of {LOAD_DISTRIBUTIONS}).")
+    spread = float(option('load_spread', 'MonteCarloLoadSpread', 0.05))
+    if spread < 0:
+        raise ValueError(f"Load spread must not be negative (got {spread}).")
+    seed = option('seed', 'RandomSeed', None)
+    seed = np.random.SeedSequence().entropy if seed is None else int(seed)
+
+    disconnection_step = options.get('disconnection_step')
+    if disconnection_step is None and float(config.get('Disconnecting_Time', 99)) != 99:
+        disconnection_step = time_axis.disconnection_step(config)
+    scheme = str(option('scheme', 'MonteCarloScheme', 'normal')).lower()
+    shedding_scheme(scheme)  # ตรวจชื่อ scheme
+    return {
+        'samples': max(1, int(option('samples', 'MonteCarloSamples', 1000))),
+        'seed': seed, 'scheme': scheme,
+        'load_distribution': distribution, 'load_spread': spread,
+        'load_per_step': bool(int(option('load_per_step', 'MonteCarloLoadPerStep', 0))),
+        'disconnection_step': None if disconnection_step is None else int(disconnection_step),
+        'chunk_samples': max(1, int(option('chunk_samples', 'MonteCarloChunkSamples', DEFAULT_CHUNK_SAMPLES))),
+        'governor_t': float(option('governor_t', 'GovernorTimeConstant', DEFAULT_GOVERNOR_T)),
+    }
+
+
+def draw_samples(rng: np.random.Generator, num_samples: int, options: dict, time_axis) -> tuple:
+    """สุ่ม disconnection step (n,) และ load multiplier (n, T) ของ num_samples sample ในครั้งเดียว"""
+    if options['disconnection_step'] is None:
+        steps = rng.integers(*time_axis.random_step_range, size=num_samples)
+    else:
+        steps = np.full(num_samples, options['disconnection_step'])
+
+    shape = (num_samples, time_axis.num_steps if options['load_per_step'] else 1)
+    spread = options['load_spread']
+    if options['load_distribution'] == 'normal':
+        multipliers = rng.normal(1.0, spread, shape)
+    elif options['load_distribution'] == 'uniform':
+        multipliers = rng.uniform(1.0 - spread, 1.0 + spread, shape)
+    else:  # lognormal ที่มีค่าเฉลี่ย 1
+        multipliers = rng.lognormal(-0.5 * spread ** 2, spread, shape)
+    multipliers = np.broadcast_to(np.clip(multipliers, 0.0, None), (num_samples, time_axis.num_steps))
+    return steps, multipliers
+
+
+def run_monte_carlo(study: dict, options: dict, workers: int = 1) -> pd.DataFrame:
+    """
+    จำลองการตัด MPG ตาม options['samples'] sample แล้วคืนผลราย sample (DataFrame ตาม SAMPLE_COLUMNS)
+    sample ถูกแบ่งเป็น chunk ละ chunk_samples และแต่ละ chunk ใช้ stream อิสระจาก SeedSequence(seed).spawn
+    ผลจึงขึ้นกับ seed และ chunk_samples เท่านั้น ไม่ขึ้นกับจำนวน workers
+    """
+    bounds = chunk_bounds(options['samples'], options['chunk_samples'])
+    streams = np.random.SeedSequence(options['seed']).spawn(len(bounds))
+    columns = {name: [] for name in SAMPLE_COLUMNS}
+    for _, _, part in map_chunks(_run_samples, bounds, args=(study, options, streams), workers=workers):
+        for name in SAMPLE_COLUMNS:
+            columns[name].append(part[name])
+
+    samples = pd.DataFrame({name: np.concatenate(values) for name, values in columns.items()})
+    samples.index.name = 'sample'
+    samples = samples.astype({'disconnection_step': int, 'shed_steps': int})
+    samples.insert(1, 'disconnection_time', study['time_index'][samples['disconnection_step'].to_numpy()])
+    return samples
+
+
+def _run_samples(start: int, stop: int, study: dict, options: dict, streams: list) -> dict:
+    """
+    ผลของ sample start..stop-1 (หนึ่ง chunk) โดยใช้ stream ของ chunk นั้น
+    nadir ของการตัด MPG: กำลังที่นำเข้าจากกริดที่ step ก่อนตัดหายไปทันที (Load Flow ต่อกริดของทุก sample
+    ใน chunk แก้พร้อมกันครั้งเดียว) แล้วเปิด NadirTable ของ DG ที่ online
+    """
+    rng = np.random.default_rng(streams[start // options['chunk_samples']])
+    steps, multipliers = draw_samples(rng, stop - start, options, study['time_axis'])
+    scheme = shedding_scheme(options['scheme'])
+    num_steps = study['num_steps']; topology = study['topology']
+    BASE_FREQ = study['base_freq']; step_hours = study['time_axis'].step_hours
+    pg_initial = study['generators']['Pg_MW'].to_numpy(dtype=float)
+    # Pg และโหลดของ step ก่อนตัด (step 0 ถ้าตัดที่ step แรก) ของแต่ละ sample สำหรับกำลังที่นำเข้าจากกริด
+    import_pg = np.empty((stop - start, len(pg_initial)))
+    import_pd = np.empty((stop - start, len(study['loads']))); import_qd = np.empty_like(import_pd)
+
+    rows = {name: np.empty(stop - start) for name in SAMPLE_COLUMNS}
+    for k, (d, multiplier) in enumerate(zip(steps, multipliers)):
+        sample = scale_study_loads(study, multiplier)
+        result = scheme.shed_islanded(sample, np.arange(d, num_steps))
+        # แรงดันต่ำสุดทั้ง time series: ก่อนตัดต่อกริดตาม dispatch ของ scheme, หลังตัดตาม dispatch หลัง shedding
+        grid_pg = scheme.grid_step_pg(sample)
+        grid_vmin = min_voltage_series(sample, grid_pg[:d], sample['pd_base'][:d], sample['qd_base'][:d],
+                                       islanded=False)
+        island_vmin = min_voltage_series(sample, topology.islanded_pg(pg_initial, result['dg_pg']),
+                                         result['pd_loads'], result['qd_loads'], islanded=True)
+        min_voltage = np.fmin.reduce(np.concatenate([grid_vmin, island_vmin]), initial=np.inf)
+        before = max(d - 1, 0)
+        import_pg[k] = grid_pg[before]; import_pd[k] = sample['pd_base'][before]; import_qd[k] = sample['qd_base'][before]
+
+        rows['disconnection_step'][k] = d
+        rows['load_multiplier_mean'][k] = multiplier.mean()
+        rows['min_freq_before_hz'][k] = np.fmin.reduce(result['freq_before'], initial=BASE_FREQ)
+        rows['min_freq_after_hz'][k] = np.fmin.reduce(result['freq_after'], initial=BASE_FREQ)
+        rows['peak_mw_shed'][k] = result['mw_shed'].max(initial=0.0)
+        rows['unserved_energy_mwh'][k] = result['mw_shed'].sum() * step_hours
+        rows['shed_steps'][k] = np.count_nonzero(result['mw_shed'] > 0)
+        rows['min_voltage_pu'][k] = min_voltage if np.isfinite(min_voltage) else np.nan
+
+    grid_import = grid_import_series(study, import_pg, import_pd, import_qd)
+    table = nadir_table(topology.online_dg, topology.R_sys_hz_mw, study['base_mva'], BASE_FREQ,
+                        options['governor_t'])
+    rows['grid_import_mw'] = grid_import
+    # กำลังที่ส่งออกไปกริด (ค่าลบ) ไม่ทำให้ความถี่ตก
+    rows['freq_nadir_hz'] = np.where(np.isnan(grid_import), np.nan,
+                                     table.nadir_hz(np.clip(np.nan_to_num(grid_import), 0.0, None)))
+    return rows
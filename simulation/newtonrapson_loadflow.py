@@ -3,13 +3,18 @@
 import numpy as np
 import pandas as pd
 
+def _sum_by_bus(element_data: pd.DataFrame, column: str, bus_index: pd.Index) -> np.ndarray:
+    """รวมค่าของ generator/load ลงแต่ละบัสตามลำดับของ bus_index (แทน groupby + reindex)"""
+    positions = bus_index.get_indexer(element_data['BusID'].values)
+    valid = positions >= 0
+    return np.bincount(positions[valid], weights=np.nan_to_num(element_data[column].values[valid].astype(float)),
+                       minlength=len(bus_index))
+
 def run_newton_raphson(bus_data: pd.DataFrame, gen_data: pd.DataFrame, load_data: pd.DataFrame, 
                        y_bus: np.ndarray, base_mva: float = 100.0, 
                        max_iter: int = 20, tolerance: float = 1e-5, 
                        perform_pf_dispatch: bool = True) -> tuple: # perform_pf_dispatch is no longer used but kept for compatibility
     
-    G = y_bus.real
-    B = y_bus.imag
     num_buses = len(bus_data)
     V = bus_data['V_init'].values.copy()
     delta = np.deg2rad(bus_data['Angle_init'].values.copy())
@@ -25,20 +30,21 @@ def run_newton_raphson(bus_data: pd.DataFrame, gen_data: pd.DataFrame, load_data
     pq_indices = np.sort(pq_bus_indices)
 
     # This function is now a PURE SOLVER. It uses the Pg values as provided.
-    bus_ids = bus_data['BusID'].values
-    pg_per_bus = gen_data.groupby('BusID')['Pg_MW'].sum().reindex(bus_ids, fill_value=0)
-    qg_per_bus = gen_data.groupby('BusID')['Qg_MVAR'].sum().reindex(bus_ids, fill_value=0)
-    pd_per_bus = load_data.groupby('BusID')['Pd_MW'].sum().reindex(bus_ids, fill_value=0)
-    qd_per_bus = load_data.groupby('BusID')['Qd_MVAR'].sum().reindex(bus_ids, fill_value=0)
+    bus_index = pd.Index(bus_data['BusID'].values)
+    pg_per_bus = _sum_by_bus(gen_data, 'Pg_MW', bus_index)
+    qg_per_bus = _sum_by_bus(gen_data, 'Qg_MVAR', bus_index)
+    pd_per_bus = _sum_by_bus(load_data, 'Pd_MW', bus_index)
+    qd_per_bus = _sum_by_bus(load_data, 'Qd_MVAR', bus_index)
 
-    P_sch = (pg_per_bus - pd_per_bus).values / base_mva
-    Q_sch = (qg_per_bus - qd_per_bus).values / base_mva
+    P_sch = (pg_per_bus - pd_per_bus) / base_mva
+    Q_sch = (qg_per_bus - qd_per_bus) / base_mva
 
     is_converged = False
     iteration = 0
     for iteration in range(max_iter):
         V_complex = V * np.exp(1j * delta)
-        S_calc_complex = V_complex * np.conj(y_bus @ V_complex)
+        I_bus = y_bus @ V_complex
+        S_calc_complex = V_complex * np.conj(I_bus)
         P_calc = S_calc_complex.real
         Q_calc = S_calc_complex.imag
 
@@ -49,28 +55,8 @@ def run_newton_raphson(bus_data: pd.DataFrame, gen_data: pd.DataFrame, load_data
         if np.max(np.abs(mismatch_vector)) < tolerance:
             is_converged = True; break
 
-        # Jacobian Calculation (Full code)
-        J11 = np.zeros((len(non_slack_indices), len(non_slack_indices)))
-        J12 = np.zeros((len(non_slack_indices), len(pq_indices)))
-        J21 = np.zeros((len(pq_indices), len(non_slack_indices)))
-        J22 = np.zeros((len(pq_indices), len(pq_indices)))
-        for i_idx, i in enumerate(non_slack_indices):
-            for k_idx, k in enumerate(non_slack_indices):
-                if i == k: J11[i_idx, k_idx] = -Q_calc[i] - V[i]**2 * B[i, i]
-                else: angle_ik = delta[i] - delta[k]; J11[i_idx, k_idx] = V[i] * V[k] * (G[i, k] * np.sin(angle_ik) - B[i, k] * np.cos(angle_ik))
-        for i_idx, i in enumerate(non_slack_indices):
-            for k_idx, k in enumerate(pq_indices):
-                if i == k: J12[i_idx, k_idx] = P_calc[i] / V[i] + V[i] * G[i, i]
-                else: angle_ik = delta[i] - delta[k]; J12[i_idx, k_idx] = V[i] * (G[i, k] * np.cos(angle_ik) + B[i, k] * np.sin(angle_ik))
-        for i_idx, i in enumerate(pq_indices):
-            for k_idx, k in enumerate(non_slack_indices):
-                if i == k: J21[i_idx, k_idx] = P_calc[i] - V[i]**2 * G[i, i]
-                else: angle_ik = delta[i] - delta[k]; J21[i_idx, k_idx] = -V[i] * V[k] * (G[i, k] * np.cos(angle_ik) + B[i, k] * np.sin(angle_ik))
-        for i_idx, i in enumerate(pq_indices):
-            for k_idx, k in enumerate(pq_indices):
-                if i == k: J22[i_idx, k_idx] = Q_calc[i] / V[i] - V[i] * B[i, i]
-                else: angle_ik = delta[i] - delta[k]; J22[i_idx, k_idx] = V[i] * (G[i, k] * np.sin(angle_ik) - B[i, k] * np.cos(angle_ik))
-        J = np.vstack([np.hstack([J11, J12]), np.hstack([J21, J22])])
+        # Jacobian แบบ vectorized (ใช้ตัวสร้างเดียวกับ newton_raphson_batch)
+        J = _build_jacobian_batch(y_bus, V_complex[None, :], I_bus[None, :], non_slack_indices, pq_indices)[0]
 
         try:
             corrections = np.linalg.solve(J, mismatch_vector)
@@ -90,14 +76,207 @@ def run_newton_raphson(bus_data: pd.DataFrame, gen_data: pd.DataFrame, load_data
     result_bus_data = bus_data.copy()
     result_bus_data['V_final_pu'] = V; result_bus_data['Angle_final_deg'] = np.rad2deg(delta)
     
-    pg_final = (P_final_net_pu * base_mva) + pd_per_bus.values
-    qg_final = (Q_final_net_pu * base_mva) + qd_per_bus.values
+    pg_final = (P_final_net_pu * base_mva) + pd_per_bus
+    qg_final = (Q_final_net_pu * base_mva) + qd_per_bus
 
     result_bus_data['Pg_final_MW'] = pg_final
     result_bus_data['Qg_final_MVAR'] = qg_final
-    result_bus_data['Pd_final_MW'] = pd_per_bus.values
-    result_bus_data['Qd_final_MVAR'] = qd_per_bus.values
+    result_bus_data['Pd_final_MW'] = pd_per_bus
+    result_bus_data['Qd_final_MVAR'] = qd_per_bus
     
-    p_loss = pg_final.sum() - pd_per_bus.values.sum()
+    p_loss = pg_final.sum() - pd_per_bus.sum()
     
-    return True, result_bus_data, final_iterations, p_loss
\ No newline at end of file
+    return True, result_bus_data, final_iterations, p_loss
+
+def _build_jacobian_batch(y_bus: np.ndarray, V_complex: np.ndarray, I_bus: np.ndarray,
+                          non_slack_indices: np.ndarray, pq_indices: np.ndarray) -> np.ndarray:
+    """
+    สร้าง Jacobian แบบ vectorized สำหรับหลายระบบพร้อมกัน (แกนแรกคือ batch)
+    ใช้รูปแบบ complex: dS/dδ = j·diag(V)·conj(diag(I) - Y·diag(V))
+                      dS/d|V| = diag(V)·conj(Y·diag(V/|V|)) + conj(diag(I))·diag(V/|V|)
+    """
+    V_norm = V_complex / np.abs(V_complex)
+    diag_I = np.zeros_like(y_bus, shape=V_complex.shape + V_complex.shape[-1:])
+    idx = np.arange(V_complex.shape[-1])
+    diag_I[:, idx, idx] = I_bus
+    dS_ddelta = 1j * V_complex[:, :, None] * np.conj(diag_I - y_bus[None, :, :] * V_complex[:, None, :])
+    dS_dVm = V_complex[:, :, None] * np.conj(y_bus[None, :, :] * V_norm[:, None, :])
+    dS_dVm[:, idx, idx] += np.conj(I_bus) * V_norm
+
+    J11 = dS_ddelta.real[:, non_slack_indices][:, :, non_slack_indices]
+    J12 = dS_dVm.real[:, non_slack_indices][:, :, pq_indices]
+    J21 = dS_ddelta.imag[:, pq_indices][:, :, non_slack_indices]
+    J22 = dS_dVm.imag[:, pq_indices][:, :, pq_indices]
+    return np.concatenate([np.concatenate([J11, J12], axis=2), np.concatenate([J21, J22], axis=2)], axis=1)
+
+
+def newton_raphson_batch(y_bus: np.ndarray, bus_types: np.ndarray, V0: np.ndarray, delta0: np.ndarray,
+                         P_sch: np.ndarray, Q_sch: np.ndarray,
+                         max_iter: int = 20, tolerance: float = 1e-5, batch_size: int = None,
+                         warm_start_steps: int = None) -> tuple:
+    """
+    แก้ Load Flow หลายกรณี (scenario/time step) ที่ใช้ Y-bus และชนิดบัสเดียวกันพร้อมกันในครั้งเดียว
+    P_sch, Q_sch: (K, n) เป็น p.u. | V0, delta0 (rad): (n,) หรือ (K, n)
+    batch_size: แบ่งแก้ทีละไม่เกิน batch_size กรณี เพื่อจำกัดขนาด Jacobian (K, m, m) ในหน่วยความจำ
+    warm_start_steps: แก้เป็นช่วงต่อเนื่องช่วงละ warm_start_steps กรณี (เช่น time step ที่เรียงกัน)
+                      โดยเริ่มช่วงถัดไปจากคำตอบที่ converge ล่าสุดของช่วงก่อน (V0, delta0 ใช้กับช่วงแรก)
+    คืนค่า (converged (K,), V (K, n), delta (K, n), iterations (K,))
+    """
+    P_sch = np.atleast_2d(P_sch); Q_sch = np.atleast_2d(Q_sch)
+    num_cases, num_buses = P_sch.shape
+    if warm_start_steps is not None and num_cases > warm_start_steps:
+        V_start = np.broadcast_to(V0, (num_cases, num_buses))[0]
+        delta_start = np.broadcast_to(delta0, (num_cases, num_buses))[0]
+        parts = []
+        for k in range(0, num_cases, warm_start_steps):
+            part = newton_raphson_batch(y_bus, bus_types, V_start, delta_start,
+                                        P_sch[k:k + warm_start_steps], Q_sch[k:k + warm_start_steps],
+                                        max_iter, tolerance, batch_size)
+            solved = np.flatnonzero(part[0])
+            if solved.size:
+                V_start, delta_start = part[1][solved[-1]], part[2][solved[-1]]
+            parts.append(part)
+        return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+    if batch_size is not None and num_cases > batch_size:
+        V0 = np.broadcast_to(V0, (num_cases, num_buses)); delta0 = np.broadcast_to(delta0, (num_cases, num_buses))
+        parts = [newton_raphson_batch(y_bus, bus_types, V0[k:k + batch_size], delta0[k:k + batch_size],
+                                      P_sch[k:k + batch_size], Q_sch[k:k + batch_size], max_iter, tolerance)
+                 for k in range(0, num_cases, batch_size)]
+        return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+    V = np.broadcast_to(V0, (num_cases, num_buses)).astype(float).copy()
+    delta = np.broadcast_to(delta0, (num_cases, num_buses)).astype(float).copy()
+
+    if not np.any(bus_types == 1): raise ValueError("No Slack Bus (Type 1) found.")
+    pv_bus_indices = np.where(bus_types == 2)[0]
+    pq_indices = np.sort(np.where(bus_types == 3)[0])
+    non_slack_indices = np.sort(np.concatenate([pv_bus_indices, pq_indices]))
+    num_ns = len(non_slack_indices)
+
+    converged = np.zeros(num_cases, dtype=bool)
+    iterations = np.zeros(num_cases, dtype=int)
+    active = np.arange(num_cases)
+
+    for iteration in range(max_iter):
+        V_complex = V[active] * np.exp(1j * delta[active])
+        I_bus = V_complex @ y_bus.T
+        S_calc = V_complex * np.conj(I_bus)
+        mismatch = np.concatenate([(P_sch[active] - S_calc.real)[:, non_slack_indices],
+                                   (Q_sch[active] - S_calc.imag)[:, pq_indices]], axis=1)
+
+        done = np.max(np.abs(mismatch), axis=1) < tolerance
+        converged[active[done]] = True
+        iterations[active[done]] = iteration + 1
+        keep = ~done
+        active = active[keep]
+        if active.size == 0: break
+        V_complex = V_complex[keep]; I_bus = I_bus[keep]; mismatch = mismatch[keep]
+
+        J = _build_jacobian_batch(y_bus, V_complex, I_bus, non_slack_indices, pq_indices)
+        try:
+            corrections = np.linalg.solve(J, mismatch[:, :, None])[:, :, 0]
+        except np.linalg.LinAlgError:
+            # Jacobian บางกรณี singular: แก้ทีละกรณีแล้วตัดกรณีที่ล้มเหลวออก
+            corrections = np.zeros_like(mismatch); solvable = np.ones(active.size, dtype=bool)
+            for k in range(active.size):
+                try: corrections[k] = np.linalg.solve(J[k], mismatch[k])
+                except np.linalg.LinAlgError: solvable[k] = False
+            iterations[active[~solvable]] = iteration
+            active = active[solvable]; corrections = corrections[solvable]
+            if active.size == 0: break
+
+        delta[np.ix_(active, non_slack_indices)] += corrections[:, :num_ns]
+        V[np.ix_(active, pq_indices)] += corrections[:, num_ns:]
+
+    iterations[active] = max_iter - 1
+    return converged, V, delta, iterations
+
+
+def bus_incidence(element_bus_ids: np.ndarray, bus_ids: np.ndarray) -> np.ndarray:
+    """เมทริกซ์ (element x bus) สำหรับรวมค่าของ generator/load ลงบัส"""
+    bus_position = pd.Series(np.arange(len(bus_ids)), index=bus_ids)
+    incidence = np.zeros((len(element_bus_ids), len(bus_ids)))
+    positions = bus_position.reindex(element_bus_ids).values
+    valid = ~np.isnan(positions)
+    incidence[np.where(valid)[0], positions[valid].astype(int)] = 1.0
+    return incidence
+
+
+def run_newton_raphson_batch(bus_data: pd.DataFrame, y_bus: np.ndarray,
+                             pg_bus: np.ndarray, qg_bus: np.ndarray, pd_bus: np.ndarray, qd_bus: np.ndarray,
+                             base_mva: float = 100.0, bus_types: np.ndarray = None,
+                             max_iter: int = 20, tolerance: float = 1e-5, batch_size: int = 2048,
+                             warm_start_steps: int = None, cache=None) -> dict:
+    """
+    เทียบเท่า run_newton_raphson หลาย step พร้อมกัน โดยรับกำลังที่รวมลงบัสแล้ว (MW/MVAR, รูป (K, n))
+    bus_types ใช้แทนคอลัมน์ Type ของ bus_data (เช่นชนิดบัสขณะ islanding)
+    warm_start_steps: ดู newton_raphson_batch (ช่วงแรกเริ่มจาก V_init/Angle_init ของ bus_data)
+    cache: SolutionCache (ถ้ามี) สำหรับจุดทำงานที่ซ้ำกันทั้งภายใน batch และข้ามการรัน
+    คืนค่า dict ของ array (K, n) ตามชื่อคอลัมน์ผลลัพธ์เดิม พร้อม 'converged' และ 'losses' (K,)
+    """
+    bus_types = bus_data['Type'].values if bus_types is None else np.asarray(bus_types)
+    pd_bus = np.atleast_2d(pd_bus); qd_bus = np.broadcast_to(qd_bus, pd_bus.shape)
+    pg_bus = np.broadcast_to(pg_bus, pd_bus.shape); qg_bus = np.broadcast_to(qg_bus, pd_bus.shape)
+
+    V0 = bus_data['V_init'].values.astype(float); delta0 = np.deg2rad(bus_data['Angle_init'].values.astype(float))
+    if cache is None:
+        converged, V, delta, _ = newton_raphson_batch(
+            y_bus, bus_types, V0, delta0, (pg_bus - pd_bus) / base_mva, (qg_bus - qd_bus) / base_mva,
+            max_iter=max_iter, tolerance=tolerance, batch_size=batch_size, warm_start_steps=warm_start_steps
+        )
+    else:
+        converged, V, delta = _solve_with_cache(
+            cache, y_bus, bus_types, V0, delta0, pg_bus - pd_bus, qg_bus - qd_bus, base_mva,
+            max_iter, tolerance, batch_size, warm_start_steps
+        )
+    V_complex = V * np.exp(1j * delta)
+    S_net = V_complex * np.conj(V_complex @ y_bus.T)
+    pg_final = S_net.real * base_mva + pd_bus
+    qg_final = S_net.imag * base_mva + qd_bus
+
+    return {
+        'V_final_pu': V, 'Angle_final_deg': np.rad2deg(delta),
+        'Pg_final_MW': pg_final, 'Qg_final_MVAR': qg_final,
+        'Pd_final_MW': np.array(pd_bus), 'Qd_final_MVAR': np.array(qd_bus),
+        'converged': converged, 'losses': pg_final.sum(axis=1) - pd_bus.sum(axis=1),
+    }
+
+
+def _solve_with_cache(cache, y_bus: np.ndarray, bus_types: np.ndarray, V0: np.ndarray, delta0: np.ndarray,
+                      P_mw: np.ndarray, Q_mvar: np.ndarray, base_mva: float, max_iter: int, tolerance: float,
+                      batch_size: int, warm_start_steps: int) -> tuple:
+    """
+    newton_raphson_batch ที่ผ่าน SolutionCache: แก้เฉพาะจุดทำงานที่ไม่ซ้ำ (ตาม key ที่ปัดแล้ว)
+    กรณีที่ key ซ้ำกันภายใน batch ใช้คำตอบร่วมกันและนับเป็น hit
+    คืนค่า (converged (K,), V (K, n), delta (K, n))
+    """
+    keys = cache.keys(cache.topology_key(y_bus, bus_types), P_mw, Q_mvar)
+    position = {}; inverse = np.empty(len(keys), dtype=int); first_case = []
+    for k, key in enumerate(keys):
+        inverse[k] = position.setdefault(key, len(position))
+        if inverse[k] == len(first_case): first_case.append(k)
+    first_case = np.array(first_case, dtype=int)
+    cache.count_hits(len(keys) - len(first_case))
+
+    num_unique = len(first_case)
+    V = np.tile(V0, (num_unique, 1)); delta = np.tile(delta0, (num_unique, 1))
+    converged = np.zeros(num_unique, dtype=bool)
+    hit = np.zeros(num_unique, dtype=bool)
+    for u, k in enumerate(first_case):
+        entry = cache.get(keys[k])
+        if entry is not None:
+            V[u], delta[u] = entry; hit[u] = True
+
+    # reuse: ใช้คำตอบในแคชเลย / warm_start: ใช้เป็นจุดเริ่มแล้วแก้ NR ทุกจุดที่ไม่ซ้ำ
+    to_solve = np.flatnonzero(~hit) if cache.mode == 'reuse' else np.arange(num_unique)
+    converged[hit] = True
+    if to_solve.size:
+        cases = first_case[to_solve]
+        chain = warm_start_steps if cache.mode == 'reuse' else None
+        solved, V_solved, delta_solved, _ = newton_raphson_batch(
+            y_bus, bus_types, V[to_solve], delta[to_solve], P_mw[cases] / base_mva, Q_mvar[cases] / base_mva,
+            max_iter=max_iter, tolerance=tolerance, batch_size=batch_size, warm_start_steps=chain
+        )
+        converged[to_solve] = solved; V[to_solve] = V_solved; delta[to_solve] = delta_solved
+        for u in to_solve[solved]:
+            cache.put(keys[first_case[u]], V[u], delta[u])
+    return converged[inverse], V[inverse], delta[inverse]
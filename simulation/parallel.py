@@ -0,0 +1,61 @@
+# simulation/parallel.py
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# ขนาด chunk เริ่มต้น (จำนวน step ต่อ chunk) และจำนวน step ต่อช่วง warm start ภายใน chunk
+DEFAULT_CHUNK_STEPS = 2048
+DEFAULT_WARM_START_STEPS = 256
+
+def chunk_bounds(num_steps: int, chunk_steps: int) -> list:
+    """แบ่งช่วง [0, num_steps) เป็น chunk ต่อเนื่อง [(start, stop), ...]"""
+    chunk_steps = max(1, int(chunk_steps))
+    return [(start, min(start + chunk_steps, num_steps)) for start in range(0, num_steps, chunk_steps)]
+
+
+def parallel_options(system_data: dict) -> dict:
+    """
+    อ่านค่าการรันแบบขนานจาก system_data['parallel'] หรือ system_config.csv
+    (ParallelWorkers, ParallelChunkSteps, WarmStartSteps)
+    workers = 0 หมายถึงใช้ทุก core, 1 (ค่าเริ่มต้น) คือรันใน process เดิม
+    ขอบของ chunk ขึ้นกับ chunk_steps เท่านั้น ผลจึงเหมือนกันทุกจำนวน workers
+    """
+    config = system_data.get('config', {}) or {}
+    options = system_data.get('parallel') or {}
+    workers = int(options.get('workers', config.get('ParallelWorkers', 1)))
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return {
+        'workers': workers,
+        'chunk_steps': int(options.get('chunk_steps', config.get('ParallelChunkSteps', DEFAULT_CHUNK_STEPS))),
+        'warm_start_steps': int(options.get('warm_start_steps', config.get('WarmStartSteps', DEFAULT_WARM_START_STEPS))),
+    }
+
+
+def map_chunks(func, bounds: list, args: tuple = (), workers: int = 1):
+    """
+    เรียก func(start, stop, *args) กับทุก chunk แล้ว yield (start, stop, result) ตามลำดับเวลา
+    - workers > 1: กระจาย chunk ให้ process pool โดยส่งงานล่วงหน้าไม่เกิน 2 เท่าของ workers
+      เพื่อให้ผลที่รอการรวมในหน่วยความจำมีจำกัด
+    - func และ args ต้อง pickle ได้ (ฟังก์ชันระดับ module)
+    """
+    if workers <= 1 or len(bounds) <= 1:
+        for start, stop in bounds:
+            yield start, stop, func(start, stop, *args)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(bounds))) as executor:
+        pending = deque()
+        remaining = iter(bounds)
+        for start, stop in remaining:
+            pending.append((start, stop, executor.submit(func, start, stop, *args)))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            start, stop, future = pending.popleft()
+            result = future.result()
+            next_bounds = next(remaining, None)
+            if next_bounds is not None:
+                pending.append((*next_bounds, executor.submit(func, *next_bounds, *args)))
+            yield start, stop, result
@@ -0,0 +1,121 @@
+# simulation/parametric.py
+
+import itertools
+import numpy as np
+import pandas as pd
+from .islanding import set_generator_droop, shedding_metrics
+from .parallel import chunk_bounds, map_chunks
+from .usecases.shedding_schemes import shedding_scheme
+
+# แกนของ grid และ key ใน system_config.csv (ค่าคั่นด้วย ;)
+# freq_threshold = ความถี่ที่เริ่มตัดโหลด, shed_step / priority_penalty / priority_decay = parameter ของวิธี shedding
+# droop_scale = ตัวคูณ Droop_R ของทุกเครื่อง, droop_r_<GenID> = Droop_R (pu) ของเครื่องนั้น (ParametricDroopR_<GenID>)
+PARAMETER_AXES = {
+    'freq_threshold': 'ParametricFreqThreshold', 'shed_step': 'ParametricShedStep',
+    'priority_penalty': 'ParametricPriorityPenalty', 'priority_decay': 'ParametricPriorityDecay',
+    'droop_scale': 'ParametricDroopScale',
+}
+DROOP_AXIS_PREFIX = 'droop_r_'
+# จำนวนจุดของ grid ต่อ chunk เริ่มต้น
+DEFAULT_CHUNK_POINTS = 16
+
+def parametric_options(system_data: dict) -> dict:
+    """
+    ตัวเลือกของ parametric sweep จาก system_data['parametric'] (dict) หรือ system_config.csv
+        grid / Parametric<Axis>     ค่าที่ลองของแต่ละแกน (ดู PARAMETER_AXES) แกนที่ไม่ตั้งใช้ค่าปัจจุบัน
+        scheme / ParametricScheme   วิธี shedding (percentage)
+        voltage / ParametricVoltage 1 = แก้ Load Flow ของช่วง islanding ทุกจุดเพื่อหาแรงดันต่ำสุด (0)
+        chunk_points / ParametricChunkPoints  จำนวนจุดต่อ chunk ที่ส่งให้ process pool (16)
+    """
+    options = system_data.get('parametric') or {}
+    config = system_data.get('config', {}) or {}
+    grid = dict(options.get('grid') or {})
+    if not grid:
+        for axis, key in PARAMETER_AXES.items():
+            if key in config: grid[axis] = config[key]
+        for key, values in config.items():
+            if str(key).startswith('ParametricDroopR_'):
+                grid[DROOP_AXIS_PREFIX + str(key)[len('ParametricDroopR_'):]] = values
+
+    axes = {}
+    for axis, values in grid.items():
+        if axis not in PARAMETER_AXES and not axis.startswith(DROOP_AXIS_PREFIX):
+            raise ValueError(f"Unknown parametric axis '{axis}' (expected one of {tuple(PARAMETER_AXES)} "
+                             f"or {DROOP_AXIS_PREFIX}<GenID>).")
+        if isinstance(values, str): values = values.split(';')
+        values = np.atleast_1d(np.asarray(values, dtype=float))
+        if values.size == 0: raise ValueError(f"Parametric axis '{axis}' has no values.")
+        axes[axis] = values
+
+    scheme = str(options.get('scheme', config.get('ParametricScheme', 'percentage'))).lower()
+    shedding_scheme(scheme)  # ตรวจชื่อ scheme
+    return {
+        'axes': axes, 'scheme': scheme,
+        'voltage': bool(int(options.get('voltage', config.get('ParametricVoltage', 0)))),
+        'chunk_points': max(1, int(options.get('chunk_points', config.get('ParametricChunkPoints', DEFAULT_CHUNK_POINTS)))),
+    }
+
+
+def parameter_grid(axes: dict) -> pd.DataFrame:
+    """
+    ทุกจุดของ grid (ผลคูณคาร์ทีเซียนของแกน) หนึ่งแถวต่อจุด
+    แกน droop อยู่นอกสุด จุดที่ติดกันจึงใช้ droop ชุดเดียวกัน (สร้าง islanded dispatch ใหม่ครั้งเดียวต่อชุด)
+    """
+    names = sorted(axes, key=lambda axis: not (axis == 'droop_scale' or axis.startswith(DROOP_AXIS_PREFIX)))
+    points = pd.DataFrame(list(itertools.product(*(axes[name] for name in names))), columns=names)
+    points.index.name = 'point'
+    return points
+
+
+def run_parametric(study: dict, options: dict, disconnection_step: int, workers: int = 1) -> pd.DataFrame:
+    """
+    จำลองช่วงหลังตัด MPG (step disconnection_step..T-1) ของทุกจุดใน grid แล้วคืนค่าแกน + ค่าสรุป (shedding_metrics)
+    รายจุด ข้อมูลที่ไม่ขึ้นกับ parameter (Y-bus, load ทุก step) ใช้ร่วมกันจาก study
+    chunk ของจุดถูกกระจายให้ process pool เมื่อ workers > 1 (ผลไม่ขึ้นกับจำนวน workers)
+    """
+    points = parameter_grid(options['axes'])  # ไม่มีแกน: จุดเดียวตามค่าปัจจุบัน
+    bounds = chunk_bounds(len(points), options['chunk_points'])
+    rows = []
+    for _, _, part in map_chunks(_run_points, bounds, args=(study, options, points, disconnection_step),
+                                 workers=workers):
+        rows.extend(part)
+    return pd.concat([points, pd.DataFrame(rows, index=points.index)], axis=1)
+
+
+def _droop_r(study: dict, point: dict) -> np.ndarray:
+    """Droop_R ของทุกเครื่องที่จุด point (None ถ้าจุดนี้ไม่ได้ปรับ droop)"""
+    keys = [axis for axis in point if axis == 'droop_scale' or axis.startswith(DROOP_AXIS_PREFIX)]
+    if not keys: return None
+    generators = study['generators']
+    droop_r = generators['Droop_R'].to_numpy(dtype=float).copy()
+    for axis in keys:
+        if axis.startswith(DROOP_AXIS_PREFIX):
+            gen_id = float(axis[len(DROOP_AXIS_PREFIX):])
+            selected = (generators['GenID'] == gen_id).to_numpy()
+            if not selected.any(): raise ValueError(f"Generator {gen_id:g} in '{axis}' does not exist.")
+            droop_r[selected] = point[axis]
+    return droop_r * point.get('droop_scale', 1.0)
+
+
+def _run_points(start: int, stop: int, study: dict, options: dict, points: pd.DataFrame,
+                disconnection_step: int) -> list:
+    """ค่าสรุปของจุด start..stop-1 ของ grid (study ของ droop แต่ละชุดสร้างครั้งเดียวภายใน chunk)"""
+    scheme = shedding_scheme(options['scheme'])
+    steps = np.arange(disconnection_step, study['num_steps'])
+    retuned = {}
+    rows = []
+    for k in range(start, stop):
+        point = points.iloc[k].to_dict()
+        droop_r = _droop_r(study, point)
+        key = None if droop_r is None else tuple(droop_r)
+        if key not in retuned:
+            retuned[key] = study if droop_r is None else set_generator_droop(study, droop_r)
+        variant = dict(retuned[key])
+        for axis in ('freq_threshold', 'shed_step', 'priority_penalty', 'priority_decay'):
+            if axis in point: variant[axis] = point[axis]
+
+        result = scheme.shed_islanded(variant, steps)
+        metrics, _ = shedding_metrics(variant, result, with_voltage=options['voltage'])
+        metrics['system_droop_hz_mw'] = variant['topology'].R_sys_hz_mw
+        rows.append(metrics)
+    return rows
@@ -0,0 +1,252 @@
+# simulation/result_store.py
+
+import os
+import numpy as np
+import pandas as pd
+from .result_writer import ChunkedCSVWriter
+
+class TimeSeriesResultStore:
+    """
+    ที่เก็บผล Load Flow แบบ time-series ที่จองหน่วยความจำล่วงหน้า (steps x buses)
+    เก็บเฉพาะค่าที่เปลี่ยนในแต่ละ step เป็น NumPy array ส่วนข้อมูลคงที่ของบัส
+    (V_init, Angle_init, shunt) เก็บไว้ครั้งเดียว แล้วสร้างมุมมอง long/wide เมื่อต้องใช้
+
+    ถ้ากำหนด writer ผลของแต่ละ step จะถูกเขียนลงไฟล์ทีละ chunk ระหว่างรัน
+    และถ้า keep_in_memory=False จะเก็บผลรายบัสไว้แค่ chunk ล่าสุด (ring buffer)
+    ส่วนผลรวมต่อ step และความถี่ยังเก็บครบทุก step สำหรับกราฟสรุป
+    """
+
+    # คอลัมน์ผลลัพธ์ตามลำดับเดิมของ full_df (ต่อจากคอลัมน์ของ bus_data)
+    RESULT_COLUMNS = ('V_final_pu', 'Angle_final_deg', 'Pg_final_MW', 'Qg_final_MVAR',
+                      'Pd_final_MW', 'Qd_final_MVAR')
+
+    def __init__(self, bus_data: pd.DataFrame, time_index, writer: ChunkedCSVWriter = None,
+                 keep_in_memory: bool = True):
+        self.bus_static = bus_data.reset_index(drop=True).copy()
+        self.bus_ids = self.bus_static['BusID'].to_numpy()
+        self.time_index = pd.DatetimeIndex(pd.Series(time_index).values, name='datetime')
+        num_steps, num_buses = len(self.time_index), len(self.bus_ids)
+
+        self.writer = writer
+        self.keep_in_memory = keep_in_memory or writer is None
+        num_rows = num_steps if self.keep_in_memory else min(writer.chunk_steps, num_steps)
+
+        # Type เปลี่ยนได้ต่อ step (เช่นย้าย slack เมื่อเกิด islanding)
+        self.bus_types = np.tile(self.bus_static['Type'].to_numpy(), (num_rows, 1))
+        self.values = {col: np.full((num_rows, num_buses), np.nan) for col in self.RESULT_COLUMNS}
+        self.totals = {col: np.full(num_steps, np.nan) for col in self.RESULT_COLUMNS}
+        self.frequency_hz = np.full(num_steps, np.nan)
+        self.recorded = np.zeros(num_steps, dtype=bool)
+        # step ที่อยู่ในแต่ละแถวของ buffer (-1 = ว่าง)
+        self._row_step = np.full(num_rows, -1)
+        self._pending_steps = []
+        # column -> (ตำแหน่งบัส, array (steps, k)) ที่เก็บครบทุก step แม้ไม่เก็บผลทั้งหมดในหน่วยความจำ
+        self._tracked = {}
+
+    @property
+    def num_steps(self) -> int:
+        return len(self.time_index)
+
+    @property
+    def num_buses(self) -> int:
+        return len(self.bus_ids)
+
+    def track(self, column: str, bus_ids):
+        """เก็บค่ารายบัสของ column ครบทุก step เฉพาะบัสที่ระบุ (เช่นบัสที่มี generator สำหรับกราฟ)"""
+        if self.keep_in_memory:
+            return
+        positions = np.flatnonzero(np.isin(self.bus_ids, bus_ids))
+        self._tracked[column] = (positions, np.full((self.num_steps, len(positions)), np.nan))
+
+    def _row(self, step):
+        return step if self.keep_in_memory else step % len(self._row_step)
+
+    def _before_write(self, step: int):
+        # step อยู่คนละ chunk กับที่ค้างอยู่ -> เขียน chunk เดิมลงไฟล์ก่อนเขียนทับ buffer
+        if self._pending_steps and step // self.writer.chunk_steps != self._pending_steps[-1] // self.writer.chunk_steps:
+            self.flush()
+
+    def _after_write(self, step: int):
+        if self.writer is None:
+            return
+        if step not in self._pending_steps:
+            self._pending_steps.append(step)
+        if (step + 1) % self.writer.chunk_steps == 0 or step == self.num_steps - 1:
+            self.flush()
+
+    def record(self, step: int, results_df: pd.DataFrame, frequency_hz: float):
+        """บันทึกผลจาก run_newton_raphson ของหนึ่ง step"""
+        if self.writer is not None: self._before_write(step)
+        row = self._row(step)
+        for col in self.RESULT_COLUMNS:
+            self.values[col][row] = results_df[col].to_numpy()
+            self.totals[col][step] = self.values[col][row].sum()
+        self.bus_types[row] = results_df['Type'].to_numpy()
+        self.frequency_hz[step] = frequency_hz
+        self.recorded[step] = True
+        self._row_step[row] = step
+        for col, (positions, arr) in self._tracked.items():
+            arr[step] = self.values[col][row, positions]
+        self._after_write(step)
+
+    def record_block(self, start_step: int, frequency_hz, bus_types=None, **columns):
+        """
+        บันทึกผลของ step ต่อเนื่องกันตั้งแต่ start_step (array ของแต่ละคอลัมน์มีรูป (steps, buses))
+        ใช้ได้ทั้งแบบเก็บในหน่วยความจำและแบบ stream (แบ่งเขียนตามขอบ chunk ของ writer)
+        """
+        num_block = len(next(iter(columns.values())))
+        frequency_hz = np.broadcast_to(np.asarray(frequency_hz, dtype=float), (num_block,))
+        offset = 0
+        while offset < num_block:
+            first = start_step + offset
+            size = num_block - offset
+            if self.writer is not None:
+                size = min(size, self.writer.chunk_steps - first % self.writer.chunk_steps)
+            block, steps = slice(offset, offset + size), np.arange(first, first + size)
+            if self.writer is not None: self._before_write(first)
+            rows = self._row(steps)
+            for col, arr in columns.items():
+                self.values[col][rows] = arr[block]
+                self.totals[col][steps] = np.sum(arr[block], axis=-1)
+            if bus_types is not None:
+                self.bus_types[rows] = bus_types if np.ndim(bus_types) == 1 else bus_types[block]
+            self.frequency_hz[steps] = frequency_hz[block]
+            self.recorded[steps] = True
+            self._row_step[rows] = steps
+            for col, (positions, arr) in self._tracked.items():
+                arr[steps] = self.values[col][rows][:, positions]
+            if self.writer is not None:
+                self._pending_steps.extend(steps.tolist())
+                if (steps[-1] + 1) % self.writer.chunk_steps == 0 or steps[-1] == self.num_steps - 1:
+                    self.flush()
+            offset += size
+
+    def copy_step(self, source_step: int, target_step: int):
+        """ใช้ผลของ step ก่อนหน้าแทน (กรณี Load Flow ไม่ converge)"""
+        if self.writer is not None: self._before_write(target_step)
+        source_row, target_row = self._row(source_step), self._row(target_step)
+        for col, arr in self.values.items():
+            arr[target_row] = arr[source_row]
+            self.totals[col][target_step] = self.totals[col][source_step]
+        self.bus_types[target_row] = self.bus_types[source_row]
+        self.frequency_hz[target_step] = self.frequency_hz[source_step]
+        self.recorded[target_step] = self.recorded[source_step]
+        self._row_step[target_row] = target_step
+        for positions, arr in self._tracked.values():
+            arr[target_step] = arr[source_step]
+        if self.recorded[target_step]:
+            self._after_write(target_step)
+
+    def flush(self):
+        """เขียน step ที่ค้างอยู่ใน buffer ลง writer"""
+        if self.writer is None or not self._pending_steps:
+            return
+        self.writer.write(self._frame(np.array(self._pending_steps)))
+        self._pending_steps = []
+
+    def close(self):
+        """flush ส่วนที่เหลือแล้วปิดไฟล์ (เรียกเมื่อจบการจำลอง)"""
+        if self.writer is not None:
+            self.flush()
+            self.writer.close()
+
+    def _require_in_memory(self, operation: str):
+        if not self.keep_in_memory:
+            raise RuntimeError(
+                f"'{operation}' needs the full per-bus time series, but results were streamed to "
+                f"'{self.writer.filepath}' without keeping them in memory."
+            )
+
+    def step_of(self, selected_time) -> int:
+        if isinstance(selected_time, (int, np.integer)):
+            return int(selected_time)
+        return int(self.time_index.get_loc(pd.Timestamp(selected_time)))
+
+    def _frame(self, steps: np.ndarray) -> pd.DataFrame:
+        rows = self._row(steps)
+        if not self.keep_in_memory and np.any(self._row_step[rows] != steps):
+            self._require_in_memory('per-bus results of flushed steps')
+        num_rows = len(steps) * self.num_buses
+        frame = {}
+        for col in self.bus_static.columns:
+            if col == 'Type':
+                frame[col] = self.bus_types[rows].reshape(num_rows)
+            else:
+                frame[col] = np.tile(self.bus_static[col].to_numpy(), len(steps))
+        for col in self.RESULT_COLUMNS:
+            frame[col] = self.values[col][rows].reshape(num_rows)
+        frame['Frequency_Hz'] = np.repeat(self.frequency_hz[steps], self.num_buses)
+        frame['time_step'] = np.repeat(steps, self.num_buses)
+        frame['datetime'] = np.repeat(self.time_index.values[steps], self.num_buses)
+        return pd.DataFrame(frame)
+
+    def frame_at(self, selected_time) -> pd.DataFrame:
+        """ตารางผลของบัสทั้งหมด ณ เวลาเดียว (สำหรับตารางใน GUI)"""
+        return self._frame(np.array([self.step_of(selected_time)]))
+
+    def to_long_df(self, steps=None) -> pd.DataFrame:
+        """มุมมองแบบ long (หนึ่งแถวต่อบัสต่อ step) ที่มีคอลัมน์เหมือน full_df เดิม"""
+        steps = np.arange(self.num_steps)[self.recorded] if steps is None else np.asarray(steps)
+        return self._frame(steps)
+
+    def write_to(self, writer: ChunkedCSVWriter, steps=None, **constant_columns):
+        """
+        เขียนมุมมอง long ลง writer ทีละ chunk โดยไม่ต้องสร้าง DataFrame ของทั้ง time series
+        constant_columns ใช้เพิ่มคอลัมน์ค่าคงที่ (เช่น pattern='pattern_1')
+        """
+        steps = np.arange(self.num_steps)[self.recorded] if steps is None else np.asarray(steps)
+        for start in range(0, len(steps), writer.chunk_steps):
+            writer.write(self._frame(steps[start:start + writer.chunk_steps]).assign(**constant_columns))
+
+    def wide(self, column: str) -> pd.DataFrame:
+        """มุมมองแบบ wide: index เป็นเวลา, คอลัมน์เป็น BusID"""
+        if column == 'Frequency_Hz':
+            return pd.DataFrame({'Frequency_Hz': self.frequency_hz}, index=self.time_index)
+        if not self.keep_in_memory and column in self._tracked:
+            positions, data = self._tracked[column]
+            frame = pd.DataFrame(data, index=self.time_index, columns=pd.Index(self.bus_ids[positions], name='BusID'))
+            return frame[self.recorded]
+        self._require_in_memory('wide')
+        data = self.bus_types if column == 'Type' else self.values[column]
+        frame = pd.DataFrame(data, index=self.time_index, columns=pd.Index(self.bus_ids, name='BusID'))
+        return frame[self.recorded]
+
+    def total(self, column: str) -> pd.Series:
+        """ผลรวมทุกบัสในแต่ละ step (เทียบเท่า full_df.groupby('datetime')[column].sum())"""
+        totals = pd.Series(self.totals[column], index=self.time_index, name=column)
+        return totals[self.recorded]
+
+    def to_columnar(self) -> dict:
+        columnar = {
+            'time_index': [t.isoformat() for t in self.time_index],
+            'bus_static': {col: self.bus_static[col].tolist() for col in self.bus_static.columns},
+            'frequency_hz': self.frequency_hz.tolist(),
+            'totals': {col: arr.tolist() for col, arr in self.totals.items()},
+        }
+        if self.keep_in_memory:
+            columnar['bus_types'] = self.bus_types.tolist()
+            columnar['values'] = {col: arr.tolist() for col, arr in self.values.items()}
+        if self.writer is not None:
+            columnar['stream_path'] = self.writer.filepath
+        return columnar
+
+
+def create_result_store(system_data: dict, bus_data: pd.DataFrame, time_index, suffix: str = None,
+                        keep_in_memory: bool = None) -> TimeSeriesResultStore:
+    """
+    สร้าง TimeSeriesResultStore ตาม system_data['result_stream'] (ถ้ามี)
+        {'path': 'results/run.csv', 'chunk_steps': 96, 'keep_in_memory': False}
+    suffix ใช้แยกไฟล์เมื่อ use case หนึ่งสร้างหลาย store (เช่น หลาย load pattern)
+    keep_in_memory บังคับเก็บผลทั้งหมดไว้ด้วย (สำหรับ use case ที่บันทึกผลแบบ batch)
+    """
+    stream = system_data.get('result_stream')
+    if not stream:
+        return TimeSeriesResultStore(bus_data, time_index)
+    filepath = stream['path']
+    if suffix:
+        root, ext = os.path.splitext(filepath)
+        filepath = f"{root}_{suffix}{ext or '.csv'}"
+    writer = ChunkedCSVWriter(filepath, chunk_steps=stream.get('chunk_steps', 96))
+    if keep_in_memory is None:
+        keep_in_memory = stream.get('keep_in_memory', False)
+    return TimeSeriesResultStore(bus_data, time_index, writer=writer, keep_in_memory=keep_in_memory)
@@ -0,0 +1,45 @@
+# simulation/result_writer.py
+
+import os
+import pandas as pd
+
+class ChunkedCSVWriter:
+    """
+    เขียนผล time-series แบบ long ลงไฟล์ CSV ทีละ chunk (append) แล้ว flush ลงดิสก์ทันที
+    หน่วยความจำที่ใช้จึงคงที่ไม่ขึ้นกับความยาวของการจำลอง และถ้าโปรแกรมล่มกลางทาง
+    ไฟล์ยังเป็น CSV ที่อ่านได้ครบทุก chunk ที่เขียนไปแล้ว
+    """
+
+    def __init__(self, filepath: str, chunk_steps: int = 96, fsync: bool = True):
+        self.filepath = filepath
+        self.chunk_steps = max(1, int(chunk_steps))
+        self.fsync = fsync
+        self.rows_written = 0
+        self.chunks_written = 0
+        directory = os.path.dirname(filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(filepath, 'w', newline='')
+
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
+
+    def write(self, frame: pd.DataFrame):
+        """ต่อท้ายไฟล์ด้วย frame หนึ่งก้อน (เขียน header เฉพาะก้อนแรก)"""
+        frame.to_csv(self._file, header=(self.chunks_written == 0), index=False)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self.rows_written += len(frame)
+        self.chunks_written += 1
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
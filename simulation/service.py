@@ -0,0 +1,316 @@
+# simulation/service.py
+
+"""
+Local Simulation Service
+    รัน SimulationController แบบ headless (ไม่ต้องเปิด Tk GUI) ผ่าน HTTP/JSON บน localhost
+    โดยใช้ pool ของ worker process ที่โหลดโมเดลและ Y-bus ไว้ล่วงหน้า (warm workers)
+
+การใช้งาน:
+    python -m simulation.service --port 8765 --workers 4
+
+    POST /run      {"model": "ieee-30", "use_case": "Continuous Load Flow",
+                    "overrides": {"config": {"Disconnecting_Time": 40},
+                                  "generators": [{"GenID": 3, "Status": 0}]}}
+                   เพิ่ม "stream_results": "run.csv" เพื่อเขียนผลรายบัสลง results/ ทีละ chunk
+                   ระหว่างรัน (หน่วยความจำคงที่ และยังมีผลบางส่วนถ้ารันไม่จบ)
+    GET  /stats    สถิติ latency ต่อ request (mean, p50, p95, p99, max) และ throughput
+    GET  /models   รายชื่อโมเดลที่มีใน data directory
+    GET  /health
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from utils.data_manager import find_available_models, load_microgrid_data
+from simulation.controller import SimulationController
+from simulation.ybus_builder import build_ybus
+
+# คอลัมน์ที่ใช้ระบุแถวเมื่อ override ตารางข้อมูลของโมเดล
+_OVERRIDE_KEY_COLUMNS = {
+    'buses': 'BusID',
+    'generators': 'GenID',
+    'loads': 'LoadID',
+}
+
+# --- สถานะภายใน worker process แต่ละตัว ---
+_worker_controller = None
+_worker_data_path = None
+_worker_models = {}
+
+
+def _load_model(model_name: str) -> dict:
+    """อ่านข้อมูลโมเดลครั้งแรกแล้วเก็บไว้ใน worker (พร้อม warm Y-bus cache)"""
+    if model_name not in _worker_models:
+        model_folder_path = os.path.join(_worker_data_path, model_name)
+        with contextlib.redirect_stdout(io.StringIO()):
+            system_data = load_microgrid_data(model_folder_path)
+        build_ybus(system_data['buses'], system_data['lines'])
+        _worker_models[model_name] = system_data
+    return _worker_models[model_name]
+
+
+def _init_worker(data_path: str, results_path: str, preload_models: list):
+    global _worker_controller, _worker_data_path
+    _worker_data_path = data_path
+    _worker_controller = SimulationController(data_path, results_path)
+    for model_name in preload_models:
+        try:
+            _load_model(model_name)
+        except FileNotFoundError:
+            pass
+
+
+def _worker_ready() -> int:
+    time.sleep(0.05)
+    return os.getpid()
+
+
+def _copy_system_data(system_data: dict) -> dict:
+    """use case บางตัวแก้ไข DataFrame ที่ส่งเข้าไป จึงต้องส่งสำเนาให้ทุก request"""
+    copied = {}
+    for name, value in system_data.items():
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            copied[name] = value.copy()
+        elif isinstance(value, dict):
+            copied[name] = dict(value)
+        else:
+            copied[name] = value
+    return copied
+
+
+def _apply_overrides(system_data: dict, overrides: dict) -> dict:
+    """
+    นำค่า override จาก request มาใช้กับสำเนาของโมเดล
+    - "config": dict ที่ merge เข้ากับ system_config
+    - "buses" / "generators" / "loads": list ของ dict ที่มีคอลัมน์ ID และค่าที่ต้องการแก้
+    """
+    for name, value in (overrides or {}).items():
+        if name == 'config':
+            system_data['config'].update(value)
+        elif name in _OVERRIDE_KEY_COLUMNS:
+            key_col = _OVERRIDE_KEY_COLUMNS[name]
+            table = system_data[name]
+            for row_override in value:
+                if key_col not in row_override:
+                    raise ValueError(f"Override for '{name}' must include '{key_col}'.")
+                mask = table[key_col] == row_override[key_col]
+                if not mask.any():
+                    raise ValueError(f"{key_col} {row_override[key_col]} not found in '{name}'.")
+                for col, col_value in row_override.items():
+                    if col != key_col:
+                        table.loc[mask, col] = col_value
+        else:
+            raise ValueError(f"Unsupported override '{name}'.")
+    return system_data
+
+
+def to_columnar(obj):
+    """แปลงผลลัพธ์ของ use case ให้เป็นรูปแบบ columnar ที่ serialize เป็น JSON ได้"""
+    if isinstance(obj, pd.DataFrame):
+        return {
+            'columns': [str(c) for c in obj.columns],
+            'index': to_columnar(obj.index),
+            'data': {str(c): to_columnar(obj[c]) for c in obj.columns},
+        }
+    if isinstance(obj, (pd.Series, pd.Index)):
+        values = obj.values if isinstance(obj, pd.Index) else obj.to_numpy()
+        if pd.api.types.is_datetime64_any_dtype(obj.dtype):
+            return [None if pd.isna(v) else pd.Timestamp(v).isoformat() for v in values]
+        if values.dtype.kind in 'fc':
+            return [None if np.isnan(v) else v for v in values.astype(float).tolist()]
+        return [to_columnar(v) for v in values.tolist()]
+    if hasattr(obj, 'to_columnar'):
+        return to_columnar(obj.to_columnar())
+    if isinstance(obj, dict):
+        return {str(k): to_columnar(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_columnar(v) for v in obj]
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, (pd.Timestamp, pd.Timedelta)):
+        return obj.isoformat()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, float) and np.isnan(obj):
+        return None
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    return str(obj)
+
+
+def _run_request(request: dict) -> dict:
+    """ทำงานใน worker process: รัน use case หนึ่งครั้งและส่งผลลัพธ์แบบ columnar กลับ"""
+    started = time.perf_counter()
+    worker_start_wall = time.time()
+    model_name = request['model']; use_case_name = request['use_case']
+
+    system_data = _apply_overrides(_copy_system_data(_load_model(model_name)), request.get('overrides'))
+    if request.get('stream_results'):
+        # เขียนผลลง results directory ทีละ chunk ระหว่างรัน (ใช้เฉพาะชื่อไฟล์ ไม่รับ path จาก request)
+        system_data['result_stream'] = {
+            'path': os.path.join(_worker_controller.results_path, os.path.basename(request['stream_results'])),
+            'chunk_steps': int(request.get('stream_chunk_steps', 96)),
+        }
+    with contextlib.redirect_stdout(io.StringIO()):
+        output, results = _worker_controller.run_use_case(use_case_name, system_data)
+
+    return {
+        'ok': results is not None,
+        'model': model_name,
+        'use_case': use_case_name,
+        'output': output,
+        'results': to_columnar(results) if results is not None else None,
+        'worker_pid': os.getpid(),
+        'worker_start_wall': worker_start_wall,
+        'compute_ms': (time.perf_counter() - started) * 1000.0,
+    }
+
+
+class LatencyStats:
+    """เก็บ latency ของแต่ละ request (thread-safe) เพื่อรายงานผ่าน /stats"""
+
+    def __init__(self, max_samples: int = 10000):
+        self._lock = threading.Lock()
+        self._latencies_ms = deque(maxlen=max_samples)
+        self._queue_ms = deque(maxlen=max_samples)
+        self._started = time.time()
+        self.total_requests = 0
+        self.failed_requests = 0
+
+    def record(self, latency_ms: float, queue_ms: float, ok: bool):
+        with self._lock:
+            self._latencies_ms.append(latency_ms); self._queue_ms.append(queue_ms)
+            self.total_requests += 1
+            if not ok: self.failed_requests += 1
+
+    def record_rejected(self):
+        with self._lock:
+            self.total_requests += 1; self.failed_requests += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latencies = np.array(self._latencies_ms, dtype=float)
+            queue = np.array(self._queue_ms, dtype=float)
+            total = self.total_requests; failed = self.failed_requests
+        uptime_s = time.time() - self._started
+        stats = {'total_requests': total, 'failed_requests': failed, 'uptime_s': uptime_s,
+                 'throughput_rps': total / uptime_s if uptime_s > 0 else 0.0}
+        if latencies.size:
+            stats['latency_ms'] = {
+                'mean': float(latencies.mean()), 'p50': float(np.percentile(latencies, 50)),
+                'p95': float(np.percentile(latencies, 95)), 'p99': float(np.percentile(latencies, 99)),
+                'max': float(latencies.max()),
+            }
+            stats['queue_wait_ms'] = {'mean': float(queue.mean()), 'max': float(queue.max())}
+        return stats
+
+
+class SimulationService:
+    """ห่อ SimulationController ด้วย process pool ที่ warm ไว้แล้ว"""
+
+    def __init__(self, data_path: str, results_path: str, workers: int = None, preload_models: list = None):
+        self.data_path = data_path
+        self.results_path = results_path
+        self.workers = workers or os.cpu_count() or 1
+        if preload_models is None:
+            preload_models = [m for m in find_available_models(data_path)
+                              if os.path.isdir(os.path.join(data_path, m))]
+        self.available_models = preload_models
+        self.use_case_names = list(SimulationController(data_path, results_path).use_case_map.keys())
+        self.stats = LatencyStats()
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_init_worker,
+            initargs=(data_path, results_path, preload_models)
+        )
+        # บังคับให้ worker ทุกตัวเริ่มและโหลดโมเดลก่อนรับ request จริง
+        for future in [self.executor.submit(_worker_ready) for _ in range(self.workers)]:
+            future.result()
+
+    def run(self, request: dict) -> dict:
+        if request.get('use_case') not in self.use_case_names:
+            raise ValueError(f"Use case '{request.get('use_case')}' is not defined in the controller.")
+        if not request.get('model'):
+            raise ValueError("Request must name a 'model'.")
+        submitted = time.perf_counter(); submitted_wall = time.time()
+        response = self.executor.submit(_run_request, request).result()
+        latency_ms = (time.perf_counter() - submitted) * 1000.0
+        queue_ms = max(0.0, (response.pop('worker_start_wall') - submitted_wall) * 1000.0)
+        response['latency_ms'] = latency_ms; response['queue_wait_ms'] = queue_ms
+        self.stats.record(latency_ms, queue_ms, response['ok'])
+        return response
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+def _make_handler(service: SimulationService):
+    class SimulationRequestHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status: int, payload: dict):
+            body = json.dumps(payload, allow_nan=False, default=str).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/stats': self._send_json(200, service.stats.snapshot())
+            elif self.path == '/models': self._send_json(200, {'models': service.available_models, 'use_cases': service.use_case_names})
+            elif self.path == '/health': self._send_json(200, {'status': 'ok', 'workers': service.workers})
+            else: self._send_json(404, {'error': f"Unknown endpoint '{self.path}'"})
+
+        def do_POST(self):
+            if self.path != '/run':
+                self._send_json(404, {'error': f"Unknown endpoint '{self.path}'"}); return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                request = json.loads(self.rfile.read(length) or b'{}')
+                response = service.run(request)
+                self._send_json(200 if response['ok'] else 422, response)
+            except (ValueError, KeyError, json.JSONDecodeError) as e:
+                service.stats.record_rejected()
+                self._send_json(400, {'ok': False, 'error': f"{type(e).__name__}: {e}"})
+            except Exception as e:
+                service.stats.record_rejected()
+                self._send_json(500, {'ok': False, 'error': f"{type(e).__name__}: {e}"})
+
+        def log_message(self, format, *args):
+            pass
+
+    return SimulationRequestHandler
+
+
+def serve(host: str = '127.0.0.1', port: int = 8765, data_path: str = 'data',
+          results_path: str = 'results', workers: int = None):
+    service = SimulationService(data_path, results_path, workers=workers)
+    server = ThreadingHTTPServer((host, port), _make_handler(service))
+    print(f"Simulation service listening on http://{host}:{port} with {service.workers} warm workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nSimulation service stopped.")
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local microgrid simulation service (HTTP/JSON)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--data-path', default='data')
+    parser.add_argument('--results-path', default='results')
+    args = parser.parse_args()
+    serve(args.host, args.port, args.data_path, args.results_path, args.workers)
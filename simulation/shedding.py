@@ -0,0 +1,280 @@
+# simulation/shedding.py
+
+import heapq
+import numpy as np
+from scipy import sparse
+from scipy.optimize import linprog
+from .dispatch import islanded_dispatch, islanded_frequency
+from .frequency_response import nadir_table, DEFAULT_GOVERNOR_T
+
+# engine ของ shed_islanded (ค่า SheddingEngine ใน system_config.csv)
+# 'vectorized' = priority_shedding ด้านล่าง, 'loop' = while-loop เดิมทีละโหลด (ใช้ตรวจสอบผล)
+SHEDDING_ENGINES = ('vectorized', 'loop')
+# โหลดที่เล็กกว่านี้ (MW) ไม่นับเป็นโหลดที่ตัดได้
+MIN_SHEDDABLE_MW = 0.001
+
+# parameter ของวิธี shedding ที่ตั้งได้ใน system_config.csv (หรือ study[name] จาก parametric sweep)
+SHEDDING_PARAMETERS = {'shed_step': 'ShedStep', 'priority_penalty': 'PriorityPenalty', 'priority_decay': 'PriorityDecay'}
+
+def shedding_parameter(study: dict, name: str, default: float) -> float:
+    """ค่า parameter ของวิธี shedding: study[name] ถ้ามี, ไม่เช่นนั้นจาก system_config.csv หรือค่า default ของ module"""
+    value = study.get(name)
+    if value is None:
+        value = study['config'].get(SHEDDING_PARAMETERS[name], default)
+    return float(value)
+
+
+def shedding_threshold(study: dict) -> float:
+    """
+    ความถี่คงตัว (ตาม droop) ต่ำสุดที่ไม่ต้องตัดโหลด: freq_threshold ของ study
+    SheddingNadirCheck = 1 ใน system_config.csv: ให้ nadir แบบ dynamic ของ imbalance ที่เหลือไม่ต่ำกว่า threshold ด้วย
+    nadir ลดลงตาม imbalance จึงแปลงเป็น imbalance สูงสุดจาก NadirTable (cache ตามชุดเครื่อง) ครั้งเดียว
+    แล้วเป็น threshold ของความถี่คงตัวที่สูงขึ้น การตรวจแต่ละครั้งใน loop การตัดจึงยังเป็นการเทียบค่าเดียว
+    (ระบบที่ไม่มี droop ความถี่คงตัวไม่ขึ้นกับ imbalance จึงใช้ freq_threshold ตามเดิม)
+    """
+    threshold = study['freq_threshold']
+    config = study['config']; topology = study['topology']
+    if not int(config.get('SheddingNadirCheck', 0)) or topology.R_sys_hz_mw <= 0: return threshold
+    table = nadir_table(topology.online_dg, topology.R_sys_hz_mw, study['base_mva'], study['base_freq'],
+                        governor_t=float(config.get('GovernorTimeConstant', DEFAULT_GOVERNOR_T)))
+    return max(threshold, study['base_freq'] - topology.R_sys_hz_mw * table.max_imbalance_mw(threshold))
+
+
+def shedding_engine(study: dict) -> str:
+    engine = str(study['config'].get('SheddingEngine', 'vectorized')).lower()
+    if engine not in SHEDDING_ENGINES:
+        raise ValueError(f"Unknown shedding engine '{engine}' (expected one of {SHEDDING_ENGINES}).")
+    return engine
+
+
+def shed_fraction_levels(step_fraction: float) -> np.ndarray:
+    """
+    สัดส่วนที่ถูกตัดของโหลดหนึ่งตัวหลังการตัดแต่ละครั้ง สะสมแบบ float เหมือน loop เดิม
+    (step 0.1 ได้ 0.1, 0.2, 0.30000000000000004, ..., 0.9999999999999999, 1.0 รวม 11 ครั้ง)
+    """
+    levels = []
+    fraction = 0.0
+    while fraction < 1.0:
+        fraction = min(fraction + step_fraction, 1.0)
+        levels.append(fraction)
+    return np.array(levels)
+
+
+def priority_shedding(pd_loads: np.ndarray, priority: np.ndarray, status: np.ndarray, topology,
+                      base_freq: float, freq_threshold: float, step_fraction: float = 1.0) -> dict:
+    """
+    ตัดโหลดตาม Priority (ต่ำสุดก่อน, เท่ากันตัดตัวที่ Pd น้อยที่สุด) ทีละ step_fraction ของโหลดตัวนั้น
+    จนความถี่ไม่ต่ำกว่า freq_threshold ของทุก step ใน pd_loads (S, L) พร้อมกัน
+    ความถี่เป็นฟังก์ชันเชิงเส้นของ demand รวมผ่าน droop จึงไม่ต้องวน loop:
+    เรียงโหลดตาม (Priority, Pd) ครั้งเดียว, cumsum ของ MW ที่ตัดในทุกขั้น แล้วหาขั้นแรกที่ความถี่ผ่าน threshold
+    (step_fraction = 1.0 คือตัดทั้งตัว; โหลดหนึ่งตัวถูกตัดจนหมดก่อนไปตัวถัดไปเหมือน loop เดิม)
+    คืนค่า dict ของ fraction (S, L) สัดส่วนที่ตัดของแต่ละโหลด, order (S, L) ลำดับการตัด,
+    num_cut (S,) จำนวนโหลดที่ถูกตัด และ load_after, freq_after, dg_pg, gen_total หลัง shedding
+    """
+    pd_loads = np.asarray(pd_loads, dtype=float)
+    num_rows, num_loads = pd_loads.shape
+    levels = shed_fraction_levels(step_fraction)
+    sheddable = (np.asarray(status) == 1)[None, :] & (pd_loads > MIN_SHEDDABLE_MW)
+
+    # ลำดับการตัด: โหลดที่ตัดได้ก่อน, Priority ต่ำสุด, Pd น้อยสุด, แล้วตามลำดับในตาราง (lexsort เป็น stable)
+    priority = np.broadcast_to(np.asarray(priority, dtype=float), pd_loads.shape)
+    order = np.lexsort((pd_loads, priority, ~sheddable), axis=-1)
+    pd_sorted = np.take_along_axis(pd_loads, order, axis=1)
+    num_sheddable = sheddable.sum(axis=1)
+
+    # MW ที่ตัดแล้วหลังแต่ละขั้น (S, L * ขั้นต่อโหลด) = โหลดก่อนหน้าทั้งตัว + ส่วนของโหลดปัจจุบัน
+    cut_before = np.cumsum(pd_sorted, axis=1) - pd_sorted
+    shed_mw = (cut_before[:, :, None] + pd_sorted[:, :, None] * levels).reshape(num_rows, num_loads * len(levels))
+    load_before = pd_loads.sum(axis=1)
+    _, freq_stage = islanded_frequency(load_before[:, None] - shed_mw, topology.microgrid_pmax,
+                                       topology.R_sys_hz_mw, base_freq)
+    valid = np.arange(shed_mw.shape[1])[None, :] < (num_sheddable * len(levels))[:, None]
+    recovered = valid & (freq_stage >= freq_threshold)
+    # ขั้นสุดท้ายที่ตัด: ขั้นแรกที่ความถี่ผ่าน threshold หรือขั้นสุดท้ายถ้าตัดหมดแล้วยังไม่ผ่าน
+    last_stage = np.where(recovered.any(axis=1), recovered.argmax(axis=1), num_sheddable * len(levels) - 1)
+
+    num_cut = np.where(num_sheddable > 0, last_stage // len(levels) + 1, 0)
+    fraction_sorted = np.where(np.arange(num_loads)[None, :] < (num_cut - 1)[:, None], levels[-1], 0.0)
+    cutting = np.flatnonzero(num_cut > 0)
+    fraction_sorted[cutting, num_cut[cutting] - 1] = levels[last_stage[cutting] % len(levels)]
+    fraction = np.empty_like(fraction_sorted)
+    np.put_along_axis(fraction, order, fraction_sorted, axis=1)
+
+    load_after = (pd_loads * (1.0 - fraction)).sum(axis=1)
+    dg_pg, gen_total, _, freq_after = islanded_dispatch(
+        load_after, topology.dg_pmin, topology.dg_pmax, topology.dg_participation,
+        topology.microgrid_pmax, topology.R_sys_hz_mw, base_freq
+    )
+    return {
+        'fraction': fraction, 'order': order, 'num_cut': num_cut,
+        'load_after': load_after, 'freq_after': freq_after, 'dg_pg': dg_pg, 'gen_total': gen_total,
+    }
+
+
+def cut_sequence(shed: dict) -> tuple:
+    """(แถว, โหลด, สัดส่วนที่ตัด) ของโหลดทุกตัวที่ถูกตัด เรียงตามแถวและลำดับการตัด (สำหรับ shed log)"""
+    rows, position = np.nonzero(np.arange(shed['order'].shape[1])[None, :] < shed['num_cut'][:, None])
+    loads = shed['order'][rows, position]
+    return rows, loads, shed['fraction'][rows, loads]
+
+
+class DynamicPriorities:
+    """
+    Priority แบบปรับตัวของ adaptive shedding เก็บเป็น array ตามตำแหน่งโหลดในตาราง
+    - โหลดที่ถูกตัดใน step ได้ +penalty (ถูกตัดยากขึ้น)
+    - โหลดที่ไม่ถูกตัดลด -decay ต่อ step แต่ไม่ต่ำกว่าค่าเดิม
+    """
+
+    def __init__(self, priorities: np.ndarray, penalty: float = 0.2, decay: float = 0.1):
+        self.original = np.asarray(priorities, dtype=float).copy()
+        self.current = self.original.copy()
+        self.penalty = float(penalty)
+        self.decay = float(decay)
+
+    @property
+    def raised(self) -> bool:
+        """มีโหลดที่ Priority ยังสูงกว่าค่าเดิม (step ที่ไม่ตัดโหลดยังต้องอัปเดต)"""
+        return bool((self.current > self.original).any())
+
+    def end_step(self, shed_mask: np.ndarray) -> tuple:
+        """อัปเดตหลังจบ step ตามโหลดที่ถูกตัด (L,) bool คืนค่า Priority ก่อน/หลังของโหลดที่ถูกตัด"""
+        before = self.current[shed_mask]
+        after = before + self.penalty
+        self.current = np.where(shed_mask, self.current, np.maximum(self.original, self.current - self.decay))
+        self.current[shed_mask] = after
+        return before, after
+
+
+def adaptive_cut(pd_loads: np.ndarray, priorities: np.ndarray, status: np.ndarray, topology,
+                 base_freq: float, freq_threshold: float, step_fraction: float, penalty: float) -> tuple:
+    """
+    ตัดโหลดของ step เดียวทีละ step_fraction จนความถี่ไม่ต่ำกว่า threshold โดยเลือกโหลดที่ key
+    (Priority ชั่วคราว, Pd ที่เหลือ, ตำแหน่ง) ต่ำสุดจาก heap: ตัดแล้ว Priority ชั่วคราว +penalty
+    และ Pd ลดลง จึงใส่กลับเข้า heap ด้วย key ใหม่ (O(log n) ต่อการตัด) จนตัวนั้นถูกตัดหมด
+    คืนค่า (fraction (L,) สัดส่วนที่ตัดของแต่ละโหลด, load_after)
+    """
+    pd_loads = np.asarray(pd_loads, dtype=float)
+    fraction = np.zeros(len(pd_loads))
+    heap = [(priority, pd, j) for j, (priority, pd) in enumerate(zip(np.asarray(priorities, dtype=float), pd_loads))
+            if status[j] == 1 and pd > MIN_SHEDDABLE_MW]
+    heapq.heapify(heap)
+
+    load_after = pd_loads.sum()
+    _, freq = islanded_frequency(load_after, topology.microgrid_pmax, topology.R_sys_hz_mw, base_freq)
+    while freq < freq_threshold and heap:
+        priority, pd_remaining, j = heap[0]
+        fraction[j] = min(fraction[j] + step_fraction, 1.0)
+        pd_new = pd_loads[j] * (1.0 - fraction[j])
+        load_after -= pd_remaining - pd_new
+        if fraction[j] >= 1.0:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (priority + penalty, pd_new, j))
+        _, freq = islanded_frequency(load_after, topology.microgrid_pmax, topology.R_sys_hz_mw, base_freq)
+    return fraction, load_after
+
+
+# ค่าความคลาดเผื่อ (MW) ของ LP เพื่อให้ความถี่หลังตัดไม่ต่ำกว่า threshold จากความคลาดของ solver
+LP_MARGIN_MW = 1e-6
+# น้ำหนักสำหรับตัดสินโหลด Priority เท่ากัน (ตัดตัวที่เล็กกว่าก่อนเหมือนวิธี greedy)
+LP_TIE_BREAK = 1e-6
+# ค่าปรับต่อ MW ที่สายส่งเกินพิกัด (ทำให้ LP มีคำตอบเสมอแม้ตัดโหลดแล้วยังแก้การเกินพิกัดไม่ได้)
+LP_OVERLOAD_PENALTY = 1e4
+# จำนวน step ต่อ LP หนึ่งก้อน (ดู optimal_shedding)
+LP_BLOCK_ROWS = 500
+
+def optimal_shedding(pd_loads: np.ndarray, priority: np.ndarray, status: np.ndarray, topology,
+                     base_freq: float, freq_threshold: float, line_limits: dict = None) -> dict:
+    """
+    ตัดโหลดแบบ optimization ของทุก step ใน pd_loads (S, L) ด้วย LP (scipy linprog, HiGHS, sparse)
+        min  Σ Priority_j · x_sj                 (x_sj = MW ที่ตัดของโหลด j ใน step s)
+        s.t. Σ_j x_sj >= load_before_s - L_max    (ความถี่ตาม droop ไม่ต่ำกว่า threshold)
+             0 <= x_sj <= Pd_sj                   (เฉพาะโหลดที่ตัดได้)
+    L_max = Pmax + (f_base - threshold) / R_sys ถ้าตัดโหลดทั้งหมดแล้วยังไม่พอจะตัดทั้งหมด
+    line_limits (ถ้ามี): dict ของ sensitivity (lines, L) การไหลที่เพิ่มต่อ MW ที่ตัด, base_flow (S, lines)
+    การไหลก่อนตัด และ rating (lines,) พิกัด MW (DC load flow ที่ Pg ของ DG คงที่, slack รับส่วนต่าง)
+    แต่ละ step ไม่ผูกกัน LP ของทั้งช่วงจึงเป็น block-diagonal และแก้ทีละ LP_BLOCK_ROWS step ได้ผลเดียวกัน
+    (HiGHS ใช้เวลาโตเร็วกว่าเชิงเส้นเมื่อ LP ใหญ่มาก)
+    คืนค่า dict เหมือน priority_shedding (fraction, load_after, freq_after, dg_pg, gen_total)
+    พร้อม objective และ overload_mw (S,) MW ที่สายส่งยังเกินพิกัด
+    """
+    pd_loads = np.asarray(pd_loads, dtype=float)
+    num_rows = len(pd_loads)
+    if topology.R_sys_hz_mw > 0:
+        max_load = topology.microgrid_pmax + (base_freq - freq_threshold) / topology.R_sys_hz_mw
+        required = np.clip(pd_loads.sum(axis=1) - max_load + LP_MARGIN_MW, 0.0, None)
+    else:
+        required = np.zeros(num_rows)
+    rank = np.argsort(np.argsort(pd_loads.mean(axis=0), kind='stable'), kind='stable')
+    cost = np.asarray(priority, dtype=float) + LP_TIE_BREAK * rank / max(pd_loads.shape[1], 1)
+    sheddable = np.asarray(status) == 1
+
+    shed_mw = np.zeros_like(pd_loads); overload_mw = np.zeros(num_rows); objective = 0.0
+    for start in range(0, num_rows, LP_BLOCK_ROWS):
+        block = slice(start, start + LP_BLOCK_ROWS)
+        block_limits = None if line_limits is None else dict(line_limits, base_flow=line_limits['base_flow'][block])
+        shed_mw[block], overload_mw[block], block_objective = _shedding_lp(
+            pd_loads[block], required[block], cost, sheddable, block_limits)
+        objective += block_objective
+
+    fraction = np.divide(shed_mw, pd_loads, out=np.zeros_like(pd_loads), where=pd_loads > 0)
+    fraction = np.where(fraction < 1e-9, 0.0, np.where(fraction > 1.0 - 1e-9, 1.0, fraction))
+    load_after = (pd_loads * (1.0 - fraction)).sum(axis=1)
+    dg_pg, gen_total, _, freq_after = islanded_dispatch(
+        load_after, topology.dg_pmin, topology.dg_pmax, topology.dg_participation,
+        topology.microgrid_pmax, topology.R_sys_hz_mw, base_freq
+    )
+    return {
+        'fraction': fraction, 'load_after': load_after, 'freq_after': freq_after, 'dg_pg': dg_pg,
+        'gen_total': gen_total, 'objective': objective, 'overload_mw': overload_mw,
+    }
+
+
+def _shedding_lp(pd_loads: np.ndarray, required: np.ndarray, cost: np.ndarray, sheddable: np.ndarray,
+                 line_limits: dict) -> tuple:
+    """LP ของ optimal_shedding หนึ่ง block: คืนค่า (MW ที่ตัด (S, L), overload (S,), objective)"""
+    num_rows, num_loads = pd_loads.shape
+    rows, loads = np.nonzero(sheddable[None, :] & (pd_loads > MIN_SHEDDABLE_MW))
+    upper = pd_loads[rows, loads]
+    num_x = len(rows)
+    required = np.minimum(required, np.bincount(rows, weights=upper, minlength=num_rows))
+
+    costs = [cost[loads]]
+    bounds = [np.column_stack([np.zeros(num_x), upper])]
+    # Σ_j x_sj >= required_s  ->  -Σ_j x_sj <= -required_s
+    a_rows = [rows]; a_cols = [np.arange(num_x)]; a_vals = [-np.ones(num_x)]
+    b_ub = [-required]
+
+    num_overload = 0
+    if line_limits is not None:
+        sensitivity = np.asarray(line_limits['sensitivity'], dtype=float)
+        base_flow = np.asarray(line_limits['base_flow'], dtype=float)
+        rating = np.asarray(line_limits['rating'], dtype=float)
+        limited = np.flatnonzero(rating > 0)  # rating = 0 คือไม่จำกัด
+        num_limited = len(limited); num_overload = num_rows * num_limited
+        # |base_flow + Σ_j sensitivity_lj x_sj| <= rating + overload_sl  (overload >= 0 มีค่าปรับ)
+        x_rows = (rows[:, None] * num_limited + np.arange(num_limited)).ravel()
+        x_cols = np.repeat(np.arange(num_x), num_limited)
+        x_vals = sensitivity[limited][:, loads].T.ravel()
+        overload = np.arange(num_overload)
+        for k, sign in enumerate((1.0, -1.0)):
+            offset = num_rows + k * num_overload
+            a_rows += [offset + x_rows, offset + overload]
+            a_cols += [x_cols, num_x + overload]
+            a_vals += [sign * x_vals, -np.ones(num_overload)]
+            b_ub.append((rating[limited] - sign * base_flow[:, limited]).ravel())
+        costs.append(np.full(num_overload, LP_OVERLOAD_PENALTY))
+        bounds.append(np.column_stack([np.zeros(num_overload), np.full(num_overload, np.inf)]))
+
+    shed_mw = np.zeros_like(pd_loads)
+    if num_x + num_overload == 0:
+        return shed_mw, np.zeros(num_rows), 0.0
+    b_ub = np.concatenate(b_ub)
+    a_ub = sparse.csr_matrix((np.concatenate(a_vals), (np.concatenate(a_rows), np.concatenate(a_cols))),
+                             shape=(len(b_ub), num_x + num_overload))
+    solution = linprog(np.concatenate(costs), A_ub=a_ub, b_ub=b_ub, bounds=np.vstack(bounds), method='highs')
+    if solution.status != 0:
+        raise RuntimeError(f"Optimal load shedding LP failed: {solution.message}")
+    shed_mw[rows, loads] = np.clip(solution.x[:num_x], 0.0, upper)
+    overload_mw = solution.x[num_x:].reshape(num_rows, -1).sum(axis=1) if num_overload else np.zeros(num_rows)
+    return shed_mw, overload_mw, solution.fun
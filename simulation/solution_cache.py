@@ -0,0 +1,108 @@
+# simulation/solution_cache.py
+
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+class SolutionCache:
+    """
+    แคชคำตอบ Load Flow (V, delta) ของจุดทำงานที่ซ้ำกัน
+    key = hash ของ topology (Y-bus + ชนิดบัส) + กำลังฉีดของทุกบัสที่ปัดเป็นขั้นละ tolerance_mw
+    - mode 'reuse': ถ้าเจอ key เดิมจะคืนคำตอบที่เก็บไว้เลยโดยไม่แก้ NR
+      (คำตอบคลาดได้ไม่เกินผลของการเปลี่ยนกำลังฉีด tolerance_mw)
+    - mode 'warm_start': ใช้คำตอบที่เก็บไว้เป็นจุดเริ่มของ NR (ผลยังลู่เข้าตาม tolerance ของ NR เอง)
+    เก็บไม่เกิน max_entries รายการ โดยทิ้งรายการที่ใช้ล่าสุดนานที่สุดก่อน (LRU)
+    """
+
+    MODES = ('reuse', 'warm_start')
+
+    def __init__(self, max_entries: int = 4096, tolerance_mw: float = 1e-4, mode: str = 'reuse'):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown solution cache mode '{mode}' (expected one of {self.MODES}).")
+        if tolerance_mw <= 0:
+            raise ValueError(f"Solution cache tolerance must be positive (got {tolerance_mw}).")
+        self.max_entries = max(1, int(max_entries))
+        self.tolerance_mw = float(tolerance_mw)
+        self.mode = mode
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def topology_key(y_bus: np.ndarray, bus_types: np.ndarray) -> bytes:
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(np.ascontiguousarray(y_bus).tobytes())
+        digest.update(np.ascontiguousarray(bus_types, dtype=np.int64).tobytes())
+        return digest.digest()
+
+    def keys(self, topology_key: bytes, P_sch_mw: np.ndarray, Q_sch_mvar: np.ndarray) -> list:
+        """key ของแต่ละกรณี จากกำลังฉีดสุทธิต่อบัส (K, n) หน่วย MW/MVAR"""
+        quantized = np.rint(np.concatenate([P_sch_mw, Q_sch_mvar], axis=1) / self.tolerance_mw).astype(np.int64)
+        return [topology_key + row.tobytes() for row in quantized]
+
+    def get(self, key: bytes):
+        """คืน (V, delta) ที่เก็บไว้ หรือ None (นับ hit/miss)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def count_hits(self, count: int):
+        """นับ hit ของกรณีที่ใช้คำตอบร่วมกับกรณีอื่นใน batch เดียวกัน (ไม่ต้องค้นในแคช)"""
+        self.hits += int(count)
+
+    def put(self, key: bytes, V: np.ndarray, delta: np.ndarray):
+        self._entries[key] = (np.array(V, dtype=float), np.array(delta, dtype=float))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    @property
+    def lookups(self) -> int:
+        return self.hits + self.misses
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def reset_stats(self):
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        return {
+            'mode': self.mode, 'tolerance_mw': self.tolerance_mw, 'entries': len(self._entries),
+            'hits': self.hits, 'misses': self.misses, 'lookups': self.lookups,
+            'hit_rate': self.hit_rate, 'evictions': self.evictions,
+        }
+
+    def summary(self) -> str:
+        return (f"Solution cache ({self.mode}): {self.hits}/{self.lookups} hits "
+                f"({self.hit_rate:.1%}), {len(self._entries)} entries, {self.evictions} evicted")
+
+
+def create_solution_cache(system_data: dict):
+    """
+    สร้าง SolutionCache ตามค่าใน system_data['solution_cache'] (dict) หรือ system_config.csv
+    (SolutionCacheTolerance, SolutionCacheSize, SolutionCacheMode)
+    ไม่ได้ตั้งค่าไว้ = ไม่ใช้แคช (คืน None)
+    """
+    options = system_data.get('solution_cache')
+    if isinstance(options, SolutionCache):
+        return options
+    config = system_data.get('config', {}) or {}
+    if not options and 'SolutionCacheTolerance' not in config:
+        return None
+    options = options if isinstance(options, dict) else {}
+    return SolutionCache(
+        max_entries=int(options.get('max_entries', config.get('SolutionCacheSize', 4096))),
+        tolerance_mw=float(options.get('tolerance_mw', config.get('SolutionCacheTolerance', 1e-4))),
+        mode=str(options.get('mode', config.get('SolutionCacheMode', 'reuse'))),
+    )
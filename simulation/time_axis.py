@@ -0,0 +1,162 @@
+# simulation/time_axis.py
+
+import numpy as np
+import pandas as pd
+
+SECONDS_PER_DAY = 86400
+
+class TimeAxis:
+    """
+    แกนเวลาของ use case แบบ time-series (เวลาเริ่ม, ขนาด step และจำนวน step)
+    ตั้งค่าได้จาก system_config.csv:
+        TimeStepSeconds     ขนาด step (ค่าเริ่มต้น = ความละเอียดของ load profile, 900 s)
+        StartTime           เวลาเริ่มแบบ HH.MM (ค่าเริ่มต้น 00.00)
+        HorizonHours        ความยาวการจำลอง (ค่าเริ่มต้น = ความยาวของ load profile)
+        ProfileStepSeconds  ความละเอียดของ load_profile_pattern.csv (ค่าเริ่มต้น 900 s)
+    ถ้าไฟล์ load profile มีคอลัมน์ 'datetime' จะใช้เวลาเริ่มและความละเอียดจากคอลัมน์นั้นแทน
+    """
+
+    TIME_COLUMN = 'datetime'
+    DEFAULT_STEP_SECONDS = 900.0
+    DEFAULT_START = pd.Timestamp('1900-01-01 00:00')
+
+    def __init__(self, start, step_seconds: float, num_steps: int,
+                 profile_step_seconds: float = DEFAULT_STEP_SECONDS, profile_start=DEFAULT_START):
+        if step_seconds <= 0:
+            raise ValueError(f"Time step must be positive (got {step_seconds} s).")
+        if num_steps <= 0:
+            raise ValueError(f"Time axis must have at least one step (got {num_steps}).")
+        self.start = pd.Timestamp(start)
+        self.step_seconds = float(step_seconds)
+        self.num_steps = int(num_steps)
+        # ความละเอียดและเวลาเริ่มของไฟล์ load profile (ใช้ตอน interpolate)
+        self.profile_step_seconds = float(profile_step_seconds)
+        self.profile_start = pd.Timestamp(profile_start)
+        self._index = None
+
+    def __len__(self) -> int:
+        return self.num_steps
+
+    def __repr__(self) -> str:
+        return f"TimeAxis(start={self.start}, step={self.step_seconds:g}s, num_steps={self.num_steps})"
+
+    @property
+    def step_hours(self) -> float:
+        return self.step_seconds / 3600.0
+
+    @property
+    def seconds(self) -> np.ndarray:
+        """เวลาของแต่ละ step นับจาก start (วินาที)"""
+        return np.arange(self.num_steps) * self.step_seconds
+
+    @property
+    def index(self) -> pd.DatetimeIndex:
+        if self._index is None:
+            self._index = self.start + pd.to_timedelta(self.seconds, unit='s')
+        return self._index
+
+    def label(self, step: int) -> str:
+        """ข้อความเวลาสำหรับ log (แสดงวินาทีเมื่อ step เล็กกว่า 1 นาที)"""
+        return self.index[step].strftime('%H:%M:%S' if self.step_seconds < 60 else '%H:%M')
+
+    @staticmethod
+    def _clock_seconds(hhmm: float) -> int:
+        """แปลงค่า HH.MM จาก config เป็นวินาทีนับจากเที่ยงคืน"""
+        hour = int(hhmm)
+        minute = int(round((hhmm * 100) % 100))
+        return hour * 3600 + minute * 60
+
+    def step_at_clock(self, hhmm: float) -> int:
+        """step แรกที่เวลา HH.MM เกิดขึ้นนับจาก start"""
+        start_of_day = (self.start - self.start.normalize()).total_seconds()
+        offset = (self._clock_seconds(hhmm) - start_of_day) % SECONDS_PER_DAY
+        return int(offset // self.step_seconds)
+
+    @property
+    def random_step_range(self) -> tuple:
+        """ช่วง [low, high) ของ step ที่สุ่มเป็นเวลาตัด MPG (ไม่เอา step แรกสุดและ 5 step สุดท้าย)"""
+        return 1, max(2, self.num_steps - 5)
+
+    def disconnection_step(self, config: dict, rng: np.random.Generator = None) -> int:
+        """
+        แปลความหมายของ Disconnecting_Time จากไฟล์ config
+        - 99: สุ่มเวลา (ดู random_step_range) ด้วย rng หรือ numpy Generator จาก RandomSeed ใน config
+          (ไม่ได้ตั้ง RandomSeed = สุ่มใหม่ทุกครั้ง)
+        - ทศนิยม (HH.MM): แปลงเป็น step ตามขนาด step ของแกนเวลา
+        - จำนวนเต็ม: ใช้เป็น step โดยตรง
+        """
+        disconnect_value = config.get('Disconnecting_Time', 99)  # Default to random if not specified
+        try:
+            disconnect_value = float(disconnect_value)
+        except (ValueError, TypeError):
+            raise TypeError(f"Invalid 'Disconnecting_Time' value '{disconnect_value}'. Must be a number.")
+
+        if disconnect_value == 99:
+            if rng is None:
+                seed = config.get('RandomSeed')
+                rng = np.random.default_rng(None if seed is None else int(seed))
+            step = int(rng.integers(*self.random_step_range))
+            print(f"   - Random disconnection time selected: Step {step}")
+            return step
+
+        if disconnect_value == int(disconnect_value):  # Case: จำนวนเต็ม
+            step = int(disconnect_value)
+        else:  # Case: ทศนิยม (HH.MM)
+            step = self.step_at_clock(disconnect_value)
+            print(f"   - Disconnection time {disconnect_value:05.2f} converted to Step {step}")
+
+        if not (0 <= step < self.num_steps):
+            raise ValueError(
+                f"Invalid 'Disconnecting_Time' ({disconnect_value}) results in an out-of-bounds step ({step}). "
+                f"Please choose a value that results in a step between 0 and {self.num_steps - 1}."
+            )
+        return step
+
+    def profile(self, load_profile: pd.DataFrame, patterns) -> np.ndarray:
+        """
+        ค่า load multiplier ของ pattern บนแกนเวลานี้
+        ถ้าความละเอียดหรือความยาวไม่ตรงกับไฟล์ profile จะ interpolate เชิงเส้น
+        และวนซ้ำ profile เป็นรอบ (เช่น profile 1 วันกับการจำลองหลายวัน)
+        คืนค่า (steps,) สำหรับ pattern เดียว หรือ (steps, patterns) ถ้าส่งเป็น list
+        """
+        values = load_profile[patterns].to_numpy(dtype=float)
+        profile_step, profile_start = self.profile_step_seconds, self.profile_start
+        num_points = values.shape[0]
+        if (self.step_seconds == profile_step and self.num_steps <= num_points
+                and self.start == profile_start):
+            return values[:self.num_steps].copy()
+
+        period = num_points * profile_step
+        t_axis = (self.start - profile_start).total_seconds() + self.seconds
+        t_profile = np.arange(num_points) * profile_step
+        if values.ndim == 1:
+            return np.interp(t_axis, t_profile, values, period=period)
+        return np.column_stack([np.interp(t_axis, t_profile, values[:, p], period=period)
+                                for p in range(values.shape[1])])
+
+    @classmethod
+    def from_system_data(cls, system_data: dict) -> 'TimeAxis':
+        config = system_data.get('config', {}) or {}
+        load_profile = system_data.get('load_profile')
+        profile_step, profile_start = _profile_resolution(load_profile, config.get('ProfileStepSeconds'))
+        num_points = len(load_profile) if load_profile is not None else 0
+
+        step_seconds = float(config.get('TimeStepSeconds', profile_step))
+        start = profile_start
+        if 'StartTime' in config:
+            start = profile_start.normalize() + pd.Timedelta(seconds=cls._clock_seconds(float(config['StartTime'])))
+
+        if 'HorizonHours' in config:
+            num_steps = int(round(float(config['HorizonHours']) * 3600.0 / step_seconds))
+        else:
+            num_steps = int(round(num_points * profile_step / step_seconds))
+        return cls(start, step_seconds, num_steps, profile_step, profile_start)
+
+
+def _profile_resolution(load_profile: pd.DataFrame, profile_step_seconds: float = None) -> tuple:
+    """(ขนาด step, เวลาเริ่ม) ของไฟล์ load profile"""
+    if load_profile is not None and TimeAxis.TIME_COLUMN in load_profile.columns and len(load_profile) > 1:
+        stamps = pd.to_datetime(load_profile[TimeAxis.TIME_COLUMN])
+        return float(stamps.diff().dropna().median().total_seconds()), pd.Timestamp(stamps.iloc[0])
+    step = float(profile_step_seconds) if profile_step_seconds else TimeAxis.DEFAULT_STEP_SECONDS
+    return step, TimeAxis.DEFAULT_START
@@ -2,12 +2,22 @@
 
 import pandas as pd
 import numpy as np
-from ..newtonrapson_loadflow import run_newton_raphson
+from tabulate import tabulate
+from ..newtonrapson_loadflow import run_newton_raphson_batch, bus_incidence
 from ..ybus_builder import build_ybus
+from ..result_store import TimeSeriesResultStore, create_result_store
+from ..dispatch import grid_connected_dispatch
+from ..time_axis import TimeAxis
+from ..parallel import chunk_bounds, map_chunks, parallel_options
+from ..solution_cache import create_solution_cache
+
+# จำนวน step ที่แก้ Load Flow พร้อมกันต่อ batch (จำกัดขนาด Jacobian ในหน่วยความจำ)
+BLOCK_STEPS = 2048
 
 def run(system_data: dict) -> tuple:
     output_string = ""
     results_dict = None
+    result_store = None
     
     try:
         output_string += "[1] Preparing for time-series simulation...\n"
@@ -21,106 +31,65 @@ def run(system_data: dict) -> tuple:
         lines = system_data['lines']
         initial_gens = system_data['generators']
         initial_loads = system_data['loads']
-        load_profile = system_data['load_profile']['pattern_1'].tolist()
-        num_steps = len(load_profile)
-        
-        
-        initial_loads['pf'] = (initial_loads['Pd_MW'] / 
-                               ((initial_loads['Pd_MW']**2 + initial_loads['Qd_MVAR']**2)**0.5)).fillna(0.9)
+        time_axis = TimeAxis.from_system_data(system_data)
+        load_profile = time_axis.profile(system_data['load_profile'], 'pattern_1')
+        num_steps = time_axis.num_steps
 
         ybus_matrix = build_ybus(buses, lines)
-        time_index = pd.to_datetime("00:00", format='%H:%M') + pd.to_timedelta(pd.Series(range(num_steps)) * 15, unit='m')
-        
-        output_string += f"[2] Running simulation for {num_steps} time steps...\n"
-        all_results_dataframes = []
-        
-        for step, multiplier in enumerate(load_profile):
-            current_loads = initial_loads.copy()
-            current_loads['Pd_MW'] = initial_loads['Pd_MW'] * multiplier
-            current_loads['Qd_MVAR'] = current_loads['Pd_MW'] * ((1 / current_loads['pf']**2) - 1)**0.5
-            total_demand = current_loads['Pd_MW'].sum()
-            
-            dispatched_gens = initial_gens.copy()
-
-            # --- ส่วนที่เพิ่มเข้ามา: PF Dispatch Logic ---
-            active_gens = dispatched_gens[dispatched_gens['Status'] == 1].copy()
-            pg_total_initial = active_gens['Pg_MW'].sum()
-            initial_mismatch = total_demand - pg_total_initial
-            
-            slack_bus_id = buses[buses['Type'] == 1]['BusID'].iloc[0]
-            participating_gens_mask = (active_gens['BusID'] != slack_bus_id)
-            
-            if participating_gens_mask.any():
-                participating_gens = active_gens[participating_gens_mask]
-                pf_sum = participating_gens['ParticipationFactor'].sum()
-                if pf_sum > 1e-6:
-                    adjustment = initial_mismatch * (participating_gens['ParticipationFactor'] / pf_sum)
-                    active_gens.loc[participating_gens_mask, 'Pg_MW'] += adjustment
-                    active_gens['Pg_MW'] = active_gens.apply(lambda r: np.clip(r['Pg_MW'], r['Pmin_MW'], r['Pmax_MW']), axis=1)
-                    
-                    dispatched_gens.set_index('GenID', inplace=True)
-                    dispatched_gens.update(active_gens.set_index('GenID')['Pg_MW'])
-                    dispatched_gens.reset_index(inplace=True)
-            # --- จบส่วน PF Dispatch Logic ---
-
-            converged, results_df, _, losses = run_newton_raphson(
-                bus_data=buses,
-                gen_data=dispatched_gens,
-                load_data=current_loads,
-                y_bus=ybus_matrix,
-                base_mva=BASE_MVA
-            )
-            
-            if converged:
-                # Post-processing clamp for slack bus display
-                slack_bus_row = results_df[results_df['Type'] == 1]
-                if not slack_bus_row.empty:
-                    slack_bus_id_current = slack_bus_row['BusID'].iloc[0]
-                    gen_at_slack = dispatched_gens[dispatched_gens['BusID'] == slack_bus_id_current]
-                    if not gen_at_slack.empty:
-                        pmax_slack = gen_at_slack['Pmax_MW'].iloc[0]
-                        slack_row_index = slack_bus_row.index[0]
-                        current_pg = results_df.loc[slack_row_index, 'Pg_final_MW']
-                        if current_pg > pmax_slack:
-                            results_df.loc[slack_row_index, 'Pg_final_MW'] = pmax_slack
-
-                results_df['Frequency_Hz'] = 50.0
-                results_df['time_step'] = step
-                all_results_dataframes.append(results_df)
-            else:
-                output_string += f"\n[ERROR] Load flow did not converge at time step {step} ({time_index[step].strftime('%H:%M')})."
-                if all_results_dataframes:
-                    last_good_result = all_results_dataframes[-1].copy()
-                    last_good_result['time_step'] = step
-                    all_results_dataframes.append(last_good_result)
+        slack_bus_id = buses[buses['Type'] == 1]['BusID'].iloc[0]
+
+        output_string += f"[2] Running simulation for {num_steps} time steps ({time_axis.step_seconds:g} s per step)...\n"
+        result_store = create_result_store(system_data, buses, time_axis.index)
+        result_store.track('Pg_final_MW', initial_gens['BusID'].unique())
+
+        # แก้ Load Flow ทีละ chunk ของ step (กระจายให้หลาย process ได้) แล้วรวมผลตามลำดับเวลา
+        parallel = parallel_options(system_data)
+        bounds = chunk_bounds(num_steps, parallel['chunk_steps'])
+        if parallel['workers'] > 1:
+            output_string += f"    - {len(bounds)} chunk(s) of {parallel['chunk_steps']} steps on {parallel['workers']} worker processes\n"
+        # แคชคำตอบใช้ได้เฉพาะการรันใน process เดียว (worker แต่ละตัวมีหน่วยความจำแยกกัน)
+        solution_cache = create_solution_cache(system_data) if parallel['workers'] <= 1 else None
+        chunk_args = (load_profile, buses, initial_gens, initial_loads, ybus_matrix, BASE_MVA, slack_bus_id,
+                      parallel['warm_start_steps'], solution_cache)
+        previous_step = None
+        for start, stop, solution in map_chunks(_solve_chunk, bounds, chunk_args, parallel['workers']):
+            steps = np.arange(start, stop)
+            columns = {col: solution[col] for col in TimeSeriesResultStore.RESULT_COLUMNS}
+            for k in np.where(~solution['converged'])[0]:
+                step = steps[k]
+                output_string += f"\n[ERROR] Load flow did not converge at time step {step} ({time_axis.label(step)})."
+                if k > 0:
+                    for arr in columns.values(): arr[k] = arr[k - 1]
+                elif previous_step is not None:
+                    for col, arr in columns.items(): arr[k] = previous_step[col]
                 else:
                     raise RuntimeError(f"NR Converge Failed at step {step}")
+            result_store.record_block(start, 50.0, **columns)
+            previous_step = {col: arr[-1].copy() for col, arr in columns.items()}
         
-        if not all_results_dataframes:
+        result_store.close()
+        if not result_store.recorded.any():
             raise RuntimeError("Simulation failed to produce any results.")
 
         output_string += "\n[3] Consolidating and formatting results...\n"
-        full_df = pd.concat(all_results_dataframes, ignore_index=True)
-        
-        time_map = {step: time for step, time in enumerate(time_index)}
-        full_df['datetime'] = full_df['time_step'].map(time_map)
-        
         gen_info = system_data['generators'][['GenID', 'BusID']]
-        results_with_gen_id = pd.merge(full_df, gen_info, on='BusID', how='left')
-        online_gens_df = results_with_gen_id.dropna(subset=['GenID'])
-        pivoted_gens = online_gens_df.pivot_table(index='datetime', columns='GenID', values='Pg_final_MW', aggfunc='sum').fillna(0)
-        total_load_mw = full_df.groupby('datetime')['Pd_final_MW'].sum()
+        pivoted_gens = _pivot_gens_by_id(result_store, gen_info)
+        total_load_mw = result_store.total('Pd_final_MW')
         
         results_dict = {
-            "full_df": full_df,
+            "result_store": result_store,
             "summary_data": {
                 "total_load_mw": total_load_mw,
                 "pivoted_gens_mw": pivoted_gens,
             }
         }
+        if solution_cache is not None:
+            output_string += f"    - {solution_cache.summary()}\n"
+            results_dict["solution_cache"] = solution_cache.stats()
         output_string += "\nContinuous Load Flow Simulation Completed."
         
     except Exception as e:
+        if result_store is not None: result_store.close()  # เก็บผลที่เขียนไปแล้วไว้ในไฟล์
         import traceback
         output_string += f"\n--- AN ERROR OCCURRED IN '{run.__name__}' USE CASE ---\n"
         output_string += f"Error Type: {type(e).__name__}\n"
@@ -129,4 +98,181 @@ def run(system_data: dict) -> tuple:
         output_string += traceback.format_exc()
         results_dict = None
 
-    return output_string, results_dict
\ No newline at end of file
+    return output_string, results_dict
+
+def _pivot_gens_by_id(result_store: TimeSeriesResultStore, gen_info: pd.DataFrame) -> pd.DataFrame:
+    """Pg ของแต่ละ generator ตามเวลา (index = datetime, columns = GenID)"""
+    pg_by_bus = result_store.wide('Pg_final_MW')
+    gen_info = gen_info[gen_info['BusID'].isin(pg_by_bus.columns)].sort_values('GenID')
+    pivoted = pg_by_bus[gen_info['BusID'].values].copy()
+    pivoted.columns = pd.Index(gen_info['GenID'].values, name='GenID')
+    return pivoted
+
+
+def _resolve_patterns(system_data: dict, patterns: list = None) -> list:
+    """
+    เลือก pattern ที่จะรัน: ใช้ค่าที่ส่งเข้ามา, หรือ 'LoadPatterns' ใน system_config
+    (คั่นด้วย ';' เช่น pattern_1;pattern_3), หรือทุก pattern ในไฟล์ load profile
+    """
+    available = [c for c in system_data['load_profile'].columns if c != TimeAxis.TIME_COLUMN]
+    if patterns is None:
+        config_value = system_data.get('config', {}).get('LoadPatterns')
+        if isinstance(config_value, str) and config_value.strip():
+            patterns = [p.strip() for p in config_value.split(';') if p.strip()]
+        elif isinstance(config_value, (list, tuple)):
+            patterns = list(config_value)
+        else:
+            patterns = available
+    missing = [p for p in patterns if p not in available]
+    if missing:
+        raise ValueError(f"Load pattern(s) {missing} not found in load_profile_pattern.csv (available: {available}).")
+    return list(patterns)
+
+
+def _solve_chunk(start: int, stop: int, load_profile: np.ndarray, buses: pd.DataFrame, initial_gens: pd.DataFrame,
+                 initial_loads: pd.DataFrame, ybus_matrix: np.ndarray, base_mva: float, slack_bus_id,
+                 warm_start_steps: int = None, solution_cache=None) -> dict:
+    """แก้ step [start, stop) หนึ่ง chunk (เรียกจาก worker process ได้) โดย warm start ต่อกันภายใน chunk"""
+    return _solve_scenarios(load_profile[start:stop], buses, initial_gens, initial_loads,
+                            ybus_matrix, base_mva, slack_bus_id, warm_start_steps=warm_start_steps,
+                            solution_cache=solution_cache)
+
+
+def _solve_scenarios(multipliers: np.ndarray, buses: pd.DataFrame, initial_gens: pd.DataFrame,
+                     initial_loads: pd.DataFrame, ybus_matrix: np.ndarray, base_mva: float, slack_bus_id,
+                     warm_start_steps: int = None, solution_cache=None) -> dict:
+    """
+    PF dispatch + Newton-Raphson ของหลายกรณี (load multiplier ต่อกรณี) พร้อมกันแบบ vectorized
+    warm_start_steps: กรณีเรียงต่อกันตามเวลา ให้ช่วงถัดไปเริ่มจากคำตอบของช่วงก่อน
+    solution_cache: SolutionCache สำหรับจุดทำงานที่ซ้ำกัน (ถ้ามี)
+    คืนค่า dict ของ array (K, buses) ตามชื่อคอลัมน์ของ TimeSeriesResultStore พร้อม converged และ losses
+    """
+    bus_ids = buses['BusID'].values
+
+    # --- Load ของทุกกรณี: (K, loads) ---
+    pd_base = initial_loads['Pd_MW'].to_numpy(dtype=float)
+    pf = (initial_loads['Pd_MW'] / ((initial_loads['Pd_MW']**2 + initial_loads['Qd_MVAR']**2)**0.5)).fillna(0.9).to_numpy()
+    pd_loads = multipliers[:, None] * pd_base[None, :]
+    qd_loads = pd_loads * ((1 / pf**2) - 1)**0.5
+
+    # --- PF Dispatch ของทุกกรณีพร้อมกัน ---
+    pg_gens = grid_connected_dispatch(pd_loads.sum(axis=1), initial_gens, slack_bus_id)
+
+    # --- รวมค่าลงบัสแล้วแก้ Load Flow ทั้งหมดในครั้งเดียว ---
+    gen_incidence = bus_incidence(initial_gens['BusID'].values, bus_ids)
+    load_incidence = bus_incidence(initial_loads['BusID'].values, bus_ids)
+    solution = run_newton_raphson_batch(
+        buses, ybus_matrix, pg_gens @ gen_incidence, initial_gens['Qg_MVAR'].to_numpy(dtype=float) @ gen_incidence,
+        pd_loads @ load_incidence, qd_loads @ load_incidence, base_mva, batch_size=BLOCK_STEPS,
+        warm_start_steps=warm_start_steps, cache=solution_cache
+    )
+
+    # Post-processing clamp for slack bus display
+    slack_positions = np.where(buses['Type'].values == 1)[0]
+    gen_at_slack = initial_gens[initial_gens['BusID'] == slack_bus_id]
+    if len(slack_positions) and not gen_at_slack.empty:
+        pg_final = solution['Pg_final_MW']
+        pg_final[:, slack_positions[0]] = np.minimum(pg_final[:, slack_positions[0]], gen_at_slack['Pmax_MW'].iloc[0])
+    return solution
+
+
+def run_multi_pattern(system_data: dict, patterns: list = None) -> tuple:
+    """
+    รัน Continuous Load Flow หลาย load pattern ในครั้งเดียว
+    โดยซ้อนมิติ scenario (pattern x time step) แล้วคำนวณ PF dispatch และ Newton-Raphson
+    ของทุกกรณีพร้อมกันแบบ vectorized
+    """
+    output_string = ""
+    results_dict = None
+
+    try:
+        output_string += "[1] Preparing for multi-pattern time-series simulation...\n"
+        if system_data.get('load_profile') is None:
+            raise FileNotFoundError("load_profile_pattern.csv not found in 'data/' directory.")
+
+        config = system_data.get('config', {})
+        BASE_MVA = config.get('BaseMVA', 100.0)
+        pattern_names = _resolve_patterns(system_data, patterns)
+
+        buses = system_data['buses']
+        lines = system_data['lines']
+        initial_gens = system_data['generators']
+        initial_loads = system_data['loads']
+        time_axis = TimeAxis.from_system_data(system_data)
+        profile = time_axis.profile(system_data['load_profile'], pattern_names)  # (steps, patterns)
+        num_steps, num_patterns = profile.shape
+        multipliers = profile.T.reshape(-1)  # (patterns * steps,) เรียงแบบ pattern-major
+
+        ybus_matrix = build_ybus(buses, lines)
+        bus_ids = buses['BusID'].values
+        slack_bus_id = buses[buses['Type'] == 1]['BusID'].iloc[0]
+        slack_positions = np.where(buses['Type'].values == 1)[0]
+
+        output_string += f"[2] Solving {num_patterns} pattern(s) x {num_steps} time steps as one stacked batch...\n"
+        solution_cache = create_solution_cache(system_data)
+        solution = _solve_scenarios(multipliers, buses, initial_gens, initial_loads, ybus_matrix, BASE_MVA, slack_bus_id,
+                                    solution_cache=solution_cache)
+
+        output_string += "\n[3] Consolidating per-pattern results...\n"
+        columns = {col: solution[col].reshape(num_patterns, num_steps, -1) for col in TimeSeriesResultStore.RESULT_COLUMNS}
+        converged = solution['converged'].reshape(num_patterns, num_steps)
+        losses = solution['losses'].reshape(num_patterns, num_steps)
+        V = columns['V_final_pu']; pg_final = columns['Pg_final_MW']
+
+        gen_info = initial_gens[['GenID', 'BusID']]
+        pattern_results = {}; summary_rows = []
+        for p, pattern_name in enumerate(pattern_names):
+            # step ที่ไม่ converge ใช้ผลของ step ก่อนหน้า (เหมือนโหมด pattern เดียว)
+            failed_steps = np.where(~converged[p])[0]
+            if failed_steps.size and failed_steps[0] == 0:
+                raise RuntimeError(f"NR Converge Failed at step 0 for {pattern_name}")
+            for step in failed_steps:
+                output_string += f"\n[ERROR] {pattern_name}: Load flow did not converge at time step {step} ({time_axis.label(step)})."
+                for arr in columns.values():
+                    arr[p, step] = arr[p, step - 1]
+
+            # ผลถูกคำนวณแบบ batch อยู่แล้ว จึงเก็บไว้ในหน่วยความจำ แล้วเขียนลงไฟล์ทีละ chunk ถ้ามีการ stream
+            result_store = create_result_store(system_data, buses, time_axis.index, suffix=pattern_name, keep_in_memory=True)
+            result_store.record_block(0, 50.0, **{col: arr[p] for col, arr in columns.items()})
+            result_store.close()
+            total_load_mw = result_store.total('Pd_final_MW')
+            pattern_results[pattern_name] = {
+                "result_store": result_store,
+                "summary_data": {"total_load_mw": total_load_mw, "pivoted_gens_mw": _pivot_gens_by_id(result_store, gen_info)},
+            }
+
+            v_min_pos = np.unravel_index(np.argmin(V[p]), V[p].shape)
+            summary_rows.append({
+                'pattern': pattern_name,
+                'peak_load_mw': total_load_mw.max(),
+                'energy_mwh': total_load_mw.sum() * time_axis.step_hours,
+                'losses_mwh': losses[p].sum() * time_axis.step_hours,
+                'peak_slack_mw': pg_final[p][:, slack_positions[0]].max() if len(slack_positions) else np.nan,
+                'min_voltage_pu': V[p].min(),
+                'min_voltage_bus': int(bus_ids[v_min_pos[1]]),
+                'max_voltage_pu': V[p].max(),
+                'nonconverged_steps': int(failed_steps.size),
+            })
+
+        pattern_summary = pd.DataFrame(summary_rows).set_index('pattern')
+        results_dict = {
+            "patterns": pattern_results,
+            "pattern_summary": pattern_summary,
+        }
+        if solution_cache is not None:
+            output_string += f"\n{solution_cache.summary()}\n"
+            results_dict["solution_cache"] = solution_cache.stats()
+        output_string += "\n--- Per-Pattern Summary ---\n"
+        output_string += tabulate(pattern_summary.reset_index(), headers='keys', tablefmt='simple_outline', showindex=False, floatfmt=".4f") + "\n"
+        output_string += "\nMulti-Pattern Continuous Load Flow Simulation Completed."
+
+    except Exception as e:
+        import traceback
+        output_string += f"\n--- AN ERROR OCCURRED IN '{run_multi_pattern.__name__}' USE CASE ---\n"
+        output_string += f"Error Type: {type(e).__name__}\n"
+        output_string += f"Error Message: {e}\n"
+        output_string += "--- Traceback ---\n"
+        output_string += traceback.format_exc()
+        results_dict = None
+
+    return output_string, results_dict
@@ -0,0 +1,184 @@
+# simulation/usecases/disconnection_sweep_case.py
+
+import numpy as np
+import pandas as pd
+from ..islanding import prepare_islanding_study, islanded_step_results, min_voltage_series
+from ..parallel import parallel_options, chunk_bounds, map_chunks
+from ..shedding import shedding_threshold
+from .shedding_schemes import shedding_scheme
+# วิธีรวมค่าสรุปของช่วงหลังตัดที่ต่อกัน (ufunc, ค่าเมื่อไม่มี step)
+_COMBINE = {
+    'min_freq_before': (np.fmin, np.inf), 'min_freq_after': (np.fmin, np.inf), 'peak_mw_shed': (np.fmax, 0.0),
+    'shed_steps': (np.add, 0.0), 'total_mw_shed': (np.add, 0.0), 'min_voltage': (np.fmin, np.inf),
+}
+# สร้าง heatmap (disconnection step x time step) เมื่อจำนวนช่องไม่เกินค่านี้
+HEATMAP_MAX_CELLS = 4_000_000
+
+def sweep_options(system_data: dict) -> dict:
+    """
+    ตัวเลือกของ sweep จาก system_data['sweep'] (dict) หรือ system_config.csv
+    (SweepScheme = normal/percentage/adaptive/optimal, SweepStride = ระยะห่างของ disconnection step ที่ลอง)
+    """
+    options = system_data.get('sweep') or {}
+    config = system_data.get('config', {}) or {}
+    scheme = str(options.get('scheme', config.get('SweepScheme', 'normal'))).lower()
+    shedding_scheme(scheme)  # ตรวจชื่อ scheme
+    return {'scheme': scheme, 'stride': max(1, int(options.get('stride', config.get('SweepStride', 1))))}
+
+
+def run(system_data: dict) -> tuple:
+    """
+    ผลของการตัด MPG ที่ทุก disconnection step d (ความถี่, MW ที่ตัด, พลังงานที่จ่ายไม่ได้, แรงดันต่ำสุด)
+    - ช่วงก่อนตัด (t < d) ไม่ขึ้นกับ d: แก้ Load Flow แบบต่อกริดของทุก step ครั้งเดียวแล้วใช้ร่วมกัน
+    - ช่วงหลังตัด (t >= d) ของ scheme ที่ไม่มีสถานะ (normal/percentage) ก็ไม่ขึ้นกับ d เช่นกัน
+      จึงคำนวณ islanding ของทุก step ครั้งเดียว แล้วได้ผลของทุก d จากผลรวม/ค่าต่ำสุดสะสมจากท้าย
+    - scheme ที่มีสถานะ (adaptive) จำลองช่วงหลังตัดแยกตาม d โดยกระจายให้ process pool (ดู _stateful_sweep)
+    """
+    output_string = ""
+    results_dict = None
+    try:
+        study = prepare_islanding_study(system_data)
+        options = sweep_options(system_data)
+        scheme = shedding_scheme(options['scheme'])
+        parallel = parallel_options(system_data)
+        num_steps = study['num_steps']; time_index = study['time_index']
+        BASE_FREQ = study['base_freq']; step_hours = study['time_axis'].step_hours
+        candidates = np.arange(0, num_steps, options['stride'])
+        with_heatmaps = len(candidates) * num_steps <= HEATMAP_MAX_CELLS
+
+        # --- ช่วงก่อนตัด: Load Flow แบบต่อกริด (Pg ของช่วงต่อกริดตาม scheme) ของทุก step ---
+        grid_vmin = min_voltage_series(study, scheme.grid_step_pg(study), study['pd_base'], study['qd_base'],
+                                       islanded=False)
+        # แรงดันต่ำสุดของ step 0..d-1 สำหรับทุก d (d = 0 ไม่มีช่วงก่อนตัด)
+        prefix_vmin = np.concatenate([[np.inf], np.fmin.accumulate(grid_vmin)])[candidates]
+
+        if getattr(scheme, 'STATEFUL', False):
+            metrics, heatmaps = _stateful_sweep(study, options['scheme'], candidates, parallel, with_heatmaps)
+        else:
+            island = {}
+            bounds = chunk_bounds(num_steps, parallel['chunk_steps'])
+            for _, _, part in map_chunks(_island_steps, bounds, args=(study, options['scheme']),
+                                         workers=parallel['workers']):
+                for name, values in part.items():
+                    island.setdefault(name, []).append(values)
+            island = {name: np.concatenate(values) for name, values in island.items()}
+            metrics = {name: values[candidates] for name, values in _suffix_metrics(island).items()}
+            heatmaps = {}
+            if with_heatmaps:
+                after = np.arange(num_steps)[None, :] >= candidates[:, None]
+                heatmaps = {
+                    'frequency_hz': np.where(after, island['freq_after'][None, :], BASE_FREQ),
+                    'mw_shed': np.where(after, island['mw_shed'][None, :], 0.0),
+                }
+
+        sweep_summary = pd.DataFrame({
+            'disconnection_time': time_index[candidates],
+            'min_freq_before_hz': metrics['min_freq_before'], 'min_freq_after_hz': metrics['min_freq_after'],
+            'peak_mw_shed': metrics['peak_mw_shed'], 'shed_steps': metrics['shed_steps'].astype(int),
+            'unserved_energy_mwh': metrics['total_mw_shed'] * step_hours,
+            'min_voltage_pu': np.fmin(prefix_vmin, metrics['min_voltage']),
+        }, index=pd.Index(candidates, name='disconnection_step'))
+        heatmaps = {name: pd.DataFrame(values, index=sweep_summary.index, columns=time_index)
+                    for name, values in heatmaps.items()}
+
+        results_dict = {
+            "sweep_summary": sweep_summary,
+            "heatmaps": heatmaps,
+            "calculation_params": {
+                "scheme": options['scheme'], "stride": options['stride'], "base_freq": BASE_FREQ,
+                "freq_threshold": study['freq_threshold'], "microgrid_pmax": study['topology'].microgrid_pmax
+            }
+        }
+        worst = sweep_summary['unserved_energy_mwh'].idxmax()
+        output_string += f"\nDisconnection sweep ({options['scheme']}): {len(candidates)} disconnection steps"
+        output_string += f"\nWorst case: Step {worst} ({sweep_summary.loc[worst, 'disconnection_time']}), "
+        output_string += f"{sweep_summary.loc[worst, 'unserved_energy_mwh']:.3f} MWh unserved\n"
+        if not with_heatmaps:
+            output_string += f"(Heatmaps skipped: more than {HEATMAP_MAX_CELLS} cells, increase SweepStride)\n"
+        output_string += "\n" + sweep_summary.to_string(max_rows=200) + "\n"
+        output_string += "\nDisconnection Sweep Completed Successfully."
+
+    except Exception as e:
+        import traceback
+        output_string = f"\n--- AN ERROR OCCURRED IN '{run.__name__}' USE CASE ---\n"; output_string += f"Error Type: {type(e).__name__}\n"; output_string += f"Error Message: {e}\n"; output_string += "--- Traceback ---\n"; output_string += traceback.format_exc(); results_dict = None
+    return output_string, results_dict
+
+
+def _island_steps(start: int, stop: int, study: dict, scheme_name) -> dict:
+    """
+    ผลหลังตัด MPG ของ step start..stop-1 เมื่อ islanding เริ่มที่ start
+    (scheme ที่ไม่มีสถานะใช้ได้กับทุก d ที่ <= start, scheme_name = None คือไม่ตัดโหลด)
+    """
+    steps = np.arange(start, stop)
+    result = (islanded_step_results(study, steps) if scheme_name is None
+              else shedding_scheme(scheme_name).shed_islanded(study, steps))
+    pg_gens = study['topology'].islanded_pg(study['generators']['Pg_MW'].to_numpy(dtype=float), result['dg_pg'])
+    return {
+        'freq_before': result['freq_before'], 'freq_after': result['freq_after'], 'mw_shed': result['mw_shed'],
+        'min_voltage': min_voltage_series(study, pg_gens, result['pd_loads'], result['qd_loads'], islanded=True),
+    }
+
+
+def _suffix_metrics(island: dict) -> dict:
+    """ค่าสรุปของช่วง step t..T-1 สำหรับทุก t (ค่าต่ำสุด/สูงสุด/ผลรวมสะสมจากท้าย time series)"""
+    def from_end(ufunc, values):
+        return ufunc.accumulate(values[::-1])[::-1]
+    return {
+        'min_freq_before': from_end(np.fmin, island['freq_before']),
+        'min_freq_after': from_end(np.fmin, island['freq_after']),
+        'peak_mw_shed': from_end(np.fmax, island['mw_shed']),
+        'shed_steps': from_end(np.add, (island['mw_shed'] > 0).astype(float)),
+        'total_mw_shed': from_end(np.add, island['mw_shed']),
+        'min_voltage': from_end(np.fmin, island['min_voltage']),
+    }
+
+
+def _stateful_sweep(study: dict, scheme_name: str, candidates: np.ndarray, parallel: dict,
+                    with_heatmaps: bool) -> tuple:
+    """
+    sweep ของ scheme ที่มีสถานะ: ช่วงหลังตัดของ d ไม่มีการตัดโหลดจนถึง step แรกที่ความถี่ต่ำกว่า threshold (s)
+    และสถานะยังเป็นค่าเริ่มต้นที่ s ทุก d ที่มี s เดียวกันจึงได้ผลตั้งแต่ s เหมือนกัน
+    จำลองเฉพาะ suffix ที่เริ่มจาก s ที่ต่างกัน (กระจายให้ process pool) แล้วต่อกับช่วง d..s-1 ที่ไม่มีการตัด
+    """
+    num_steps = study['num_steps']; BASE_FREQ = study['base_freq']
+    base = _island_steps(0, num_steps, study, None)
+    shedding = np.flatnonzero(study['freq_schedule'] < shedding_threshold(study))
+    first_shed = np.append(shedding, num_steps)[np.searchsorted(shedding, candidates)]
+    starts = np.unique(first_shed[first_shed < num_steps])
+
+    suffixes = {}
+    bounds = chunk_bounds(len(starts), max(1, -(-len(starts) // (4 * parallel['workers']))))
+    for _, _, part in map_chunks(_sweep_suffixes, bounds, args=(study, scheme_name, starts, with_heatmaps),
+                                 workers=parallel['workers']):
+        suffixes.update(part)
+
+    metrics = {name: np.empty(len(candidates)) for name in _COMBINE}
+    heatmaps = {'frequency_hz': np.empty((len(candidates), num_steps)),
+                'mw_shed': np.zeros((len(candidates), num_steps))} if with_heatmaps else {}
+    for k, (d, s) in enumerate(zip(candidates, first_shed)):
+        parts = []
+        if s > d:  # ช่วง d..s-1 ไม่มีการตัด: ความถี่/แรงดันตาม islanded dispatch ก่อน shedding
+            head = _suffix_metrics({name: values[d:s] for name, values in base.items()})
+            parts.append({name: values[0] for name, values in head.items()})
+        if s in suffixes: parts.append(suffixes[s]['metrics'])
+        for name, (ufunc, identity) in _COMBINE.items():
+            metrics[name][k] = ufunc.reduce([part[name] for part in parts], initial=identity)
+        if with_heatmaps:
+            heatmaps['frequency_hz'][k, :d] = BASE_FREQ
+            heatmaps['frequency_hz'][k, d:s] = base['freq_after'][d:s]
+            if s in suffixes:
+                heatmaps['frequency_hz'][k, s:] = suffixes[s]['freq_after']
+                heatmaps['mw_shed'][k, s:] = suffixes[s]['mw_shed']
+    return metrics, heatmaps
+
+
+def _sweep_suffixes(start: int, stop: int, study: dict, scheme_name: str, starts: np.ndarray,
+                    with_heatmaps: bool) -> dict:
+    """จำลองช่วงหลังตัดที่เริ่มจาก step starts[start:stop] ทีละ suffix (scheme ที่มีสถานะ)"""
+    suffixes = {}
+    for s in starts[start:stop]:
+        suffix = _island_steps(s, study['num_steps'], study, scheme_name)
+        suffixes[s] = {'metrics': {name: values[0] for name, values in _suffix_metrics(suffix).items()}}
+        if with_heatmaps:
+            suffixes[s].update(freq_after=suffix['freq_after'], mw_shed=suffix['mw_shed'])
+    return suffixes
@@ -1,10 +1,10 @@
 # simulation/usecases/initial_loadflow_case.py
 
 import pandas as pd
-import numpy as np
 from tabulate import tabulate
 from ..ybus_builder import build_ybus
 from ..newtonrapson_loadflow import run_newton_raphson
+from ..dispatch import grid_connected_dispatch
 
 def run(system_data: dict) -> tuple:
     output_string = ""
@@ -16,25 +16,10 @@ def run(system_data: dict) -> tuple:
         load_data = system_data['loads'].copy()
         BASE_MVA = system_data.get('config', {}).get('BaseMVA', 100.0)
 
-        # --- PF Dispatch Logic now lives here ---
+        # --- PF Dispatch Logic (shared array-based engine) ---
         pd_total = load_data['Pd_MW'].sum()
-        active_gens = gen_data[gen_data['Status'] == 1].copy()
-        pg_total_initial = active_gens['Pg_MW'].sum()
-        initial_mismatch = pd_total - pg_total_initial
-        
         slack_bus_id = buses[buses['Type'] == 1]['BusID'].iloc[0]
-        participating_gens_mask = (active_gens['BusID'] != slack_bus_id)
-        
-        if participating_gens_mask.any():
-            participating_gens = active_gens[participating_gens_mask]
-            pf_sum = participating_gens['ParticipationFactor'].sum()
-            if pf_sum > 1e-6:
-                adjustment = initial_mismatch * (participating_gens['ParticipationFactor'] / pf_sum)
-                active_gens.loc[participating_gens_mask, 'Pg_MW'] += adjustment
-                active_gens['Pg_MW'] = active_gens.apply(lambda r: np.clip(r['Pg_MW'], r['Pmin_MW'], r['Pmax_MW']), axis=1)
-                gen_data.set_index('GenID', inplace=True)
-                gen_data.update(active_gens.set_index('GenID')['Pg_MW'])
-                gen_data.reset_index(inplace=True)
+        gen_data['Pg_MW'] = grid_connected_dispatch(pd_total, gen_data, slack_bus_id)
 
         output_string += "[1] Building Y-Bus Matrix...\n"
         ybus_matrix = build_ybus(buses, system_data['lines'])
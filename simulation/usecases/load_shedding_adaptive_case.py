@@ -2,228 +2,270 @@
 
 import pandas as pd
 import numpy as np
-import random
-from ..newtonrapson_loadflow import run_newton_raphson
-from ..ybus_builder import build_ybus
-
-def _get_disconnection_step(config: dict, num_steps: int) -> int:
-    disconnect_value = config.get('Disconnecting_Time', 99)
-    try: disconnect_value = float(disconnect_value)
-    except (ValueError, TypeError): raise TypeError(f"Invalid 'Disconnecting_Time' value '{disconnect_value}'. Must be a number.")
-    if disconnect_value == 99:
-        step = random.randint(1, num_steps - 6); return step
-    if disconnect_value == int(disconnect_value): step = int(disconnect_value)
-    else:
-        hour = int(disconnect_value); minute = int(round((disconnect_value * 100) % 100))
-        total_minutes = hour * 60 + minute; step = total_minutes // 15
-    if not (0 <= step < num_steps):
-        raise ValueError(f"Invalid 'Disconnecting_Time' ({disconnect_value}) results in an out-of-bounds step ({step}).")
-    return step
-
-def _run_dispatch_logic(total_demand, active_gens, microgrid_pmax, R_sys_hz_mw, BASE_FREQ):
-    final_imbalance = 0; final_freq = BASE_FREQ
-    if total_demand > microgrid_pmax:
-        final_imbalance = total_demand - microgrid_pmax
-        active_gens['Pg_MW'] = active_gens['Pmax_MW']
-        delta_f = -R_sys_hz_mw * final_imbalance
-        final_freq = BASE_FREQ + delta_f
-    else:
-        pf_sum = active_gens['ParticipationFactor'].sum()
-        if pf_sum > 0: active_gens['Pg_MW'] = (total_demand / pf_sum) * active_gens['ParticipationFactor']
-        else: active_gens['Pg_MW'] = total_demand / len(active_gens) if len(active_gens) > 0 else 0
-        active_gens['Pg_MW'] = active_gens.apply(lambda r: np.clip(r['Pg_MW'], r['Pmin_MW'], r['Pmax_MW']), axis=1)
-    total_pg_actual = active_gens['Pg_MW'].sum()
-    return total_pg_actual, final_imbalance, final_freq, active_gens
+from ..result_store import create_result_store
+from ..dispatch import islanded_dispatch
+from ..islanding import (prepare_islanding_study, islanded_step_results, merge_step_results,
+                         solve_islanding_series)
+from ..solution_cache import create_solution_cache
+from ..shedding import shedding_engine, shedding_parameter, shedding_threshold, DynamicPriorities, adaptive_cut
+
+# Priority ของโหลดเปลี่ยนตามประวัติการตัด ผลของแต่ละ step จึงขึ้นกับ step ก่อนหน้า
+STATEFUL = True
+# สัดส่วนของโหลดที่ตัดต่อครั้ง และการปรับ Priority ของโหลดที่ถูกตัด / ไม่ถูกตัดต่อ step
+# (ค่าเริ่มต้นของ ShedStep, PriorityPenalty, PriorityDecay)
+SHED_STEP = 0.1
+PRIORITY_PENALTY = 0.2
+PRIORITY_DECAY = 0.1
 
 def run(system_data: dict) -> tuple:
     output_string = ""
     results_dict = None
+    result_store = None
     try:
-        config = system_data.get('config', {}); load_profile = system_data['load_profile']['pattern_1']; num_steps = len(load_profile)
-        disconnection_time_step = _get_disconnection_step(config, num_steps)
-        BASE_MVA = config.get('BaseMVA', 100.0); BASE_FREQ = config.get('BaseFrequency', 50.0)
-        FREQ_THRESHOLD = 49.7 
-        buses = system_data['buses']; lines = system_data['lines']
-        initial_gens = system_data['generators']; initial_loads = system_data['loads']
-        ybus_matrix = build_ybus(buses, lines)
-        mpg_bus_id = buses[buses['Type'] == 1]['BusID'].iloc[0]
-        microgrid_gens = initial_gens[initial_gens['BusID'] != mpg_bus_id]
-        microgrid_pmax_total = microgrid_gens[microgrid_gens['Status'] == 1]['Pmax_MW'].sum()
-        new_slack_gen = microgrid_gens.loc[microgrid_gens['Pmax_MW'].idxmax()] if not microgrid_gens.empty else None
-        if new_slack_gen is None: raise ValueError("No microgrid generators found.")
-        new_slack_bus_id = new_slack_gen['BusID']
-        online_dg = microgrid_gens[microgrid_gens['Status'] == 1]
-        R_sys_hz_mw = 0
-        if not online_dg.empty:
-            inv_r_sum_hz_mw = 0
-            for _, gen in online_dg.iterrows():
-                if gen['Pmax_MW'] > 0: inv_r_sum_hz_mw += 1 / ((gen['Droop_R'] * BASE_FREQ) / gen['Pmax_MW'])
-            if inv_r_sum_hz_mw > 0: R_sys_hz_mw = 1 / inv_r_sum_hz_mw
-        time_index = pd.to_datetime("00:00", format='%H:%M') + pd.to_timedelta(pd.Series(range(num_steps)) * 15, unit='m')
-        all_results_dataframes = []; summary_data_list = []
-        all_shed_loads_list = [] 
-        
-        dynamic_load_priorities = initial_loads[['LoadID', 'Priority']].set_index('LoadID').astype(float)
-        original_priorities = dynamic_load_priorities.copy()
-        loads_shed_last_step = set()
-
-        for i in range(num_steps):
-            current_loads_base = initial_loads.copy()
-            current_loads_base['Pd_MW'] *= load_profile[i]; current_loads_base['Qd_MVAR'] *= load_profile[i]
-            total_demand_before = current_loads_base['Pd_MW'].sum()
-            current_buses = buses.copy(); final_dispatch_gens = initial_gens.copy()
-            is_islanding = (i >= disconnection_time_step)
-
-            if is_islanding:
-                current_buses.loc[current_buses['BusID'] == mpg_bus_id, 'Type'] = 3
-                current_buses.loc[current_buses['BusID'] == new_slack_bus_id, 'Type'] = 1
-            
-            active_dgs_base = final_dispatch_gens[(final_dispatch_gens['BusID'] != mpg_bus_id) & (final_dispatch_gens['Status'] == 1)].copy()
-            total_pg_before, imbalance_before, freq_before, dispatched_gens_before = _run_dispatch_logic(
-                total_demand_before, active_dgs_base, microgrid_pmax_total, R_sys_hz_mw, BASE_FREQ
-            )
+        study = prepare_islanding_study(system_data)
+        config = study['config']; time_axis = study['time_axis']; num_steps = study['num_steps']
+        disconnection_time_step = time_axis.disconnection_step(config)
+        BASE_MVA = study['base_mva']; BASE_FREQ = study['base_freq']
+        FREQ_THRESHOLD = study['freq_threshold']
+        buses = study['buses']; initial_gens = study['generators']; initial_loads = study['loads']
+        topology = study['topology']
+        microgrid_pmax_total = topology.microgrid_pmax; online_dg = topology.online_dg
+        time_index = study['time_index']
+        result_store = create_result_store(system_data, buses, time_index)
+        solution_cache = create_solution_cache(system_data)
 
-            loads_after_shedding = current_loads_base.copy()
-            total_demand_after = total_demand_before
-            freq_after = freq_before
-            total_pg_after = total_pg_before
-            dispatched_gens_after = dispatched_gens_before
-            mw_shed = 0
-            
-            shed_percentages = {}
-            loads_shed_this_step = set()
-            
-            # --- ส่วนที่แก้ไข: อัปเดต Priority ภายใน Loop ---
-            if is_islanding and freq_before < FREQ_THRESHOLD:
-                # ทำสำเนาของ Dynamic Priorities สำหรับใช้ใน Loop นี้เท่านั้น
-                temp_dynamic_priorities = dynamic_load_priorities.copy()
-
-                sheddable_loads = loads_after_shedding[
-                    (loads_after_shedding['Status'] == 1) & (loads_after_shedding['Pd_MW'] > 0.001)
-                ].copy()
-                
-                while freq_after < FREQ_THRESHOLD and not sheddable_loads.empty:
-                    # 1. Map Priority ใหม่ทุกครั้ง
-                    sheddable_loads['CurrentPriority'] = sheddable_loads['LoadID'].map(temp_dynamic_priorities['Priority'])
-                    
-                    min_priority = sheddable_loads['CurrentPriority'].min()
-                    loads_with_min_priority = sheddable_loads[sheddable_loads['CurrentPriority'] == min_priority]
-                    load_to_cut_id = loads_with_min_priority['Pd_MW'].idxmin()
-                    
-                    loads_shed_this_step.add(load_to_cut_id)
-                    current_shed_percent = shed_percentages.get(load_to_cut_id, 0.0)
-                    new_shed_percent = min(current_shed_percent + 0.1, 1.0)
-                    
-                    original_load_row = current_loads_base.loc[load_to_cut_id]
-                    pd_original = original_load_row['Pd_MW']; qd_original = original_load_row['Qd_MVAR']
-                    
-                    pd_new = pd_original * (1.0 - new_shed_percent)
-                    qd_new = qd_original * (1.0 - new_shed_percent)
-                    
-                    loads_after_shedding.loc[load_to_cut_id, 'Pd_MW'] = pd_new
-                    loads_after_shedding.loc[load_to_cut_id, 'Qd_MVAR'] = qd_new
-                    shed_percentages[load_to_cut_id] = new_shed_percent
-                    
-                    # 2. อัปเดต Priority (+0.2) ทันทีในเวอร์ชันชั่วคราว
-                    priority_before_update = temp_dynamic_priorities.loc[load_to_cut_id, 'Priority']
-                    priority_after_update = priority_before_update + 0.2
-                    temp_dynamic_priorities.loc[load_to_cut_id, 'Priority'] = priority_after_update
-                    
-                    # บันทึก Log (เราจะบันทึกค่าสุดท้ายที่อัปเดตเมื่อจบ Step)
-                    
-                    if new_shed_percent >= 1.0:
-                        sheddable_loads = sheddable_loads.drop(load_to_cut_id)
-                    else:
-                        sheddable_loads.loc[load_to_cut_id, 'Pd_MW'] = pd_new
-                        
-                    total_demand_after = loads_after_shedding['Pd_MW'].sum()
-                    mw_shed = total_demand_before - total_demand_after
-                    
-                    active_dgs_after = final_dispatch_gens[(final_dispatch_gens['BusID'] != mpg_bus_id) & (final_dispatch_gens['Status'] == 1)].copy()
-                    total_pg_after, _, freq_after, dispatched_gens_after = _run_dispatch_logic(
-                        total_demand_after, active_dgs_after, microgrid_pmax_total, R_sys_hz_mw, BASE_FREQ
-                    )
-            
-            # --- อัปเดต Priority หลัก (นอก Loop การตัดโหลด) ---
-            all_load_ids = set(dynamic_load_priorities.index)
-            loads_not_shed_this_step = all_load_ids - loads_shed_this_step
-
-            # 1. Decay for loads NOT shed
-            for load_id in loads_not_shed_this_step:
-                # แก้ไข: ลด Priority ของทุกตัวที่ "รอด" (ถ้ามันสูงกว่าค่าเดิม)
-                original_p = original_priorities.loc[load_id, 'Priority']
-                current_p = dynamic_load_priorities.loc[load_id, 'Priority']
-                dynamic_load_priorities.loc[load_id, 'Priority'] = max(original_p, current_p - 0.1)
-
-            # 2. Penalty for loads that WERE shed (and log them)
-            for load_id in loads_shed_this_step:
-                priority_before_update = dynamic_load_priorities.loc[load_id, 'Priority']
-                priority_after_update = priority_before_update + 0.2
-                dynamic_load_priorities.loc[load_id, 'Priority'] = priority_after_update
-                
-                shed_load_row = initial_loads.loc[load_id]
-                percent = shed_percentages.get(load_id, 0)
-                mw_shed_total = shed_load_row['Pd_MW'] * load_profile[i] * percent
-                mvar_shed_total = shed_load_row['Qd_MVAR'] * load_profile[i] * percent
-                all_shed_loads_list.append({
-                    'datetime': time_index[i],
-                    'BusID': shed_load_row['BusID'],
-                    'Priority_Before': priority_before_update,
-                    'Priority_After': priority_after_update,
-                    'Shed_Percent': percent * 100,
-                    'MW_Shed': mw_shed_total,
-                    'MVAR_Shed': mvar_shed_total
-                })
-            
-            loads_shed_last_step = loads_shed_this_step
-            # --- จบส่วนอัปเดต Priority ---
-
-            final_dispatch_gens.set_index('GenID', inplace=True)
-            if 'Pg_MW' in dispatched_gens_after.columns:
-                final_dispatch_gens.update(dispatched_gens_after.set_index('GenID')['Pg_MW'])
-            final_dispatch_gens.reset_index(inplace=True)
-            final_dispatch_gens.loc[final_dispatch_gens['BusID'] == mpg_bus_id, 'Pg_MW'] = 0.0
-
-            converged, results_df, _, _ = run_newton_raphson(
-                bus_data=current_buses, gen_data=final_dispatch_gens, load_data=loads_after_shedding, 
-                y_bus=ybus_matrix, base_mva=BASE_MVA, perform_pf_dispatch=(not is_islanding)
-            )
-            
-            if converged:
-                if not is_islanding: total_pg_after = results_df['Pg_final_MW'].sum()
-                results_df['Frequency_Hz'] = freq_after; results_df['time_step'] = i
-                all_results_dataframes.append(results_df)
-                summary_data_list.append({
-                    'datetime': time_index[i], 'freq_before': freq_before, 'freq_after': freq_after,
-                    'load_before': total_demand_before, 'load_after': total_demand_after,
-                    'gen_total': total_pg_after, 'mw_shed': mw_shed
-                })
-            else:
-                raise RuntimeError(f"NR Converge Failed at step {i} ({time_index[i].strftime('%H:%M')})")
-            
-        if not all_results_dataframes: raise RuntimeError("Simulation failed to produce any results.")
-
-        full_df = pd.concat(all_results_dataframes).reset_index(drop=True)
-        time_map = {step: time for step, time in enumerate(time_index)}
-        full_df['datetime'] = full_df['time_step'].map(time_map)
-        summary_df = pd.DataFrame(summary_data_list).set_index('datetime')
-        shed_loads_df = pd.DataFrame(all_shed_loads_list)
-        
-        results_dict = { 
-            "full_df": full_df, 
+        # --- ค่าก่อน shedding ของทุก step แล้วแทนช่วง islanding ด้วยผลหลัง shedding ---
+        # Priority เริ่มเปลี่ยนได้หลัง islanding เท่านั้น จึงเริ่มสถานะใหม่ที่ step แรกของช่วง islanding
+        is_islanding = np.arange(num_steps) >= disconnection_time_step
+        series = islanded_step_results(study, np.arange(num_steps))
+        merge_step_results(series, shed_islanded(study, np.flatnonzero(is_islanding)))
+
+        # --- Load Flow ของทั้ง time series (MPG = 0 ตลอด, DG ตาม dispatch หลัง shedding) ---
+        pg_gens = topology.islanded_pg(initial_gens['Pg_MW'].to_numpy(dtype=float), series['dg_pg'])
+        total_pg_final = solve_islanding_series(
+            result_store, time_axis, buses, study['ybus'], initial_gens, initial_loads, pg_gens,
+            series['pd_loads'], series['qd_loads'], series['freq_after'], is_islanding, topology, BASE_MVA,
+            cache=solution_cache
+        )
+        gen_total = np.where(is_islanding, series['gen_total'], total_pg_final)
+
+        result_store.close()
+        if not result_store.recorded.any(): raise RuntimeError("Simulation failed to produce any results.")
+
+        summary_df = pd.DataFrame({
+            'freq_before': series['freq_before'], 'freq_after': series['freq_after'],
+            'load_before': series['load_before'], 'load_after': series['load_after'],
+            'gen_total': gen_total, 'mw_shed': series['mw_shed']
+        }, index=time_index.rename('datetime'))
+        shed_loads_df = pd.DataFrame(series['shed_log'])
+
+        results_dict = {
+            "result_store": result_store,
             "shed_loads_df": shed_loads_df,
-            "summary_data": { 
+            "summary_data": {
                 "total_load_mw_before": summary_df['load_before'], "total_load_mw_after": summary_df['load_after'],
                 "total_pg_mw": summary_df['gen_total'], "frequency_series_before": summary_df[['freq_before']],
                 "frequency_series_after": summary_df[['freq_after']], "mw_shed_series": summary_df[['mw_shed']],
-                "disconnection_time": time_index[disconnection_time_step], 
+                "disconnection_time": time_index[disconnection_time_step],
                 "microgrid_pmax": microgrid_pmax_total, "freq_threshold": FREQ_THRESHOLD
             },
             "calculation_params": { "base_mva": BASE_MVA, "base_freq": BASE_FREQ, "online_dgs": online_dg }
         }
+        if solution_cache is not None:
+            output_string += f"\n{solution_cache.summary()}"
+            results_dict["solution_cache"] = solution_cache.stats()
         output_string += "\nLoad Shedding (Adaptive) Simulation Completed Successfully."
-        
+
     except Exception as e:
+        if result_store is not None: result_store.close()  # เก็บผลที่เขียนไปแล้วไว้ในไฟล์
         import traceback
         output_string = f"\n--- AN ERROR OCCURRED IN '{run.__name__}' USE CASE ---\n"; output_string += f"Error Type: {type(e).__name__}\n"; output_string += f"Error Message: {e}\n"; output_string += "--- Traceback ---\n"; output_string += traceback.format_exc(); results_dict = None
-    return output_string, results_dict
\ No newline at end of file
+    return output_string, results_dict
+
+
+def grid_step_pg(study: dict) -> np.ndarray:
+    """Pg ของทุก generator ในช่วงต่อกริด (T, G) แบบเดียวกับ run: DG จ่ายตาม islanded dispatch ก่อน shedding"""
+    pg_initial = study['generators']['Pg_MW'].to_numpy(dtype=float)
+    return study['topology'].islanded_pg(pg_initial, study['dg_pg_schedule'])
+
+
+def shed_islanded(study: dict, steps: np.ndarray) -> dict:
+    """
+    ตัดโหลดทีละ ShedStep (10%) ตาม Priority แบบปรับตัว: โหลดที่ถูกตัดได้ Priority +PriorityPenalty (0.2)
+    (ถูกตัดยากขึ้น) และโหลดที่ไม่ถูกตัดค่อยๆ ลดกลับ -PriorityDecay (0.1) ต่อ step จนถึงค่าเดิม
+    steps ต้องเรียงต่อกันตามเวลา (สถานะ Priority เริ่มจากค่าเดิมที่ step แรก)
+    คืนค่าผลราย step ของ steps (ดู islanded_step_results) พร้อม shed_log
+    """
+    if shedding_engine(study) == 'loop':
+        return _shed_islanded_loop(study, steps)
+    result = islanded_step_results(study, steps)
+    initial_loads = study['loads']; time_index = study['time_index']; topology = study['topology']
+    load_profile = study['load_profile']
+    FREQ_THRESHOLD = shedding_threshold(study); BASE_FREQ = study['base_freq']
+    shed_step = shedding_parameter(study, 'shed_step', SHED_STEP)
+    penalty = shedding_parameter(study, 'priority_penalty', PRIORITY_PENALTY)
+    decay = shedding_parameter(study, 'priority_decay', PRIORITY_DECAY)
+    status = initial_loads['Status'].to_numpy()
+    pd_initial = initial_loads['Pd_MW'].to_numpy(dtype=float); qd_initial = initial_loads['Qd_MVAR'].to_numpy(dtype=float)
+    bus_ids = initial_loads['BusID'].to_numpy(dtype=float)
+
+    priorities = DynamicPriorities(initial_loads['Priority'].to_numpy(dtype=float), penalty, decay)
+    no_shed = np.zeros(len(initial_loads), dtype=bool)
+    shedding_steps = result['freq_before'] < FREQ_THRESHOLD
+    shed_rows = []
+    for k, i in enumerate(result['steps']):
+        # step ที่ไม่ตัดโหลดและ Priority ทุกตัวกลับเป็นค่าเดิมแล้ว ไม่มีอะไรต้องอัปเดต
+        if not shedding_steps[k]:
+            if priorities.raised: priorities.end_step(no_shed)
+            continue
+
+        fraction, result['load_after'][k] = adaptive_cut(
+            result['pd_loads'][k], priorities.current, status, topology, BASE_FREQ, FREQ_THRESHOLD,
+            shed_step, penalty
+        )
+        kept = 1.0 - fraction
+        result['pd_loads'][k] *= kept; result['qd_loads'][k] *= kept
+        shed_rows.append(k)
+
+        shed_mask = fraction > 0
+        before, after = priorities.end_step(shed_mask)
+        for j, priority_before, priority_after in zip(np.flatnonzero(shed_mask), before, after):
+            result['shed_log'].append({
+                'datetime': time_index[i], 'BusID': bus_ids[j],
+                'Priority_Before': priority_before, 'Priority_After': priority_after,
+                'Shed_Percent': fraction[j] * 100,
+                'MW_Shed': pd_initial[j] * load_profile[i] * fraction[j],
+                'MVAR_Shed': qd_initial[j] * load_profile[i] * fraction[j]
+            })
+
+    if shed_rows:
+        # dispatch หลัง shedding ของทุก step ที่ตัดโหลดในครั้งเดียว
+        shed_rows = np.array(shed_rows)
+        result['load_after'][shed_rows] = result['pd_loads'][shed_rows].sum(axis=1)
+        result['mw_shed'][shed_rows] = result['load_before'][shed_rows] - result['load_after'][shed_rows]
+        result['dg_pg'][shed_rows], result['gen_total'][shed_rows], _, result['freq_after'][shed_rows] = islanded_dispatch(
+            result['load_after'][shed_rows], topology.dg_pmin, topology.dg_pmax, topology.dg_participation,
+            topology.microgrid_pmax, topology.R_sys_hz_mw, BASE_FREQ
+        )
+    return result
+
+
+def _shed_islanded_loop(study: dict, steps: np.ndarray) -> dict:
+    """shed_islanded แบบ while-loop บน DataFrame (SheddingEngine = loop ใช้ตรวจสอบผลของ adaptive_cut)"""
+    result = islanded_step_results(study, steps)
+    initial_loads = study['loads']; time_index = study['time_index']; topology = study['topology']
+    load_profile = study['load_profile']
+    FREQ_THRESHOLD = shedding_threshold(study); BASE_FREQ = study['base_freq']
+    shed_step = shedding_parameter(study, 'shed_step', SHED_STEP)
+    penalty = shedding_parameter(study, 'priority_penalty', PRIORITY_PENALTY)
+    decay = shedding_parameter(study, 'priority_decay', PRIORITY_DECAY)
+
+    # Priority แบบปรับตัวอ้างอิงด้วย index ของตารางโหลด (เหมือน load_to_cut_id)
+    dynamic_load_priorities = initial_loads[['Priority']].astype(float)
+    original_priorities = dynamic_load_priorities.copy()
+    loads_shed_last_step = set()
+    priorities_raised = False
+    shedding_steps = result['freq_before'] < FREQ_THRESHOLD
+
+    for k, i in enumerate(result['steps']):
+        # step ที่ไม่ตัดโหลดและ Priority ทุกตัวกลับเป็นค่าเดิมแล้ว ไม่มีอะไรต้องอัปเดต
+        if not shedding_steps[k] and not priorities_raised: continue
+
+        shed_percentages = {}
+        loads_shed_this_step = set()
+
+        # --- ส่วนที่แก้ไข: อัปเดต Priority ภายใน Loop ---
+        if shedding_steps[k]:
+            current_loads_base = initial_loads.copy()
+            current_loads_base['Pd_MW'] = result['pd_loads'][k]; current_loads_base['Qd_MVAR'] = result['qd_loads'][k]
+            loads_after_shedding = current_loads_base.copy()
+            freq_after = result['freq_before'][k]
+
+            # ทำสำเนาของ Dynamic Priorities สำหรับใช้ใน Loop นี้เท่านั้น
+            temp_dynamic_priorities = dynamic_load_priorities.copy()
+
+            sheddable_loads = loads_after_shedding[
+                (loads_after_shedding['Status'] == 1) & (loads_after_shedding['Pd_MW'] > 0.001)
+            ].copy()
+
+            while freq_after < FREQ_THRESHOLD and not sheddable_loads.empty:
+                # 1. Map Priority ใหม่ทุกครั้ง
+                sheddable_loads['CurrentPriority'] = sheddable_loads.index.map(temp_dynamic_priorities['Priority'])
+
+                min_priority = sheddable_loads['CurrentPriority'].min()
+                loads_with_min_priority = sheddable_loads[sheddable_loads['CurrentPriority'] == min_priority]
+                load_to_cut_id = loads_with_min_priority['Pd_MW'].idxmin()
+
+                loads_shed_this_step.add(load_to_cut_id)
+                current_shed_percent = shed_percentages.get(load_to_cut_id, 0.0)
+                new_shed_percent = min(current_shed_percent + shed_step, 1.0)
+
+                original_load_row = current_loads_base.loc[load_to_cut_id]
+                pd_original = original_load_row['Pd_MW']; qd_original = original_load_row['Qd_MVAR']
+
+                pd_new = pd_original * (1.0 - new_shed_percent)
+                qd_new = qd_original * (1.0 - new_shed_percent)
+
+                loads_after_shedding.loc[load_to_cut_id, 'Pd_MW'] = pd_new
+                loads_after_shedding.loc[load_to_cut_id, 'Qd_MVAR'] = qd_new
+                shed_percentages[load_to_cut_id] = new_shed_percent
+
+                # 2. อัปเดต Priority (+0.2) ทันทีในเวอร์ชันชั่วคราว
+                priority_before_update = temp_dynamic_priorities.loc[load_to_cut_id, 'Priority']
+                priority_after_update = priority_before_update + penalty
+                temp_dynamic_priorities.loc[load_to_cut_id, 'Priority'] = priority_after_update
+
+                # บันทึก Log (เราจะบันทึกค่าสุดท้ายที่อัปเดตเมื่อจบ Step)
+
+                if new_shed_percent >= 1.0:
+                    sheddable_loads = sheddable_loads.drop(load_to_cut_id)
+                else:
+                    sheddable_loads.loc[load_to_cut_id, 'Pd_MW'] = pd_new
+
+                result['load_after'][k] = loads_after_shedding['Pd_MW'].sum()
+                result['mw_shed'][k] = result['load_before'][k] - result['load_after'][k]
+
+                result['dg_pg'][k], result['gen_total'][k], _, freq_after = islanded_dispatch(
+                    result['load_after'][k], topology.dg_pmin, topology.dg_pmax, topology.dg_participation,
+                    topology.microgrid_pmax, topology.R_sys_hz_mw, BASE_FREQ
+                )
+
+            result['freq_after'][k] = freq_after
+            result['pd_loads'][k] = loads_after_shedding['Pd_MW'].to_numpy(dtype=float)
+            result['qd_loads'][k] = loads_after_shedding['Qd_MVAR'].to_numpy(dtype=float)
+
+        # --- อัปเดต Priority หลัก (นอก Loop การตัดโหลด) ---
+        all_load_ids = set(dynamic_load_priorities.index)
+        loads_not_shed_this_step = all_load_ids - loads_shed_this_step
+
+        # 1. Decay for loads NOT shed
+        for load_id in loads_not_shed_this_step:
+            # แก้ไข: ลด Priority ของทุกตัวที่ "รอด" (ถ้ามันสูงกว่าค่าเดิม)
+            original_p = original_priorities.loc[load_id, 'Priority']
+            current_p = dynamic_load_priorities.loc[load_id, 'Priority']
+            dynamic_load_priorities.loc[load_id, 'Priority'] = max(original_p, current_p - decay)
+
+        # 2. Penalty for loads that WERE shed (and log them)
+        for load_id in sorted(loads_shed_this_step):
+            priority_before_update = dynamic_load_priorities.loc[load_id, 'Priority']
+            priority_after_update = priority_before_update + penalty
+            dynamic_load_priorities.loc[load_id, 'Priority'] = priority_after_update
+
+            shed_load_row = initial_loads.loc[load_id]
+            percent = shed_percentages.get(load_id, 0)
+            mw_shed_total = shed_load_row['Pd_MW'] * load_profile[i] * percent
+            mvar_shed_total = shed_load_row['Qd_MVAR'] * load_profile[i] * percent
+            result['shed_log'].append({
+                'datetime': time_index[i],
+                'BusID': shed_load_row['BusID'],
+                'Priority_Before': priority_before_update,
+                'Priority_After': priority_after_update,
+                'Shed_Percent': percent * 100,
+                'MW_Shed': mw_shed_total,
+                'MVAR_Shed': mvar_shed_total
+            })
+
+        loads_shed_last_step = loads_shed_this_step
+        priorities_raised = bool((dynamic_load_priorities['Priority'] > original_priorities['Priority']).any())
+        # --- จบส่วนอัปเดต Priority ---
+    return result
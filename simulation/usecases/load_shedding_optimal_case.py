@@ -0,0 +1,159 @@
+# simulation/usecases/load_shedding_optimal_case.py
+
+import pandas as pd
+import numpy as np
+from ..result_store import create_result_store
+from ..islanding import (prepare_islanding_study, islanded_step_results, merge_step_results,
+                         solve_islanding_series)
+from ..newtonrapson_loadflow import bus_incidence
+from ..solution_cache import create_solution_cache
+from ..shedding import shedding_threshold, optimal_shedding
+from ..ybus_builder import dc_ptdf
+
+# แต่ละ step ตัดสินใจตัดโหลดจากสถานะของ step นั้นเท่านั้น (ทุก step แก้ใน LP เดียวกันแต่ไม่ผูกกัน)
+STATEFUL = False
+
+def run(system_data: dict) -> tuple:
+    output_string = ""
+    results_dict = None
+    result_store = None
+    try:
+        study = prepare_islanding_study(system_data)
+        config = study['config']; time_axis = study['time_axis']; num_steps = study['num_steps']
+        disconnection_time_step = time_axis.disconnection_step(config)
+        BASE_MVA = study['base_mva']; BASE_FREQ = study['base_freq']
+        FREQ_THRESHOLD = study['freq_threshold']
+        buses = study['buses']; initial_gens = study['generators']; initial_loads = study['loads']
+        topology = study['topology']
+        microgrid_pmax_total = topology.microgrid_pmax; online_dg = topology.online_dg
+        time_index = study['time_index']
+        result_store = create_result_store(system_data, buses, time_index)
+        solution_cache = create_solution_cache(system_data)
+
+        # --- ค่าก่อน shedding ของทุก step แล้วแทนช่วง islanding ด้วยผลหลัง shedding ---
+        is_islanding = np.arange(num_steps) >= disconnection_time_step
+        series = islanded_step_results(study, np.arange(num_steps))
+        # ก่อน Disconnect ความถี่เป็น 50 Hz เสมอ และ DG จ่ายตามค่าเริ่มต้น
+        grid_steps = np.flatnonzero(~is_islanding)
+        series['freq_before'][grid_steps] = BASE_FREQ; series['freq_after'][grid_steps] = BASE_FREQ
+        series['dg_pg'][grid_steps] = online_dg['Pg_MW'].to_numpy(dtype=float)
+        island = shed_islanded(study, np.flatnonzero(is_islanding))
+        merge_step_results(series, island)
+
+        # --- Load Flow ของทั้ง time series (MPG = 0 ตลอด, DG ตาม dispatch หลัง shedding) ---
+        pg_gens = topology.islanded_pg(initial_gens['Pg_MW'].to_numpy(dtype=float), series['dg_pg'])
+        total_pg_final = solve_islanding_series(
+            result_store, time_axis, buses, study['ybus'], initial_gens, initial_loads, pg_gens,
+            series['pd_loads'], series['qd_loads'], series['freq_after'], is_islanding, topology, BASE_MVA,
+            cache=solution_cache
+        )
+        gen_total = np.where(is_islanding, series['gen_total'], total_pg_final)
+
+        result_store.close()
+        if not result_store.recorded.any(): raise RuntimeError("Simulation failed to produce any results.")
+
+        summary_df = pd.DataFrame({
+            'freq_before': series['freq_before'], 'freq_after': series['freq_after'],
+            'load_before': series['load_before'], 'load_after': series['load_after'],
+            'gen_total': gen_total, 'mw_shed': series['mw_shed']
+        }, index=time_index.rename('datetime'))
+        shed_loads_df = pd.DataFrame(series['shed_log'])
+
+        results_dict = {
+            "result_store": result_store,
+            "shed_loads_df": shed_loads_df,
+            "summary_data": {
+                "total_load_mw_before": summary_df['load_before'], "total_load_mw_after": summary_df['load_after'],
+                "total_pg_mw": summary_df['gen_total'], "frequency_series_before": summary_df[['freq_before']],
+                "frequency_series_after": summary_df[['freq_after']], "mw_shed_series": summary_df[['mw_shed']],
+                "disconnection_time": time_index[disconnection_time_step],
+                "microgrid_pmax": microgrid_pmax_total, "freq_threshold": FREQ_THRESHOLD
+            },
+            "calculation_params": {
+                "base_mva": BASE_MVA, "base_freq": BASE_FREQ, "online_dgs": online_dg,
+                "line_limits": line_limits_enabled(study), "lp_objective": island['lp_objective'],
+                "line_overload_mw": island['line_overload_mw']
+            }
+        }
+        if island['line_overload_mw'] > 0:
+            output_string += (f"\nWarning: line limits could not be met by load shedding alone "
+                              f"(max overload {island['line_overload_mw']:.3f} MW).")
+        if solution_cache is not None:
+            output_string += f"\n{solution_cache.summary()}"
+            results_dict["solution_cache"] = solution_cache.stats()
+        output_string += "\nLoad Shedding (Optimal LP) Simulation Completed Successfully."
+
+    except Exception as e:
+        if result_store is not None: result_store.close()  # เก็บผลที่เขียนไปแล้วไว้ในไฟล์
+        import traceback
+        output_string = f"\n--- AN ERROR OCCURRED IN '{run.__name__}' USE CASE ---\n"; output_string += f"Error Type: {type(e).__name__}\n"; output_string += f"Error Message: {e}\n"; output_string += "--- Traceback ---\n"; output_string += traceback.format_exc(); results_dict = None
+    return output_string, results_dict
+
+
+def line_limits_enabled(study: dict) -> bool:
+    """SheddingLineLimits = 1 ใน system_config.csv: จำกัดการไหลของสายส่ง (DC, RateA_MVA) ใน LP ด้วย"""
+    return bool(int(study['config'].get('SheddingLineLimits', 0)))
+
+
+def dc_line_limits(study: dict, pd_loads: np.ndarray, dg_pg: np.ndarray) -> dict:
+    """
+    line_limits ของ optimal_shedding จาก DC load flow ของโหมด islanding (slack = DG ที่ใหญ่ที่สุด)
+    การไหลก่อนตัดใช้ Pg ตาม islanded dispatch ก่อน shedding, MW ที่ตัดแต่ละโหลดลดกำลังของ slack
+    """
+    buses = study['buses']; lines = study['lines']; topology = study['topology']
+    bus_ids = buses['BusID'].values
+    ptdf = dc_ptdf(buses, lines, topology.new_slack_bus_id)
+    gen_incidence = bus_incidence(study['generators']['BusID'].values, bus_ids)
+    load_incidence = bus_incidence(study['loads']['BusID'].values, bus_ids)
+    pg_gens = topology.islanded_pg(study['generators']['Pg_MW'].to_numpy(dtype=float), dg_pg)
+    injection = pg_gens @ gen_incidence - pd_loads @ load_incidence
+    return {
+        'sensitivity': ptdf @ load_incidence.T, 'base_flow': injection @ ptdf.T,
+        'rating': lines['RateA_MVA'].fillna(0.0).to_numpy(dtype=float) if 'RateA_MVA' in lines else np.zeros(len(lines)),
+    }
+
+
+def grid_step_pg(study: dict) -> np.ndarray:
+    """Pg ของทุก generator ในช่วงต่อกริด (T, G) แบบเดียวกับ run: DG จ่ายตามค่าเริ่มต้น"""
+    topology = study['topology']
+    dg_pg = np.broadcast_to(topology.online_dg['Pg_MW'].to_numpy(dtype=float),
+                            (study['num_steps'], len(topology.online_dg)))
+    return topology.islanded_pg(study['generators']['Pg_MW'].to_numpy(dtype=float), dg_pg)
+
+
+def shed_islanded(study: dict, steps: np.ndarray) -> dict:
+    """
+    ตัดโหลดให้ผลรวม Priority x MW ที่ตัดน้อยที่สุด (ตัดบางส่วนของโหลดได้ต่อเนื่อง) โดยความถี่ไม่ต่ำกว่า threshold
+    ทุก step ที่ต้องตัดใน steps ถูกแก้พร้อมกันเป็น LP เดียว (ดู optimal_shedding)
+    คืนค่าผลราย step ของ steps (ดู islanded_step_results) พร้อม shed_log, lp_objective และ line_overload_mw
+    """
+    result = islanded_step_results(study, steps)
+    result['lp_objective'] = 0.0; result['line_overload_mw'] = 0.0
+    initial_loads = study['loads']; time_index = study['time_index']; load_profile = study['load_profile']
+    freq_threshold = shedding_threshold(study)
+    rows = np.flatnonzero(result['freq_before'] < freq_threshold)
+    if rows.size == 0: return result
+
+    pd_loads = result['pd_loads'][rows]
+    line_limits = dc_line_limits(study, pd_loads, result['dg_pg'][rows]) if line_limits_enabled(study) else None
+    shed = optimal_shedding(pd_loads, initial_loads['Priority'].to_numpy(), initial_loads['Status'].to_numpy(),
+                            study['topology'], study['base_freq'], freq_threshold, line_limits=line_limits)
+    kept = 1.0 - shed['fraction']
+    result['pd_loads'][rows] = pd_loads * kept; result['qd_loads'][rows] = result['qd_loads'][rows] * kept
+    for col in ('load_after', 'freq_after', 'dg_pg', 'gen_total'):
+        result[col][rows] = shed[col]
+    result['mw_shed'][rows] = result['load_before'][rows] - shed['load_after']
+    result['lp_objective'] = shed['objective']; result['line_overload_mw'] = shed['overload_mw'].max()
+
+    cut_rows, cut_loads = np.nonzero(shed['fraction'] > 0)
+    fractions = shed['fraction'][cut_rows, cut_loads]
+    cut_steps = result['steps'][rows[cut_rows]]
+    mw_shed = initial_loads['Pd_MW'].to_numpy(dtype=float)[cut_loads] * load_profile[cut_steps] * fractions
+    mvar_shed = initial_loads['Qd_MVAR'].to_numpy(dtype=float)[cut_loads] * load_profile[cut_steps] * fractions
+    bus_ids = initial_loads['BusID'].to_numpy(dtype=float); priorities = initial_loads['Priority'].to_numpy(dtype=float)
+    result['shed_log'] = [
+        {'datetime': time_index[i], 'BusID': bus_ids[j], 'Priority': priorities[j], 'Shed_Percent': fraction * 100,
+         'MW_Shed': mw, 'MVAR_Shed': mvar}
+        for i, j, fraction, mw, mvar in zip(cut_steps, cut_loads, fractions, mw_shed, mvar_shed)
+    ]
+    return result
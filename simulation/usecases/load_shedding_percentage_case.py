@@ -2,188 +2,188 @@
 
 import pandas as pd
 import numpy as np
-import random
-from ..newtonrapson_loadflow import run_newton_raphson
-from ..ybus_builder import build_ybus
-
-def _get_disconnection_step(config: dict, num_steps: int) -> int:
-    disconnect_value = config.get('Disconnecting_Time', 99)
-    try: disconnect_value = float(disconnect_value)
-    except (ValueError, TypeError): raise TypeError(f"Invalid 'Disconnecting_Time' value '{disconnect_value}'. Must be a number.")
-    if disconnect_value == 99:
-        step = random.randint(1, num_steps - 6); return step
-    if disconnect_value == int(disconnect_value): step = int(disconnect_value)
-    else:
-        hour = int(disconnect_value); minute = int(round((disconnect_value * 100) % 100))
-        total_minutes = hour * 60 + minute; step = total_minutes // 15
-    if not (0 <= step < num_steps):
-        raise ValueError(f"Invalid 'Disconnecting_Time' ({disconnect_value}) results in an out-of-bounds step ({step}).")
-    return step
-
-def _run_dispatch_logic(total_demand, active_gens, microgrid_pmax, R_sys_hz_mw, BASE_FREQ):
-    final_imbalance = 0; final_freq = BASE_FREQ
-    if total_demand > microgrid_pmax:
-        final_imbalance = total_demand - microgrid_pmax
-        active_gens['Pg_MW'] = active_gens['Pmax_MW']
-        delta_f = -R_sys_hz_mw * final_imbalance
-        final_freq = BASE_FREQ + delta_f
-    else:
-        pf_sum = active_gens['ParticipationFactor'].sum()
-        if pf_sum > 0: active_gens['Pg_MW'] = (total_demand / pf_sum) * active_gens['ParticipationFactor']
-        else: active_gens['Pg_MW'] = total_demand / len(active_gens) if len(active_gens) > 0 else 0
-        active_gens['Pg_MW'] = active_gens.apply(lambda r: np.clip(r['Pg_MW'], r['Pmin_MW'], r['Pmax_MW']), axis=1)
-    total_pg_actual = active_gens['Pg_MW'].sum()
-    return total_pg_actual, final_imbalance, final_freq, active_gens
+from ..result_store import create_result_store
+from ..dispatch import islanded_dispatch
+from ..islanding import (prepare_islanding_study, islanded_step_results, merge_step_results,
+                         solve_islanding_series)
+from ..solution_cache import create_solution_cache
+from ..shedding import shedding_engine, shedding_parameter, shedding_threshold, priority_shedding, cut_sequence
+
+# แต่ละ step ตัดสินใจตัดโหลดจากสถานะของ step นั้นเท่านั้น
+STATEFUL = False
+# สัดส่วนของโหลดที่ตัดต่อครั้ง (ค่าเริ่มต้นของ ShedStep)
+SHED_STEP = 0.1
 
 def run(system_data: dict) -> tuple:
     output_string = ""
     results_dict = None
+    result_store = None
     try:
-        config = system_data.get('config', {}); load_profile = system_data['load_profile']['pattern_1']; num_steps = len(load_profile)
-        disconnection_time_step = _get_disconnection_step(config, num_steps)
-        BASE_MVA = config.get('BaseMVA', 100.0); BASE_FREQ = config.get('BaseFrequency', 50.0)
-        FREQ_THRESHOLD = 49.7 
-        buses = system_data['buses']; lines = system_data['lines']
-        initial_gens = system_data['generators']; initial_loads = system_data['loads']
-        ybus_matrix = build_ybus(buses, lines)
-        mpg_bus_id = buses[buses['Type'] == 1]['BusID'].iloc[0]
-        microgrid_gens = initial_gens[initial_gens['BusID'] != mpg_bus_id]
-        microgrid_pmax_total = microgrid_gens[microgrid_gens['Status'] == 1]['Pmax_MW'].sum()
-        new_slack_gen = microgrid_gens.loc[microgrid_gens['Pmax_MW'].idxmax()] if not microgrid_gens.empty else None
-        if new_slack_gen is None: raise ValueError("No microgrid generators found.")
-        new_slack_bus_id = new_slack_gen['BusID']
-        online_dg = microgrid_gens[microgrid_gens['Status'] == 1]
-        R_sys_hz_mw = 0
-        if not online_dg.empty:
-            inv_r_sum_hz_mw = 0
-            for _, gen in online_dg.iterrows():
-                if gen['Pmax_MW'] > 0: inv_r_sum_hz_mw += 1 / ((gen['Droop_R'] * BASE_FREQ) / gen['Pmax_MW'])
-            if inv_r_sum_hz_mw > 0: R_sys_hz_mw = 1 / inv_r_sum_hz_mw
-        time_index = pd.to_datetime("00:00", format='%H:%M') + pd.to_timedelta(pd.Series(range(num_steps)) * 15, unit='m')
-        all_results_dataframes = []; summary_data_list = []
-        all_shed_loads_list = [] 
-
-        for i in range(num_steps):
-            current_loads_base = initial_loads.copy()
-            current_loads_base['Pd_MW'] *= load_profile[i]; current_loads_base['Qd_MVAR'] *= load_profile[i]
-            total_demand_before = current_loads_base['Pd_MW'].sum()
-            current_buses = buses.copy(); final_dispatch_gens = initial_gens.copy()
-            is_islanding = (i >= disconnection_time_step)
-
-            loads_after_shedding = current_loads_base.copy()
-            total_demand_after = total_demand_before
-            mw_shed = 0
-            
-            # --- ส่วนที่แก้ไข: แยกตรรกะก่อนและหลัง Disconnect ---
-            if is_islanding:
-                current_buses.loc[current_buses['BusID'] == mpg_bus_id, 'Type'] = 3
-                current_buses.loc[current_buses['BusID'] == new_slack_bus_id, 'Type'] = 1
-                
-                active_dgs_base = final_dispatch_gens[(final_dispatch_gens['BusID'] != mpg_bus_id) & (final_dispatch_gens['Status'] == 1)].copy()
-                total_pg_before, imbalance_before, freq_before, dispatched_gens_before = _run_dispatch_logic(
-                    total_demand_before, active_dgs_base, microgrid_pmax_total, R_sys_hz_mw, BASE_FREQ
-                )
-                
-                freq_after = freq_before
-                total_pg_after = total_pg_before
-                dispatched_gens_after = dispatched_gens_before
-                shed_percentages = {}
-
-                if freq_before < FREQ_THRESHOLD:
-                    sheddable_loads = loads_after_shedding[(loads_after_shedding['Status'] == 1) & (loads_after_shedding['Pd_MW'] > 0.001)].copy()
-                    while freq_after < FREQ_THRESHOLD and not sheddable_loads.empty:
-                        min_priority = sheddable_loads['Priority'].min()
-                        loads_with_min_priority = sheddable_loads[sheddable_loads['Priority'] == min_priority]
-                        load_to_cut_id = loads_with_min_priority['Pd_MW'].idxmin()
-                        
-                        current_shed_percent = shed_percentages.get(load_to_cut_id, 0.0)
-                        new_shed_percent = min(current_shed_percent + 0.1, 1.0)
-                        
-                        original_load_row = current_loads_base.loc[load_to_cut_id]
-                        pd_original = original_load_row['Pd_MW']; qd_original = original_load_row['Qd_MVAR']
-                        
-                        pd_new = pd_original * (1.0 - new_shed_percent)
-                        qd_new = qd_original * (1.0 - new_shed_percent)
-                        
-                        loads_after_shedding.loc[load_to_cut_id, 'Pd_MW'] = pd_new
-                        loads_after_shedding.loc[load_to_cut_id, 'Qd_MVAR'] = qd_new
-                        shed_percentages[load_to_cut_id] = new_shed_percent
-                        
-                        if new_shed_percent >= 1.0:
-                            sheddable_loads = sheddable_loads.drop(load_to_cut_id)
-                            
-                        total_demand_after = loads_after_shedding['Pd_MW'].sum()
-                        mw_shed = total_demand_before - total_demand_after
-                        
-                        active_dgs_after = final_dispatch_gens[(final_dispatch_gens['BusID'] != mpg_bus_id) & (final_dispatch_gens['Status'] == 1)].copy()
-                        total_pg_after, _, freq_after, dispatched_gens_after = _run_dispatch_logic(
-                            total_demand_after, active_dgs_after, microgrid_pmax_total, R_sys_hz_mw, BASE_FREQ
-                        )
-                
-                for load_id, percent in shed_percentages.items():
-                    shed_load_row = initial_loads.loc[load_id]
-                    mw_shed_total = shed_load_row['Pd_MW'] * load_profile[i] * percent
-                    mvar_shed_total = shed_load_row['Qd_MVAR'] * load_profile[i] * percent
-                    all_shed_loads_list.append({
-                        'datetime': time_index[i], 'BusID': shed_load_row['BusID'],
-                        'Priority': shed_load_row['Priority'], 'Shed_Percent': percent * 100,
-                        'MW_Shed': mw_shed_total, 'MVAR_Shed': mvar_shed_total
-                    })
-
-            else:
-                # ก่อน Disconnect, ความถี่เป็น 50 Hz เสมอ
-                freq_before = BASE_FREQ
-                freq_after = BASE_FREQ
-                total_pg_after = total_demand_before
-                dispatched_gens_after = final_dispatch_gens[(final_dispatch_gens['BusID'] != mpg_bus_id) & (final_dispatch_gens['Status'] == 1)].copy()
-            # --- จบส่วนที่แก้ไข ---
-
-            final_dispatch_gens.set_index('GenID', inplace=True)
-            if 'Pg_MW' in dispatched_gens_after.columns:
-                final_dispatch_gens.update(dispatched_gens_after.set_index('GenID')['Pg_MW'])
-            final_dispatch_gens.reset_index(inplace=True)
-            final_dispatch_gens.loc[final_dispatch_gens['BusID'] == mpg_bus_id, 'Pg_MW'] = 0.0
-
-            converged, results_df, _, _ = run_newton_raphson(
-                bus_data=current_buses, gen_data=final_dispatch_gens, load_data=loads_after_shedding, 
-                y_bus=ybus_matrix, base_mva=BASE_MVA, perform_pf_dispatch=(not is_islanding)
-            )
-            
-            if converged:
-                if not is_islanding: total_pg_after = results_df['Pg_final_MW'].sum()
-                results_df['Frequency_Hz'] = freq_after; results_df['time_step'] = i
-                all_results_dataframes.append(results_df)
-                summary_data_list.append({
-                    'datetime': time_index[i], 'freq_before': freq_before, 'freq_after': freq_after,
-                    'load_before': total_demand_before, 'load_after': total_demand_after,
-                    'gen_total': total_pg_after, 'mw_shed': mw_shed
-                })
-            else:
-                raise RuntimeError(f"NR Converge Failed at step {i} ({time_index[i].strftime('%H:%M')})")
-            
-        if not all_results_dataframes: raise RuntimeError("Simulation failed to produce any results.")
-
-        full_df = pd.concat(all_results_dataframes).reset_index(drop=True)
-        time_map = {step: time for step, time in enumerate(time_index)}
-        full_df['datetime'] = full_df['time_step'].map(time_map)
-        summary_df = pd.DataFrame(summary_data_list).set_index('datetime')
-        shed_loads_df = pd.DataFrame(all_shed_loads_list)
-        
-        results_dict = { 
-            "full_df": full_df, 
+        study = prepare_islanding_study(system_data)
+        config = study['config']; time_axis = study['time_axis']; num_steps = study['num_steps']
+        disconnection_time_step = time_axis.disconnection_step(config)
+        BASE_MVA = study['base_mva']; BASE_FREQ = study['base_freq']
+        FREQ_THRESHOLD = study['freq_threshold']
+        buses = study['buses']; initial_gens = study['generators']; initial_loads = study['loads']
+        topology = study['topology']
+        microgrid_pmax_total = topology.microgrid_pmax; online_dg = topology.online_dg
+        time_index = study['time_index']
+        result_store = create_result_store(system_data, buses, time_index)
+        solution_cache = create_solution_cache(system_data)
+
+        # --- ค่าก่อน shedding ของทุก step แล้วแทนช่วง islanding ด้วยผลหลัง shedding ---
+        is_islanding = np.arange(num_steps) >= disconnection_time_step
+        series = islanded_step_results(study, np.arange(num_steps))
+        # ก่อน Disconnect ความถี่เป็น 50 Hz เสมอ และ DG จ่ายตามค่าเริ่มต้น
+        grid_steps = np.flatnonzero(~is_islanding)
+        series['freq_before'][grid_steps] = BASE_FREQ; series['freq_after'][grid_steps] = BASE_FREQ
+        series['dg_pg'][grid_steps] = online_dg['Pg_MW'].to_numpy(dtype=float)
+        merge_step_results(series, shed_islanded(study, np.flatnonzero(is_islanding)))
+
+        # --- Load Flow ของทั้ง time series (MPG = 0 ตลอด, DG ตาม dispatch หลัง shedding) ---
+        pg_gens = topology.islanded_pg(initial_gens['Pg_MW'].to_numpy(dtype=float), series['dg_pg'])
+        total_pg_final = solve_islanding_series(
+            result_store, time_axis, buses, study['ybus'], initial_gens, initial_loads, pg_gens,
+            series['pd_loads'], series['qd_loads'], series['freq_after'], is_islanding, topology, BASE_MVA,
+            cache=solution_cache
+        )
+        gen_total = np.where(is_islanding, series['gen_total'], total_pg_final)
+
+        result_store.close()
+        if not result_store.recorded.any(): raise RuntimeError("Simulation failed to produce any results.")
+
+        summary_df = pd.DataFrame({
+            'freq_before': series['freq_before'], 'freq_after': series['freq_after'],
+            'load_before': series['load_before'], 'load_after': series['load_after'],
+            'gen_total': gen_total, 'mw_shed': series['mw_shed']
+        }, index=time_index.rename('datetime'))
+        shed_loads_df = pd.DataFrame(series['shed_log'])
+
+        results_dict = {
+            "result_store": result_store,
             "shed_loads_df": shed_loads_df,
-            "summary_data": { 
+            "summary_data": {
                 "total_load_mw_before": summary_df['load_before'], "total_load_mw_after": summary_df['load_after'],
                 "total_pg_mw": summary_df['gen_total'], "frequency_series_before": summary_df[['freq_before']],
                 "frequency_series_after": summary_df[['freq_after']], "mw_shed_series": summary_df[['mw_shed']],
-                "disconnection_time": time_index[disconnection_time_step], 
+                "disconnection_time": time_index[disconnection_time_step],
                 "microgrid_pmax": microgrid_pmax_total, "freq_threshold": FREQ_THRESHOLD
             },
             "calculation_params": { "base_mva": BASE_MVA, "base_freq": BASE_FREQ, "online_dgs": online_dg }
         }
+        if solution_cache is not None:
+            output_string += f"\n{solution_cache.summary()}"
+            results_dict["solution_cache"] = solution_cache.stats()
         output_string += "\nLoad Shedding (Percentage) Simulation Completed Successfully."
-        
+
     except Exception as e:
+        if result_store is not None: result_store.close()  # เก็บผลที่เขียนไปแล้วไว้ในไฟล์
         import traceback
         output_string = f"\n--- AN ERROR OCCURRED IN '{run.__name__}' USE CASE ---\n"; output_string += f"Error Type: {type(e).__name__}\n"; output_string += f"Error Message: {e}\n"; output_string += "--- Traceback ---\n"; output_string += traceback.format_exc(); results_dict = None
-    return output_string, results_dict
\ No newline at end of file
+    return output_string, results_dict
+
+
+def grid_step_pg(study: dict) -> np.ndarray:
+    """Pg ของทุก generator ในช่วงต่อกริด (T, G) แบบเดียวกับ run: DG จ่ายตามค่าเริ่มต้น"""
+    topology = study['topology']
+    dg_pg = np.broadcast_to(topology.online_dg['Pg_MW'].to_numpy(dtype=float),
+                            (study['num_steps'], len(topology.online_dg)))
+    return topology.islanded_pg(study['generators']['Pg_MW'].to_numpy(dtype=float), dg_pg)
+
+
+def shed_islanded(study: dict, steps: np.ndarray) -> dict:
+    """
+    ตัดโหลดทีละ ShedStep (10%) ของโหลดตัวที่ Priority ต่ำสุด (ถ้าเท่ากันเลือกตัวที่เหลือน้อยที่สุด)
+    จนความถี่ไม่ต่ำกว่า threshold ของ step ที่อยู่ในโหมด islanding แต่ละ step ไม่ขึ้นต่อกัน
+    คืนค่าผลราย step ของ steps (ดู islanded_step_results) พร้อม shed_log
+    """
+    if shedding_engine(study) == 'loop':
+        return _shed_islanded_loop(study, steps)
+    result = islanded_step_results(study, steps)
+    initial_loads = study['loads']; time_index = study['time_index']; load_profile = study['load_profile']
+    freq_threshold = shedding_threshold(study)
+    rows = np.flatnonzero(result['freq_before'] < freq_threshold)
+    if rows.size == 0: return result
+
+    pd_loads = result['pd_loads'][rows]
+    shed = priority_shedding(pd_loads, initial_loads['Priority'].to_numpy(), initial_loads['Status'].to_numpy(),
+                             study['topology'], study['base_freq'], freq_threshold,
+                             step_fraction=shedding_parameter(study, 'shed_step', SHED_STEP))
+    kept = 1.0 - shed['fraction']
+    result['pd_loads'][rows] = pd_loads * kept; result['qd_loads'][rows] = result['qd_loads'][rows] * kept
+    for col in ('load_after', 'freq_after', 'dg_pg', 'gen_total'):
+        result[col][rows] = shed[col]
+    result['mw_shed'][rows] = result['load_before'][rows] - shed['load_after']
+
+    cut_rows, cut_loads, fractions = cut_sequence(shed)
+    cut_steps = result['steps'][rows[cut_rows]]
+    mw_shed = initial_loads['Pd_MW'].to_numpy(dtype=float)[cut_loads] * load_profile[cut_steps] * fractions
+    mvar_shed = initial_loads['Qd_MVAR'].to_numpy(dtype=float)[cut_loads] * load_profile[cut_steps] * fractions
+    bus_ids = initial_loads['BusID'].to_numpy(dtype=float); priorities = initial_loads['Priority'].to_numpy(dtype=float)
+    result['shed_log'] = [
+        {'datetime': time_index[i], 'BusID': bus_ids[j], 'Priority': priorities[j], 'Shed_Percent': fraction * 100,
+         'MW_Shed': mw, 'MVAR_Shed': mvar}
+        for i, j, fraction, mw, mvar in zip(cut_steps, cut_loads, fractions, mw_shed, mvar_shed)
+    ]
+    return result
+
+
+def _shed_islanded_loop(study: dict, steps: np.ndarray) -> dict:
+    """shed_islanded แบบ while-loop ทีละ 10% (SheddingEngine = loop ใช้ตรวจสอบผลของ priority_shedding)"""
+    result = islanded_step_results(study, steps)
+    initial_loads = study['loads']; time_index = study['time_index']; topology = study['topology']
+    load_profile = study['load_profile']
+    FREQ_THRESHOLD = shedding_threshold(study); BASE_FREQ = study['base_freq']
+    shed_step = shedding_parameter(study, 'shed_step', SHED_STEP)
+
+    for k in np.flatnonzero(result['freq_before'] < FREQ_THRESHOLD):
+        i = result['steps'][k]
+        current_loads_base = initial_loads.copy()
+        current_loads_base['Pd_MW'] = result['pd_loads'][k]; current_loads_base['Qd_MVAR'] = result['qd_loads'][k]
+        loads_after_shedding = current_loads_base.copy()
+        freq_after = result['freq_before'][k]
+        shed_percentages = {}
+
+        sheddable_loads = loads_after_shedding[(loads_after_shedding['Status'] == 1) & (loads_after_shedding['Pd_MW'] > 0.001)].copy()
+        while freq_after < FREQ_THRESHOLD and not sheddable_loads.empty:
+            min_priority = sheddable_loads['Priority'].min()
+            loads_with_min_priority = sheddable_loads[sheddable_loads['Priority'] == min_priority]
+            load_to_cut_id = loads_with_min_priority['Pd_MW'].idxmin()
+
+            current_shed_percent = shed_percentages.get(load_to_cut_id, 0.0)
+            new_shed_percent = min(current_shed_percent + shed_step, 1.0)
+
+            original_load_row = current_loads_base.loc[load_to_cut_id]
+            pd_original = original_load_row['Pd_MW']; qd_original = original_load_row['Qd_MVAR']
+
+            pd_new = pd_original * (1.0 - new_shed_percent)
+            qd_new = qd_original * (1.0 - new_shed_percent)
+
+            loads_after_shedding.loc[load_to_cut_id, 'Pd_MW'] = pd_new
+            loads_after_shedding.loc[load_to_cut_id, 'Qd_MVAR'] = qd_new
+            shed_percentages[load_to_cut_id] = new_shed_percent
+
+            if new_shed_percent >= 1.0:
+                sheddable_loads = sheddable_loads.drop(load_to_cut_id)
+
+            result['load_after'][k] = loads_after_shedding['Pd_MW'].sum()
+            result['mw_shed'][k] = result['load_before'][k] - result['load_after'][k]
+
+            result['dg_pg'][k], result['gen_total'][k], _, freq_after = islanded_dispatch(
+                result['load_after'][k], topology.dg_pmin, topology.dg_pmax, topology.dg_participation,
+                topology.microgrid_pmax, topology.R_sys_hz_mw, BASE_FREQ
+            )
+
+        for load_id, percent in shed_percentages.items():
+            shed_load_row = initial_loads.loc[load_id]
+            mw_shed_total = shed_load_row['Pd_MW'] * load_profile[i] * percent
+            mvar_shed_total = shed_load_row['Qd_MVAR'] * load_profile[i] * percent
+            result['shed_log'].append({
+                'datetime': time_index[i], 'BusID': shed_load_row['BusID'],
+                'Priority': shed_load_row['Priority'], 'Shed_Percent': percent * 100,
+                'MW_Shed': mw_shed_total, 'MVAR_Shed': mvar_shed_total
+            })
+        result['freq_after'][k] = freq_after
+        result['pd_loads'][k] = loads_after_shedding['Pd_MW'].to_numpy(dtype=float)
+        result['qd_loads'][k] = loads_after_shedding['Qd_MVAR'].to_numpy(dtype=float)
+    return result
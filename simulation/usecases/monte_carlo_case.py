@@ -0,0 +1,50 @@
+# simulation/usecases/monte_carlo_case.py
+
+import numpy as np
+from ..islanding import prepare_islanding_study
+from ..monte_carlo import monte_carlo_options, run_monte_carlo
+from ..parallel import parallel_options
+
+# ค่าที่สรุปเป็นการกระจาย (percentile) ใน statistics
+STATISTIC_COLUMNS = ('load_multiplier_mean', 'grid_import_mw', 'freq_nadir_hz', 'min_freq_before_hz',
+                     'min_freq_after_hz', 'peak_mw_shed', 'unserved_energy_mwh', 'shed_steps', 'min_voltage_pu')
+
+def run(system_data: dict) -> tuple:
+    """
+    Monte Carlo ของการตัด MPG: สุ่มเวลาตัดและ load multiplier ตาม seed แล้วสรุปการกระจายของ
+    nadir ของการตัด MPG, ความถี่คงตัวต่ำสุดก่อน/หลัง shedding, MW ที่ตัด, พลังงานที่จ่ายไม่ได้ และแรงดันต่ำสุด (ดู simulation/monte_carlo.py)
+    """
+    output_string = ""
+    results_dict = None
+    try:
+        study = prepare_islanding_study(system_data)
+        options = monte_carlo_options(system_data, study['time_axis'])
+        workers = parallel_options(system_data)['workers']
+
+        samples = run_monte_carlo(study, options, workers=workers)
+        statistics = samples[list(STATISTIC_COLUMNS)].describe(percentiles=[0.05, 0.5, 0.95]).T
+        shed_probability = float((samples['shed_steps'] > 0).mean())
+
+        results_dict = {
+            "monte_carlo_samples": samples,
+            "statistics": statistics,
+            "calculation_params": {
+                **options, "shed_probability": shed_probability, "workers": workers,
+                "base_freq": study['base_freq'], "freq_threshold": study['freq_threshold']
+            }
+        }
+        disconnection = ("random" if options['disconnection_step'] is None
+                         else f"Step {options['disconnection_step']}")
+        output_string += (f"\nMonte Carlo ({options['scheme']}): {options['samples']} samples, seed {options['seed']}, "
+                          f"disconnection {disconnection}, load {options['load_distribution']} "
+                          f"(spread {options['load_spread']:g}{', per step' if options['load_per_step'] else ''})")
+        output_string += f"\nProbability of load shedding: {shed_probability:.1%}"
+        output_string += f"\nLowest frequency nadir at disconnection: {np.nanmin(samples['freq_nadir_hz']):.4f} Hz"
+        output_string += f"\nLowest frequency before shedding (steady state): {np.nanmin(samples['min_freq_before_hz']):.4f} Hz\n"
+        output_string += "\n" + statistics.to_string() + "\n"
+        output_string += "\nMonte Carlo Simulation Completed Successfully."
+
+    except Exception as e:
+        import traceback
+        output_string = f"\n--- AN ERROR OCCURRED IN '{run.__name__}' USE CASE ---\n"; output_string += f"Error Type: {type(e).__name__}\n"; output_string += f"Error Message: {e}\n"; output_string += "--- Traceback ---\n"; output_string += traceback.format_exc(); results_dict = None
+    return output_string, results_dict
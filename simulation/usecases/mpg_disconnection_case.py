@@ -1,10 +1,35 @@
 # simulation/usecases/mpg_disconnection_case.py
 
+import numpy as np
 import pandas as pd
 from tabulate import tabulate
 from ..newtonrapson_loadflow import run_newton_raphson
 from ..ybus_builder import build_ybus
-from ..frequency_response import simulate_frequency_dynamics
+from ..frequency_response import (simulate_frequency_dynamics, MultiMachineModel, DEFAULT_GOVERNOR_T,
+                                  DEFAULT_XD_PU, aggregate_parameters, event_driven_response, UFLSStage)
+
+# model ความถี่ (FrequencyModel ใน system_config.csv)
+# 'aggregate' = Aggregate Swing Equation เดิม, 'multi_machine' = MultiMachineModel (inertia/droop/governor รายเครื่อง)
+# 'event_driven' = event_driven_response (ก้าวปรับได้ + UFLS ตาม UFLSStages ตัดโหลดระหว่างการจำลอง)
+FREQUENCY_MODELS = ('aggregate', 'multi_machine', 'event_driven')
+# เวลาหน่วงของ UFLS (s) ค่าเริ่มต้นของ UFLSDelay ใน system_config.csv
+UFLS_DELAY_S = 0.1
+
+def ufls_stages(config: dict, total_load_mw: float) -> list:
+    """
+    ขั้นของ UFLS จาก UFLSStages ใน system_config.csv: "ความถี่:เปอร์เซ็นต์ของโหลดรวม" คั่นด้วย ;
+    (เช่น 49.5:10;49.2:10;48.8:15) เวลาหน่วงทุกขั้นตาม UFLSDelay ไม่ตั้ง = ไม่มี UFLS
+    """
+    stages = config.get('UFLSStages')
+    if stages is None or (isinstance(stages, float) and np.isnan(stages)): return []
+    delay = float(config.get('UFLSDelay', UFLS_DELAY_S))
+    result = []
+    for item in str(stages).split(';'):
+        if not item.strip(): continue
+        freq_hz, percent = item.split(':')
+        result.append(UFLSStage(float(freq_hz), total_load_mw * float(percent) / 100.0, delay))
+    return result
+
 
 def run(system_data: dict) -> tuple:
     output_string = ""
@@ -58,15 +83,52 @@ def run(system_data: dict) -> tuple:
 
         output_string += "\n[2] Running dynamic frequency simulation (Primary Response)...\n"
         
+        config = system_data.get('config', {})
+        frequency_model = str(config.get('FrequencyModel', 'aggregate')).lower()
+        if frequency_model not in FREQUENCY_MODELS:
+            raise ValueError(f"Unknown frequency model '{frequency_model}' (expected one of {FREQUENCY_MODELS}).")
         online_gens = system_data['generators'][system_data['generators']['Status'] == 1]
-        
-        freq_df = simulate_frequency_dynamics(
-            online_generators=online_gens,
-            power_imbalance_mw=power_imbalance,
-            base_mva=BASE_MVA,
-            base_freq=BASE_FREQ
-        )
-        
+
+        if frequency_model == 'multi_machine':
+            # MPG หลุดออก: เครื่องที่บัส MPG ไม่ร่วมตอบสนอง และกำลังที่นำเข้าหายไปที่บัสนั้น
+            mpg_bus_id = int(slack_bus_row['BusID'].iloc[0])
+            model = MultiMachineModel(
+                system_data['buses'], system_data['lines'], online_gens[online_gens['BusID'] != mpg_bus_id],
+                BASE_MVA, BASE_FREQ, governor_t=float(config.get('GovernorTimeConstant', DEFAULT_GOVERNOR_T)),
+                xd_pu=float(config.get('GeneratorXd', DEFAULT_XD_PU))
+            )
+            disturbance = np.zeros(len(system_data['buses'])); disturbance[mpg_bus_id - 1] = power_imbalance
+            response = model.response(np.arange(0, 10.0, 0.01), disturbance, per_machine=True)
+            freq_df = pd.DataFrame({'time_s': response['time_s'], 'frequency_hz': response['coi_frequency_hz'][0]})
+            for gen_id, machine_freq in zip(model.generators['GenID'], response['machine_frequency_hz'][0]):
+                freq_df[f'gen_{int(gen_id)}_hz'] = machine_freq
+            output_string += f"   - Multi-machine model: {model.num_machines} units (COI frequency reported)\n"
+        elif frequency_model == 'event_driven':
+            # เครื่องที่บัส MPG หลุดไปพร้อมกับกริด (เหมือน multi_machine)
+            mpg_bus_id = int(slack_bus_row['BusID'].iloc[0])
+            H_eq, R_eq = aggregate_parameters(online_gens[online_gens['BusID'] != mpg_bus_id], BASE_MVA)
+            rocof_limit = config.get('RocofLimit')
+            response = event_driven_response(
+                power_imbalance, H_eq, R_eq, BASE_MVA, BASE_FREQ,
+                governor_t=float(config.get('GovernorTimeConstant', DEFAULT_GOVERNOR_T)),
+                stages=ufls_stages(config, lf_results_df['Pd_final_MW'].sum()),
+                rocof_limit_hz_s=None if rocof_limit is None else float(rocof_limit), sample_dt=0.01
+            )
+            freq_df = pd.DataFrame({'time_s': response['time_s'], 'frequency_hz': response['frequency_hz']})
+            output_string += (f"   - Event-driven model: {response['nfev']} RHS evaluations, "
+                              f"{response['shed_mw']:.4f} MW shed by UFLS\n")
+            if not response['events'].empty:
+                output_string += "\n--- Frequency Events ---\n"
+                output_string += tabulate(response['events'], headers='keys', tablefmt='grid', showindex=False,
+                                          floatfmt=".4f") + "\n"
+        else:
+            freq_df = simulate_frequency_dynamics(
+                online_generators=online_gens,
+                power_imbalance_mw=power_imbalance,
+                base_mva=BASE_MVA,
+                base_freq=BASE_FREQ
+            )
+
         nadir_freq = freq_df['frequency_hz'].min()
         settling_freq = freq_df['frequency_hz'].iloc[-1]
         
@@ -77,6 +139,7 @@ def run(system_data: dict) -> tuple:
         results_dict = {
             "dynamic_freq_df": freq_df
         }
+        if frequency_model == 'event_driven': results_dict["ufls_events"] = response['events']
         print(online_gens)
         print(power_imbalance)
 
@@ -0,0 +1,50 @@
+# simulation/usecases/parametric_sweep_case.py
+
+import numpy as np
+from ..islanding import prepare_islanding_study, min_voltage_series
+from ..parametric import parametric_options, run_parametric
+from ..parallel import parallel_options
+
+def run(system_data: dict) -> tuple:
+    """
+    Parametric sweep ของการตั้งค่า UFLS: ความถี่ที่เริ่มตัด, สัดส่วนการตัดต่อครั้ง, penalty/decay ของ adaptive
+    และ droop ของเครื่องกำเนิด (ดู simulation/parametric.py) ที่ disconnection step เดียวกัน
+    Load Flow แบบต่อกริดของช่วงก่อนตัดไม่ขึ้นกับ parameter จึงแก้ครั้งเดียวและใช้ร่วมกันทุกจุด
+    """
+    output_string = ""
+    results_dict = None
+    try:
+        study = prepare_islanding_study(system_data)
+        options = parametric_options(system_data)
+        workers = parallel_options(system_data)['workers']
+        disconnection_step = study['time_axis'].disconnection_step(study['config'])
+
+        parametric_results = run_parametric(study, options, disconnection_step, workers=workers)
+        if options['voltage']:
+            pg_initial = study['generators']['Pg_MW'].to_numpy(dtype=float)
+            grid_vmin = min_voltage_series(
+                study, np.broadcast_to(pg_initial, (disconnection_step, len(pg_initial))),
+                study['pd_base'][:disconnection_step], study['qd_base'][:disconnection_step], islanded=False)
+            grid_min_voltage = np.fmin.reduce(grid_vmin, initial=np.inf)
+            parametric_results['min_voltage_pu'] = np.fmin(grid_min_voltage, parametric_results['min_voltage_pu'])
+            parametric_results['min_voltage_pu'] = parametric_results['min_voltage_pu'].replace(np.inf, np.nan)
+
+        results_dict = {
+            "parametric_results": parametric_results,
+            "calculation_params": {
+                "scheme": options['scheme'], "axes": {axis: list(values) for axis, values in options['axes'].items()},
+                "disconnection_step": disconnection_step, "workers": workers,
+                "base_freq": study['base_freq'], "freq_threshold": study['freq_threshold']
+            }
+        }
+        best = parametric_results['priority_weighted_mwh'].idxmin()
+        output_string += (f"\nParametric sweep ({options['scheme']}): {len(parametric_results)} points over "
+                          f"{', '.join(options['axes']) or 'current settings'} (disconnection at Step {disconnection_step})")
+        output_string += f"\nLowest priority-weighted shedding: point {best}\n"
+        output_string += "\n" + parametric_results.to_string(max_rows=200) + "\n"
+        output_string += "\nParametric Sweep Completed Successfully."
+
+    except Exception as e:
+        import traceback
+        output_string = f"\n--- AN ERROR OCCURRED IN '{run.__name__}' USE CASE ---\n"; output_string += f"Error Type: {type(e).__name__}\n"; output_string += f"Error Message: {e}\n"; output_string += "--- Traceback ---\n"; output_string += traceback.format_exc(); results_dict = None
+    return output_string, results_dict
@@ -0,0 +1,86 @@
+# simulation/usecases/quasi_dynamic_case.py
+
+import pandas as pd
+import numpy as np
+from tabulate import tabulate
+from ..result_store import create_result_store
+from ..islanding import prepare_islanding_study, solve_islanding_series
+from ..solution_cache import create_solution_cache
+from ..cosimulation import cosimulation_options, run_cosimulation
+
+def run(system_data: dict) -> tuple:
+    """
+    MPG disconnection แบบ quasi-dynamic: Load Flow ราย step ตาม iterative dispatch และ dynamic ความถี่
+    (event_driven_response พร้อม UFLS) เฉพาะหน้าต่างรอบการตัด MPG และ step ที่โหลดเปลี่ยนมาก (ดู run_cosimulation)
+    ผลรูปเดียวกับ iterative dispatch พร้อม cosim_events และ dynamic_windows
+    """
+    output_string = ""
+    results_dict = None
+    result_store = None
+    try:
+        study = prepare_islanding_study(system_data)
+        config = study['config']; time_axis = study['time_axis']
+        disconnection_time_step = time_axis.disconnection_step(config)
+        BASE_MVA = study['base_mva']; BASE_FREQ = study['base_freq']
+        buses = study['buses']; initial_gens = study['generators']; initial_loads = study['loads']
+        topology = study['topology']
+        time_index = study['time_index']
+        options = cosimulation_options(system_data)
+        result_store = create_result_store(system_data, buses, time_index)
+        solution_cache = create_solution_cache(system_data)
+
+        cosim = run_cosimulation(study, disconnection_time_step, options)
+        is_islanding = cosim['is_islanding']
+
+        # --- Load Flow ของทั้ง time series ด้วยโหลดหลัง UFLS (ก่อน islanding ใช้ Pg เริ่มต้น) ---
+        pg_gens = np.tile(initial_gens['Pg_MW'].to_numpy(dtype=float), (len(time_index), 1))
+        pg_gens[is_islanding] = topology.islanded_pg(pg_gens[0], cosim['dg_pg'][is_islanding])
+        total_pg_final = solve_islanding_series(
+            result_store, time_axis, buses, study['ybus'], initial_gens, initial_loads, pg_gens,
+            cosim['pd_loads'], cosim['qd_loads'], cosim['frequency'], is_islanding, topology, BASE_MVA,
+            clamp_slack=True, cache=solution_cache
+        )
+        total_pg_actual = np.where(is_islanding, cosim['gen_total'], total_pg_final)
+
+        result_store.close()
+        if not result_store.recorded.any(): raise RuntimeError("Simulation failed to produce any results.")
+
+        summary_df = pd.DataFrame({
+            'frequency': cosim['frequency'], 'delta_f': cosim['frequency'] - BASE_FREQ,
+            'total_pg_actual': total_pg_actual, 'power_imbalance': cosim['imbalance']
+        }, index=time_index.rename('datetime'))
+        events = cosim['events']
+
+        results_dict = {
+            "result_store": result_store,
+            "summary_data": {
+                "total_load_mw": result_store.total('Pd_final_MW'),
+                "total_pg_mw": summary_df['total_pg_actual'],
+                "frequency_series": summary_df[['frequency']],
+                "power_imbalance_series": summary_df[['power_imbalance']],
+                "delta_f_series": summary_df[['delta_f']],
+                "disconnection_time": time_index[disconnection_time_step],
+                "microgrid_pmax": topology.microgrid_pmax
+            },
+            "calculation_params": {
+                "base_mva": BASE_MVA, "base_freq": BASE_FREQ,
+                "online_dgs": topology.online_dg, "r_sys_hz_mw": topology.R_sys_hz_mw,
+                "window_s": options['window_s'], "load_step_mw": options['load_step_mw']
+            },
+            "cosim_events": events,
+            "dynamic_windows": cosim['windows'],
+        }
+        output_string += (f"\nQuasi-dynamic co-simulation: {len(events)} dynamic windows of {options['window_s']:g} s "
+                          f"over {len(time_index)} steps ({int(events['nfev'].sum())} RHS evaluations)\n")
+        if not events.empty:
+            output_string += tabulate(events, headers='keys', tablefmt='grid', showindex=False, floatfmt=".4f") + "\n"
+        if solution_cache is not None:
+            output_string += f"\n{solution_cache.summary()}"
+            results_dict["solution_cache"] = solution_cache.stats()
+        output_string += "\nQuasi-Dynamic Co-Simulation Completed Successfully."
+
+    except Exception as e:
+        if result_store is not None: result_store.close()  # เก็บผลที่เขียนไปแล้วไว้ในไฟล์
+        import traceback
+        output_string = f"\n--- AN ERROR OCCURRED IN '{run.__name__}' USE CASE ---\n"; output_string += f"Error Type: {type(e).__name__}\n"; output_string += f"Error Message: {e}\n"; output_string += "--- Traceback ---\n"; output_string += traceback.format_exc(); results_dict = None
+    return output_string, results_dict
@@ -0,0 +1,97 @@
+# simulation/usecases/shedding_comparison_case.py
+
+import time
+import numpy as np
+import pandas as pd
+from ..islanding import prepare_islanding_study, min_voltage_series, shedding_metrics
+from ..parallel import parallel_options, map_chunks
+from .shedding_schemes import SHEDDING_SCHEMES, shedding_scheme
+
+def comparison_schemes(system_data: dict) -> list:
+    """
+    วิธี shedding ที่เปรียบเทียบจาก system_data['comparison']['schemes'] หรือ ComparisonSchemes ใน system_config.csv
+    (ชื่อคั่นด้วย , หรือ ; ไม่ตั้ง = ทุกวิธีใน SHEDDING_SCHEMES)
+    """
+    options = system_data.get('comparison') or {}
+    config = system_data.get('config', {}) or {}
+    schemes = options.get('schemes', config.get('ComparisonSchemes'))
+    if schemes is None or (isinstance(schemes, float) and np.isnan(schemes)):
+        return list(SHEDDING_SCHEMES)
+    if isinstance(schemes, str):
+        schemes = schemes.replace(';', ',').split(',')
+    schemes = [str(name).strip().lower() for name in schemes if str(name).strip()]
+    for name in schemes: shedding_scheme(name)  # ตรวจชื่อ scheme
+    return list(dict.fromkeys(schemes))
+
+
+def run(system_data: dict) -> tuple:
+    """
+    เปรียบเทียบวิธี shedding ที่ disconnection step เดียวกันโดยใช้ข้อมูลร่วมชุดเดียว
+    - Y-bus, topology ทั้งสองโหมด, droop รวม และ islanded dispatch ก่อน shedding (prepare_islanding_study)
+    - Load Flow แบบต่อกริดของช่วงก่อนตัด แก้ครั้งเดียวต่อ dispatch ของช่วงต่อกริด (grid_step_pg) ที่ต่างกัน
+    แล้วจำลองช่วงหลังตัดของแต่ละวิธี (กระจายให้ process pool เมื่อ ParallelWorkers > 1)
+    """
+    output_string = ""
+    results_dict = None
+    try:
+        study = prepare_islanding_study(system_data)
+        schemes = comparison_schemes(system_data)
+        workers = parallel_options(system_data)['workers']
+        disconnection_step = study['time_axis'].disconnection_step(study['config'])
+        num_steps = study['num_steps']; time_index = study['time_index']
+
+        # --- ช่วงก่อนตัด: Load Flow แบบต่อกริด แก้ครั้งเดียวต่อ dispatch ของช่วงต่อกริดที่ต่างกัน ---
+        grid_min_voltage = {}; prefix_by_dispatch = {}
+        for name in schemes:
+            pg_gens = shedding_scheme(name).grid_step_pg(study)[:disconnection_step]
+            key = pg_gens.tobytes()
+            if key not in prefix_by_dispatch:
+                grid_vmin = min_voltage_series(study, pg_gens, study['pd_base'][:disconnection_step],
+                                               study['qd_base'][:disconnection_step], islanded=False)
+                prefix_by_dispatch[key] = np.fmin.reduce(grid_vmin, initial=np.inf)
+            grid_min_voltage[name] = prefix_by_dispatch[key]
+
+        rows = {}
+        bounds = [(k, k + 1) for k in range(len(schemes))]
+        for start, _, part in map_chunks(_evaluate_scheme, bounds, args=(study, schemes, disconnection_step),
+                                         workers=workers):
+            rows[schemes[start]] = part
+
+        comparison = pd.DataFrame.from_dict({name: row['metrics'] for name, row in rows.items()}, orient='index')
+        comparison = comparison.astype({'shed_steps': int, 'shed_events': int, 'loads_affected': int})
+        comparison['min_voltage_pu'] = np.fmin(pd.Series(grid_min_voltage).reindex(comparison.index),
+                                               comparison['min_voltage_pu'].astype(float))
+        comparison['min_voltage_pu'] = comparison['min_voltage_pu'].replace(np.inf, np.nan)
+        comparison.index.name = 'scheme'
+        load_energy_shed = pd.DataFrame({name: row['load_energy_shed_mwh'] for name, row in rows.items()},
+                                        index=study['loads'].index)
+        load_energy_shed.insert(0, 'BusID', study['loads']['BusID'])
+        load_energy_shed.insert(1, 'Priority', study['loads']['Priority'])
+
+        results_dict = {
+            "comparison": comparison,
+            "load_energy_shed": load_energy_shed,
+            "calculation_params": {
+                "schemes": schemes, "workers": workers, "disconnection_step": disconnection_step,
+                "disconnection_time": time_index[disconnection_step] if disconnection_step < num_steps else None,
+                "base_freq": study['base_freq'], "freq_threshold": study['freq_threshold'],
+                "microgrid_pmax": study['topology'].microgrid_pmax
+            }
+        }
+        output_string += f"\nShedding scheme comparison: {', '.join(schemes)} (disconnection at Step {disconnection_step})\n"
+        output_string += "\n" + comparison.to_string() + "\n"
+        output_string += "\nShedding Scheme Comparison Completed Successfully."
+
+    except Exception as e:
+        import traceback
+        output_string = f"\n--- AN ERROR OCCURRED IN '{run.__name__}' USE CASE ---\n"; output_string += f"Error Type: {type(e).__name__}\n"; output_string += f"Error Message: {e}\n"; output_string += "--- Traceback ---\n"; output_string += traceback.format_exc(); results_dict = None
+    return output_string, results_dict
+
+
+def _evaluate_scheme(start: int, stop: int, study: dict, schemes: list, disconnection_step: int) -> dict:
+    """ค่าสรุปของวิธี shedding schemes[start] ในช่วงหลังตัด (step disconnection_step..T-1)"""
+    started = time.perf_counter()
+    result = shedding_scheme(schemes[start]).shed_islanded(study, np.arange(disconnection_step, study['num_steps']))
+    elapsed = time.perf_counter() - started
+    metrics, shed_mwh = shedding_metrics(study, result)
+    return {'metrics': {**metrics, 'runtime_s': elapsed}, 'load_energy_shed_mwh': shed_mwh}
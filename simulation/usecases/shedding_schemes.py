@@ -0,0 +1,19 @@
+# simulation/usecases/shedding_schemes.py
+
+from . import (load_shedding_normal_case, load_shedding_percentage_case, load_shedding_adaptive_case,
+               load_shedding_optimal_case)
+
+# วิธี shedding ที่เลือกได้ใน sweep / Monte Carlo (แต่ละ module มี shed_islanded, grid_step_pg และ STATEFUL)
+SHEDDING_SCHEMES = {
+    'normal': load_shedding_normal_case,
+    'percentage': load_shedding_percentage_case,
+    'adaptive': load_shedding_adaptive_case,
+    'optimal': load_shedding_optimal_case,
+}
+
+def shedding_scheme(name: str):
+    """module ของวิธี shedding ตามชื่อ (ไม่สนตัวพิมพ์เล็ก/ใหญ่)"""
+    scheme = SHEDDING_SCHEMES.get(str(name).lower())
+    if scheme is None:
+        raise ValueError(f"Unknown shedding scheme '{name}' (expected one of {tuple(SHEDDING_SCHEMES)}).")
+    return scheme
@@ -3,11 +3,38 @@
 import numpy as np
 import pandas as pd
 
-def build_ybus(bus_data: pd.DataFrame, line_data: pd.DataFrame) -> np.ndarray:
+# --- Y-bus cache: ใช้ซ้ำระหว่าง use case / request ที่ใช้โมเดลเดียวกัน ---
+_YBUS_CACHE = {}
+_YBUS_CACHE_MAX_ENTRIES = 32
+_BUS_KEY_COLUMNS = ['BusID', 'G_shunt_pu', 'B_shunt_pu']
+_LINE_KEY_COLUMNS = ['FromBus', 'ToBus', 'R_pu', 'X_pu', 'B_pu', 'TapRatio']
+
+def _ybus_cache_key(bus_data: pd.DataFrame, line_data: pd.DataFrame) -> tuple:
+    """
+    สร้าง key จากเฉพาะคอลัมน์ที่มีผลต่อ Y-bus
+    (คอลัมน์อย่าง Type หรือ V_init เปลี่ยนได้โดยไม่ต้องสร้าง Y-bus ใหม่)
+    """
+    bus_cols = [c for c in _BUS_KEY_COLUMNS if c in bus_data.columns]
+    line_cols = [c for c in _LINE_KEY_COLUMNS if c in line_data.columns]
+    bus_hash = pd.util.hash_pandas_object(bus_data[bus_cols], index=False).values.tobytes()
+    line_hash = pd.util.hash_pandas_object(line_data[line_cols], index=False).values.tobytes()
+    return (tuple(bus_cols), bus_hash, tuple(line_cols), line_hash)
+
+def clear_ybus_cache():
+    _YBUS_CACHE.clear()
+
+def build_ybus(bus_data: pd.DataFrame, line_data: pd.DataFrame, use_cache: bool = True) -> np.ndarray:
     """
     สร้าง Nodal Admittance Matrix (Y-bus)
     **เวอร์ชันนี้อ่านค่า Shunt G, B (p.u.) โดยตรงจาก bus_data**
+    ผลลัพธ์ที่ได้จาก cache เป็น array แบบ read-only
     """
+    if use_cache:
+        key = _ybus_cache_key(bus_data, line_data)
+        cached = _YBUS_CACHE.get(key)
+        if cached is not None:
+            return cached
+
     num_buses = bus_data['BusID'].max()
     y_bus = np.zeros((num_buses, num_buses), dtype=complex)
 
@@ -42,4 +69,39 @@ def build_ybus(bus_data: pd.DataFrame, line_data: pd.DataFrame) -> np.ndarray:
         if g_shunt_pu != 0.0 or b_shunt_pu != 0.0:
             y_bus[bus_idx, bus_idx] += complex(g_shunt_pu, b_shunt_pu)
 
-    return y_bus
\ No newline at end of file
+    if use_cache:
+        if len(_YBUS_CACHE) >= _YBUS_CACHE_MAX_ENTRIES:
+            _YBUS_CACHE.pop(next(iter(_YBUS_CACHE)))
+        y_bus.setflags(write=False)
+        _YBUS_CACHE[key] = y_bus
+
+    return y_bus
+
+def dc_susceptance(bus_data: pd.DataFrame, line_data: pd.DataFrame) -> tuple:
+    """
+    เมทริกซ์ของ DC load flow ลำดับบัสตาม BusID - 1 เหมือน Y-bus: (B-bus (buses, buses), B_flow (lines, buses))
+    กำลังฉีด = B-bus @ มุม และการไหลของสาย (FromBus -> ToBus) = B_flow @ มุม (pu)
+    """
+    num_buses = int(bus_data['BusID'].max())
+    tap_ratio = line_data['TapRatio'].fillna(1.0).to_numpy(dtype=float) if 'TapRatio' in line_data else 1.0
+    x_pu = line_data['X_pu'].to_numpy(dtype=float) * tap_ratio
+    susceptance = np.divide(1.0, x_pu, out=np.zeros_like(x_pu), where=x_pu != 0)
+
+    incidence = np.zeros((len(line_data), num_buses))
+    rows = np.arange(len(line_data))
+    incidence[rows, line_data['FromBus'].to_numpy(dtype=int) - 1] = 1.0
+    incidence[rows, line_data['ToBus'].to_numpy(dtype=int) - 1] = -1.0
+    b_flow = susceptance[:, None] * incidence
+    return incidence.T @ b_flow, b_flow
+
+def dc_ptdf(bus_data: pd.DataFrame, line_data: pd.DataFrame, slack_bus_id) -> np.ndarray:
+    """
+    Power Transfer Distribution Factors ของ DC load flow (lines, buses) ลำดับบัสตาม BusID - 1 เหมือน Y-bus
+    การไหล MW ของแต่ละสาย (FromBus -> ToBus) = PTDF @ กำลังฉีดสุทธิ MW ของแต่ละบัส
+    slack รับส่วนต่างของกำลังฉีด (คอลัมน์ของ slack เป็น 0)
+    """
+    b_bus, b_flow = dc_susceptance(bus_data, line_data)
+    keep = np.arange(len(b_bus)) != int(slack_bus_id) - 1
+    ptdf = np.zeros(b_flow.shape)
+    ptdf[:, keep] = np.linalg.solve(b_bus[np.ix_(keep, keep)], b_flow[:, keep].T).T
+    return ptdf